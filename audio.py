@@ -0,0 +1,161 @@
+"""
+音声ファイルの長さ取得・区間分割（長時間音声の並列文字起こし用）
+
+PCMのWAVは標準ライブラリ（wave）で処理し、それ以外の形式は ffmpeg / ffprobe がある場合のみ扱う。
+wave で読めないWAV（浮動小数点・WAVE_FORMAT_EXTENSIBLE など）も、WAV以外の形式と同じく ffmpeg に任せる。
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+from contextlib import contextmanager
+
+
+# アップロードされた音声を一時ファイルへ書き出す時のチャンクサイズ（バイト）
+COPY_CHUNK_SIZE = 1024 * 1024
+# WAVを区間に分ける時に1回で読み書きするフレーム数
+_WAV_CHUNK_FRAMES = 64 * 1024
+
+
+@contextmanager
+def temporary_audio_file(fileobj, suffix=""):
+    """file-like の音声を固定サイズのチャンクで一時ファイルへ書き出し、そのパスを渡す
+    
+    全体を1つのbytesにまとめないため、追加で使うメモリはチャンク1つ分で済む。
+    ブロックを抜けると（例外の場合も）一時ファイルを削除する。
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            fileobj.seek(0)
+            shutil.copyfileobj(fileobj, f, COPY_CHUNK_SIZE)
+        fileobj.seek(0)
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def detached_copy(fileobj):
+    """file-like の音声を、名前の無い一時ファイルへチャンクごとに写して返す（先頭に戻した状態。閉じると削除される）
+    
+    Streamlit の UploadedFile はスクリプトのスレッド（st.audio など）も読み書きするため、
+    バックグラウンドのジョブには写したファイルを渡し、同じバッファを別のスレッドから動かさないようにする。
+    """
+    copy = tempfile.TemporaryFile()
+    fileobj.seek(0)
+    shutil.copyfileobj(fileobj, copy, COPY_CHUNK_SIZE)
+    fileobj.seek(0)
+    copy.seek(0)
+    return copy
+
+
+def is_wav(path):
+    """ファイル先頭のヘッダーでWAV（RIFF/WAVE）かどうかを判定する"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    return header[:4] == b'RIFF' and header[8:12] == b'WAVE'
+
+
+def is_pcm_wav(path):
+    """標準ライブラリの wave で読めるWAV（PCM）かどうか"""
+    if not is_wav(path):
+        return False
+    try:
+        with wave.open(path, 'rb'):
+            return True
+    except (wave.Error, EOFError):
+        return False
+
+
+def has_ffmpeg():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def probe_duration(path):
+    """音声の長さ（秒）を返す（取得できない場合は None）"""
+    if is_pcm_wav(path):
+        with wave.open(path, 'rb') as w:
+            return w.getnframes() / w.getframerate()
+    
+    if not has_ffmpeg():
+        return None
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, text=True
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def can_split(path):
+    """区間分割に対応しているか（PCMのWAV、または ffmpeg がある場合）"""
+    return is_pcm_wav(path) or has_ffmpeg()
+
+
+def plan_segments(duration, segment_seconds, overlap_seconds):
+    """音声を区間に分ける
+    
+    隣り合う区間は overlap_seconds だけ重ね、境界で話が途切れても片方に全体が入るようにする。
+    戻り値: [(start, end)]（秒）
+    """
+    step = max(segment_seconds - overlap_seconds, 1)
+    segments = []
+    start = 0.0
+    while True:
+        end = min(start + segment_seconds, duration)
+        segments.append((start, end))
+        if end >= duration:
+            return segments
+        start += step
+
+
+def _split_wav(path, segments, out_dir):
+    paths = []
+    with wave.open(path, 'rb') as src:
+        params = src.getparams()
+        rate = src.getframerate()
+        for i, (start, end) in enumerate(segments):
+            out_path = os.path.join(out_dir, f"segment_{i:03d}.wav")
+            src.setpos(int(start * rate))
+            with wave.open(out_path, 'wb') as dst:
+                dst.setparams(params)
+                # 区間全体を読み込まず、チャンクごとに書き写す（ヘッダーはcloseで確定する）
+                remaining = int((end - start) * rate)
+                while remaining > 0:
+                    frames = src.readframes(min(remaining, _WAV_CHUNK_FRAMES))
+                    if not frames:
+                        break
+                    dst.writeframesraw(frames)
+                    remaining -= len(frames) // (params.sampwidth * params.nchannels)
+            paths.append(out_path)
+    return paths
+
+
+def _split_ffmpeg(path, segments, out_dir):
+    suffix = os.path.splitext(path)[1] or ".mp3"
+    paths = []
+    for i, (start, end) in enumerate(segments):
+        out_path = os.path.join(out_dir, f"segment_{i:03d}{suffix}")
+        # 再エンコードせずにコピーする（区間の境界はフレーム単位に丸められる）
+        # bitexact: 同じ区間からは同じバイト列を作る（アップロード済みのファイルを再利用できるように）
+        subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+             "-i", path, "-c", "copy", "-fflags", "+bitexact", out_path],
+            check=True
+        )
+        paths.append(out_path)
+    return paths
+
+
+def split_audio(path, segments, out_dir):
+    """区間ごとの音声ファイルを out_dir に書き出し、パスのリストを返す"""
+    if is_pcm_wav(path):
+        return _split_wav(path, segments, out_dir)
+    return _split_ffmpeg(path, segments, out_dir)
@@ -0,0 +1,12 @@
+"""
+Storage Backends Package
+"""
+from backends.base import StorageBackend
+from backends.local import LocalStorageBackend
+from backends.sqlite import SQLiteBackend
+
+__all__ = [
+    'StorageBackend',
+    'LocalStorageBackend',
+    'SQLiteBackend'
+]
@@ -0,0 +1,96 @@
+"""
+ストレージバックエンドの共通インターフェース
+"""
+from abc import ABC, abstractmethod
+
+
+# 各コレクションで日付として扱うフィールド（インデックス・並び替え用）
+DATE_FIELDS = {
+    'history': 'datetime',
+    'scripts': 'createdAt',
+    'transcriptions': 'date',
+}
+
+
+class StorageBackend(ABC):
+    """履歴・台本・文字起こし・設定の永続化先
+    
+    各レコードは「メタデータ」（'id' を持つdict、一覧表示用）と「本文」（dict）に分けて保存する。
+    文字起こしなどの長いテキストは内容ハッシュをキーにした「ブロブ」として別に保存する。
+    差分の検出は storage.py 側で行い、バックエンドは渡された変更だけを書き込む。
+    
+    書き込み（write_records / save_settings）は書き込みIDを返す。ブラウザ側で非同期に書き込むバックエンドは、
+    後から confirm_writes で完了を確認する。同期的に書き込み、失敗を例外で知らせるバックエンドは None を返す。
+    """
+    
+    name = ""
+    
+    @abstractmethod
+    def load_all(self):
+        """全コレクションのメタデータと設定を読み込む
+        
+        戻り値: {'history': list|None, 'scripts': list|None, 'transcriptions': list|None,
+                 'settings': dict|None, 'legacy': set, 'archives': {collection: dict|None}}
+        まだ読み込めない場合（ブラウザの応答待ちなど）は None
+        'legacy' には旧形式（本文込みのレコード）を返したコレクション名が入る
+        'archives' はアーカイブ層の索引（先頭ページを含む。storage.py 参照）
+        """
+    
+    @abstractmethod
+    def load_bodies(self, collection, record_ids, version):
+        """指定レコードの本文を読み込む
+        
+        戻り値: {id: body}  まだ読み込めない場合は None
+        version は読み込み対象の内容を識別する文字列（同じ内容なら同じ値）
+        """
+    
+    @abstractmethod
+    def write_records(self, collection, changed, bodies, deleted_ids, metas, blobs=None, migrate=False,
+                      archive=None):
+        """変更されたメタデータ・本文・ブロブと削除IDを書き込み、並び順を更新する
+        
+        changed: 変更・追加されたメタデータ
+        bodies: {id: body} 書き込む本文（本文に変更の無いレコードは含まれない）
+        metas: 並び順どおりの全メタデータ
+        blobs: {hash: text} 新しく保存するブロブ（メタデータより先に書き込むこと）
+        migrate=True の場合は旧形式のデータを削除する
+        archive: ホット層からアーカイブ層へ移したレコードがある場合
+                 {'index': 索引, 'pages': {番号: メタデータのリスト}, 'ids': 移したID}
+                 （移したレコードの本文は削除しない。索引より先に書き込むこと）
+        戻り値: 書き込みID（完了を confirm_writes で確認する場合）または None（書き込み済み）
+        """
+    
+    def confirm_writes(self, write_ids, version):
+        """書き込みIDごとに、書き込みが完了したかを返す
+        
+        戻り値: {write_id: True（完了） / False（失敗・実行されなかった） / None（まだ実行中）}
+                まだ読み込めない場合は None
+        version は確認の回ごとに変わる文字列（同じ回なら同じ値）
+        """
+        return {write_id: True for write_id in write_ids}
+    
+    @abstractmethod
+    def load_archive_page(self, collection, page_no, version):
+        """アーカイブの封印済みページ（メタデータのリスト）を読み込む
+        
+        戻り値: list  まだ読み込めない場合は None
+        """
+    
+    @abstractmethod
+    def load_blobs(self, blob_hashes, version):
+        """内容ハッシュで参照されるテキストを読み込む
+        
+        戻り値: {hash: text}  まだ読み込めない場合は None
+        """
+    
+    @abstractmethod
+    def delete_blobs(self, blob_hashes):
+        """参照されなくなったブロブを削除する"""
+    
+    @abstractmethod
+    def clear(self, collection):
+        """コレクションのレコードをすべて削除する"""
+    
+    @abstractmethod
+    def save_settings(self, settings):
+        """設定を保存する（戻り値は write_records と同じ）"""
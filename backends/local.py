@@ -0,0 +1,491 @@
+"""
+ブラウザ LocalStorage バックエンド（streamlit_js_eval経由）
+注意: 読み込みのstreamlit_js_evalは固定キーを使用すること（動的キーは無限ループの原因）
+
+保存形式（値は codec.py で圧縮したJSON）:
+    {KEY}:index      … メタデータの配列（並び順どおり）
+    {KEY}:body:{id}  … レコードの本文
+    {BLOB_STORAGE_KEY}:{hash} … 内容ハッシュで参照するテキスト（JSON文字列）
+    {KEY}:archive    … アーカイブ層の索引（先頭ページと封印済みページの一覧）
+    {KEY}:archive:{n} … アーカイブの封印済みページ（メタデータの配列）
+旧形式:
+    {KEY}:manifest + {KEY}:rec:{id}  … ID配列 + 本文込みのレコード
+    {KEY}                            … 本文込みのレコード配列
+
+大きな値の分割書き込み:
+    LOCALSTORAGE_CHUNK_SIZE を超える値は {key}#{世代}:{番号} のセグメントに分けて1つずつ送り、
+    全セグメントが揃ったことを確認してから {key} に 'C' + マニフェスト（コミットマーカー）を書き込む。
+    コミット前に中断しても {key} は以前の値のままなので、途中まで書かれたデータは読まれない。
+    値はJSON化・圧縮しながらセグメントに分けるため、サーバー側で値全体の文字列は作らない（codec.PayloadEncoder）。
+
+書き込みの完了の確認:
+    1回の保存（_WriteBatch）ごとに {WRITE_ACK_STORAGE_KEY}:{書き込みID} に 'P'（実行中）を書き、
+    コミットできたら '1'、セグメントが揃わない・容量超過などで書き込めなかったら '0' にする。
+    storage.py は次の実行以降に confirm_writes で結果を読み、'1' を確認できなかった書き込みを送り直す。
+"""
+import streamlit as st
+import json
+import zlib
+import uuid
+from itertools import chain
+from datetime import datetime
+from streamlit_js_eval import streamlit_js_eval
+
+from backends.base import StorageBackend
+from codec import encode_payload, decode_payload, PayloadEncoder
+from config import (
+    STORAGE_KEY,
+    SCRIPT_STORAGE_KEY,
+    TRANSCRIPTION_STORAGE_KEY,
+    SETTINGS_STORAGE_KEY,
+    BLOB_STORAGE_KEY,
+    WRITE_ACK_STORAGE_KEY,
+    STORAGE_CODEC,
+    LOCALSTORAGE_CHUNK_SIZE
+)
+
+
+STORAGE_KEYS = {
+    'history': STORAGE_KEY,
+    'scripts': SCRIPT_STORAGE_KEY,
+    'transcriptions': TRANSCRIPTION_STORAGE_KEY,
+}
+
+
+def _index_key(storage_key):
+    return f"{storage_key}:index"
+
+
+def _body_key(storage_key, record_id):
+    return f"{storage_key}:body:{record_id}"
+
+
+def _archive_key(storage_key):
+    return f"{storage_key}:archive"
+
+
+def _archive_page_key(storage_key, page_no):
+    return f"{storage_key}:archive:{page_no}"
+
+
+def _blob_key(blob_hash):
+    return f"{BLOB_STORAGE_KEY}:{blob_hash}"
+
+
+def _ack_key(write_id):
+    return f"{WRITE_ACK_STORAGE_KEY}:{write_id}"
+
+
+def _js_literal(text):
+    """Python文字列をJSの文字列リテラルに変換する"""
+    literal = json.dumps(text, ensure_ascii=False)
+    # 圧縮データにはU+2028/2029が含まれうるため、古いJSエンジン向けにエスケープする
+    return literal.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+# 分割された値の読み書きに使うJSヘルパー（各JS式の先頭に付ける）
+#   'C' で始まる値はマニフェスト {g: 世代, n: セグメント数, l: 全体の長さ}
+#   （生JSONも codec.py の圧縮形式も 'C' では始まらない）
+_STORAGE_HELPERS_JS = (
+    "const segKey = (k, g, i) => k + '#' + g + ':' + i;"
+    " const readValue = (k) => {"
+    " const v = localStorage.getItem(k);"
+    " if (v === null || v[0] !== 'C') return v;"
+    " const m = JSON.parse(v.slice(1)); let out = '';"
+    " for (let i = 0; i < m.n; i++) {"
+    " const part = localStorage.getItem(segKey(k, m.g, i));"
+    " if (part === null) return null; out += part; }"
+    " return out.length === m.l ? out : null; };"
+    " const removeSegments = (k, keep) => Object.keys(localStorage)"
+    ".filter((x) => x.startsWith(k + '#') && (keep === undefined || !x.startsWith(k + '#' + keep + ':')))"
+    ".forEach((x) => localStorage.removeItem(x));"
+    " const setValue = (k, v) => { localStorage.setItem(k, v); removeSegments(k); };"
+    " const removeValue = (k) => { localStorage.removeItem(k); removeSegments(k); };"
+    " const segmentsReady = (k, m) => {"
+    " for (let i = 0; i < m.n; i++) { if (localStorage.getItem(segKey(k, m.g, i)) === null) return false; }"
+    " return true; };"
+    " const commitChunks = (k, m) => { localStorage.setItem(k, 'C' + JSON.stringify(m)); removeSegments(k, m.g); };"
+    " const dropGeneration = (k, g) => Object.keys(localStorage)"
+    ".filter((x) => x.startsWith(k + '#' + g + ':')).forEach((x) => localStorage.removeItem(x));"
+)
+
+# 分割書き込みのセグメントが揃うまで待つ最大回数（100ms間隔）
+_COMMIT_RETRIES = 300
+# 書き込みの結果を読む時に、まだ始まっていない書き込みを待つ時間（ミリ秒）
+_ACK_GRACE_MS = 1000
+
+
+def _next_js_key(key_prefix):
+    """書き込み用streamlit_js_evalの一意なキー"""
+    st.session_state.storage_write_seq = st.session_state.get('storage_write_seq', 0) + 1
+    return f"{key_prefix}_{st.session_state.storage_write_seq}_{datetime.now().strftime('%H%M%S')}"
+
+
+def _run_js(statements, key_prefix, chunked=None, write_id=None):
+    """複数のJS文を1回のstreamlit_js_evalで実行する
+    
+    chunked: [(key, manifest)] 分割送信した値。全セグメントが揃ってからコミットし、
+             その後に statements を実行する（揃うまで100ms間隔で再試行）
+    write_id: 指定した場合、結果を _ack_key(write_id) に書く（'P' → '1' / '0'。揃わなかったセグメントは削除する）
+    """
+    chunked = chunked or []
+    pending = json.dumps([[key, manifest] for key, manifest in chunked], ensure_ascii=False)
+    ack = _js_literal(_ack_key(write_id)) if write_id else "null"
+    streamlit_js_eval(
+        js_expressions=(
+            "(() => { " + _STORAGE_HELPERS_JS
+            + f" const pending = {pending}; const ack = {ack};"
+            + " const report = (v) => { if (ack !== null) { try { localStorage.setItem(ack, v); } catch (e) {} } };"
+            + " report('P');"
+            + " const apply = () => { try { pending.forEach(([k, m]) => commitChunks(k, m)); "
+            + "; ".join(statements)
+            + "; report('1'); } catch (e) { report('0'); } };"
+            + " const attempt = (t) => {"
+            " if (pending.every(([k, m]) => segmentsReady(k, m))) apply();"
+            " else if (t > 0) setTimeout(() => attempt(t - 1), 100);"
+            " else { pending.forEach(([k, m]) => dropGeneration(k, m.g)); report('0'); } };"
+            + f" attempt({_COMMIT_RETRIES}); return true; }})()"
+        ),
+        key=_next_js_key(key_prefix)
+    )
+
+
+class _WriteBatch:
+    """1回の保存で行う書き込みをまとめる
+    
+    小さな値は1つのJS式にまとめ、大きな値はセグメントごとに別のJS式で送る。
+    サーバー側で一度に組み立てる文字列はセグメント1つ分に収まる。
+    write_id: この保存の書き込みID（run() の後に confirm_writes で完了を確認する）
+    """
+    
+    def __init__(self, key_prefix):
+        self.key_prefix = key_prefix
+        self.statements = []
+        self.chunked = []
+        self.write_id = uuid.uuid4().hex[:12]
+    
+    def set(self, key, value):
+        # JSONを少しずつ作り、LOCALSTORAGE_CHUNK_SIZE 字以内に収まる値だけを1回で圧縮する
+        pieces = json.JSONEncoder(ensure_ascii=False).iterencode(value)
+        head = ""
+        for piece in pieces:
+            head += piece
+            if len(head) > LOCALSTORAGE_CHUNK_SIZE:
+                break
+        else:
+            self._set_inline(key, encode_payload(head, STORAGE_CODEC))
+            return
+        self._set_chunked(key, chain([head], pieces))
+    
+    def _set_inline(self, key, encoded):
+        self.statements.append(f"setValue({_js_literal(key)}, {_js_literal(encoded)})")
+    
+    def _send_segment(self, key, generation, index, segment):
+        segment_key = f"{key}#{generation}:{index}"
+        streamlit_js_eval(
+            js_expressions=f"localStorage.setItem({_js_literal(segment_key)}, {_js_literal(segment)}); true",
+            key=_next_js_key(f"{self.key_prefix}_chunk")
+        )
+    
+    def _set_chunked(self, key, pieces):
+        """JSONの断片を圧縮しながら、LOCALSTORAGE_CHUNK_SIZE 字ずつのセグメントとして送る
+        
+        先頭のセグメントは、圧縮の最後に確定する header を付けてから最後に送る。
+        圧縮後の全体が1セグメントに収まった場合は、分割せずに書き込む。
+        """
+        encoder = PayloadEncoder(STORAGE_CODEC)
+        generation = uuid.uuid4().hex[:8]
+        first = None
+        buffer = ""
+        count = 1
+        length = 0
+        for piece in pieces:
+            buffer += encoder.feed(piece)
+            while len(buffer) >= LOCALSTORAGE_CHUNK_SIZE:
+                segment, buffer = buffer[:LOCALSTORAGE_CHUNK_SIZE], buffer[LOCALSTORAGE_CHUNK_SIZE:]
+                length += len(segment)
+                if first is None:
+                    first = segment
+                else:
+                    self._send_segment(key, generation, count, segment)
+                    count += 1
+        buffer += encoder.finish()
+        
+        if first is None:
+            self._set_inline(key, encoder.header + buffer)
+            return
+        if buffer:
+            self._send_segment(key, generation, count, buffer)
+            length += len(buffer)
+            count += 1
+        self._send_segment(key, generation, 0, encoder.header + first)
+        length += len(encoder.header)
+        self.chunked.append((key, {'g': generation, 'n': count, 'l': length}))
+    
+    def remove(self, key):
+        self.statements.append(f"removeValue({_js_literal(key)})")
+    
+    def raw(self, statement):
+        self.statements.append(statement)
+    
+    def run(self):
+        """書き込みを実行し、書き込みIDを返す"""
+        _run_js(self.statements, self.key_prefix, self.chunked, self.write_id)
+        return self.write_id
+
+
+# メタデータの索引を1回のJS評価でまとめて取得する
+# 索引が無い場合は旧形式（本文込みのレコード）を返す
+_READ_COLLECTION_JS = (
+    "const readCollection = (key) => {"
+    " const index = readValue(key + ':index');"
+    " if (index !== null) return {index: index, archive: readValue(key + ':archive')};"
+    " const manifest = readValue(key + ':manifest');"
+    " if (manifest === null) return {legacy: readValue(key)};"
+    " const ids = JSON.parse(manifest);"
+    " return {records: ids.map((id) => readValue(key + ':rec:' + id))};"
+    " };"
+)
+
+BATCH_LOAD_JS = (
+    "(() => { "
+    + _STORAGE_HELPERS_JS
+    + " " + _READ_COLLECTION_JS
+    + " return JSON.stringify({"
+    f"history: readCollection('{STORAGE_KEY}'), "
+    f"settings: readValue('{SETTINGS_STORAGE_KEY}'), "
+    f"scripts: readCollection('{SCRIPT_STORAGE_KEY}'), "
+    f"transcriptions: readCollection('{TRANSCRIPTION_STORAGE_KEY}')"
+    "}); })()"
+)
+
+
+def _parse_stored(stored_data, expected_type):
+    """LocalStorageの生文字列をパースする（空・不正な場合はNone）"""
+    if not stored_data or stored_data == "null":
+        return None
+    try:
+        loaded = json.loads(decode_payload(stored_data))
+    except (json.JSONDecodeError, TypeError, ValueError, zlib.error):
+        return None
+    return loaded if isinstance(loaded, expected_type) else None
+
+
+def _parse_collection(stored):
+    """readCollectionの結果をレコードのリストに変換する
+    
+    戻り値: (records, is_legacy)  データが無い場合は (None, False)
+    """
+    if not isinstance(stored, dict):
+        return None, False
+    
+    if 'index' in stored:
+        index = _parse_stored(stored.get('index'), list)
+        if index is None:
+            return None, False
+        return [m for m in index if isinstance(m, dict)], False
+    
+    if 'records' in stored:
+        records = []
+        for raw in stored.get('records') or []:
+            record = _parse_stored(raw, dict)
+            if record is not None:
+                records.append(record)
+        return records, True
+    
+    legacy = _parse_stored(stored.get('legacy'), list)
+    if legacy is None:
+        return None, False
+    return [r for r in legacy if isinstance(r, dict)], True
+
+
+def _read_keys_js(keys_literal):
+    """JSON配列で渡したキーをまとめて読み込み、{key: value} のJSONを返すJS式"""
+    return (
+        "(() => { " + _STORAGE_HELPERS_JS
+        + f" return JSON.stringify(Object.fromEntries(JSON.parse({keys_literal}).map("
+        "(k) => [k, readValue(k)]))); })()"
+    )
+
+
+def _confirm_writes_js(keys_literal):
+    """書き込みの結果（_ack_key の値）を読むJS式
+    
+    実行中（'P'）の書き込みは終わるまで、まだ始まっていない書き込み（値が無い）は少しの間だけ待つ。
+    結果（'1' / '0'）を読んだキーは削除する。
+    """
+    return (
+        f"new Promise((resolve) => {{ const keys = JSON.parse({keys_literal}); const started = Date.now();"
+        " const check = () => {"
+        " const values = Object.fromEntries(keys.map((k) => [k, localStorage.getItem(k)]));"
+        " const waiting = Object.values(values).filter((v) => v !== '1' && v !== '0');"
+        " const elapsed = Date.now() - started;"
+        f" if (waiting.length && elapsed < {_COMMIT_RETRIES * 100 + 2000}"
+        f" && (waiting.includes('P') || elapsed < {_ACK_GRACE_MS})) {{ setTimeout(check, 100); return; }}"
+        " keys.filter((k) => values[k] === '1' || values[k] === '0').forEach((k) => localStorage.removeItem(k));"
+        " resolve(JSON.stringify(values)); };"
+        " check(); })"
+    )
+
+
+def _remove_prefixed_js(prefix):
+    """指定プレフィックスのキーをすべて削除するJS文"""
+    return (
+        f"Object.keys(localStorage).filter((k) => k.startsWith({_js_literal(prefix)}))"
+        ".forEach((k) => localStorage.removeItem(k))"
+    )
+
+
+class LocalStorageBackend(StorageBackend):
+    """ブラウザのLocalStorageに保存するバックエンド（端末ごとに独立）"""
+    
+    name = "local"
+    
+    def load_all(self):
+        # 全キーをまとめて取得する（固定キーを使用）
+        stored_data = streamlit_js_eval(
+            js_expressions=BATCH_LOAD_JS,
+            key="load_all_fixed"
+        )
+        
+        # None = JSがまだ実行されていない → 次のリロードを待つ
+        if stored_data is None:
+            return None
+        
+        try:
+            batch = json.loads(stored_data)
+        except (json.JSONDecodeError, TypeError):
+            batch = {}
+        if not isinstance(batch, dict):
+            batch = {}
+        
+        result = {'legacy': set(), 'archives': {}}
+        for name in STORAGE_KEYS:
+            stored = batch.get(name)
+            records, is_legacy = _parse_collection(stored)
+            result[name] = records
+            if is_legacy:
+                result['legacy'].add(name)
+            if isinstance(stored, dict):
+                result['archives'][name] = _parse_stored(stored.get('archive'), dict)
+        result['settings'] = _parse_stored(batch.get('settings'), dict)
+        return result
+    
+    def _read_keys(self, keys, key):
+        """複数キーをまとめて読み込む（応答待ちの場合は None）"""
+        stored_data = streamlit_js_eval(
+            js_expressions=_read_keys_js(_js_literal(json.dumps(list(keys)))),
+            key=key
+        )
+        if stored_data is None:
+            return None
+        try:
+            values = json.loads(stored_data)
+        except (json.JSONDecodeError, TypeError):
+            values = {}
+        return values if isinstance(values, dict) else {}
+    
+    def load_bodies(self, collection, record_ids, version):
+        storage_key = STORAGE_KEYS[collection]
+        keys = {_body_key(storage_key, record_id): record_id for record_id in record_ids}
+        # 内容が同じなら同じキーになるため、再実行で無限ループにならない
+        values = self._read_keys(keys, f"load_bodies_{collection}_{version}")
+        if values is None:
+            return None
+        
+        bodies = {}
+        for body_key, raw in values.items():
+            body = _parse_stored(raw, dict)
+            if body is not None and body_key in keys:
+                bodies[keys[body_key]] = body
+        return bodies
+    
+    def load_blobs(self, blob_hashes, version):
+        keys = {_blob_key(blob_hash): blob_hash for blob_hash in blob_hashes}
+        values = self._read_keys(keys, f"load_blobs_{version}")
+        if values is None:
+            return None
+        
+        blobs = {}
+        for blob_key, raw in values.items():
+            text = _parse_stored(raw, str)
+            if text is not None and blob_key in keys:
+                blobs[keys[blob_key]] = text
+        return blobs
+    
+    def load_archive_page(self, collection, page_no, version):
+        page_key = _archive_page_key(STORAGE_KEYS[collection], page_no)
+        values = self._read_keys([page_key], f"load_archive_{collection}_{page_no}_{version}")
+        if values is None:
+            return None
+        page = _parse_stored(values.get(page_key), list) or []
+        return [m for m in page if isinstance(m, dict)]
+    
+    def confirm_writes(self, write_ids, version):
+        keys = {_ack_key(write_id): write_id for write_id in write_ids}
+        # 確認のたびに version を変える（同じ version の間は同じキーなので、再実行で無限ループにならない）
+        stored_data = streamlit_js_eval(
+            js_expressions=_confirm_writes_js(_js_literal(json.dumps(list(keys)))),
+            key=f"confirm_writes_{version}"
+        )
+        if stored_data is None:
+            return None
+        try:
+            values = json.loads(stored_data)
+        except (json.JSONDecodeError, TypeError):
+            values = {}
+        if not isinstance(values, dict):
+            values = {}
+        
+        results = {}
+        for ack_key, write_id in keys.items():
+            value = values.get(ack_key)
+            # 'P' = まだ実行中。値が無い = 書き込みのJSが実行されなかった（直後の再実行で破棄されたなど）
+            results[write_id] = None if value == 'P' else value == '1'
+        return results
+    
+    def delete_blobs(self, blob_hashes):
+        batch = _WriteBatch("delete_blobs")
+        for blob_hash in blob_hashes:
+            batch.remove(_blob_key(blob_hash))
+        batch.run()
+    
+    def write_records(self, collection, changed, bodies, deleted_ids, metas, blobs=None, migrate=False,
+                      archive=None):
+        # 索引は1キーに丸ごと保存するため、changedではなく全メタデータを書き込む
+        storage_key = STORAGE_KEYS[collection]
+        batch = _WriteBatch(f"save_{collection}")
+        
+        if migrate:
+            batch.raw(_remove_prefixed_js(storage_key + ":rec:"))
+            batch.remove(storage_key + ":manifest")
+            batch.remove(storage_key)
+        
+        # ブロブ → 本文 → アーカイブ → 索引 → 削除 の順に書き込み、索引が欠損データを指さないようにする
+        # （分割送信した値は、全セグメントが揃ってから同じJS式の中でまとめてコミットされる）
+        for blob_hash, text in (blobs or {}).items():
+            batch.set(_blob_key(blob_hash), text)
+        for record_id, body in bodies.items():
+            if body:
+                batch.set(_body_key(storage_key, record_id), body)
+        if archive:
+            for page_no, page in archive['pages'].items():
+                batch.set(_archive_page_key(storage_key, page_no), page)
+            batch.set(_archive_key(storage_key), archive['index'])
+        batch.set(_index_key(storage_key), list(metas))
+        for record_id in deleted_ids:
+            batch.remove(_body_key(storage_key, record_id))
+        
+        return batch.run()
+    
+    def clear(self, collection):
+        storage_key = STORAGE_KEYS[collection]
+        _run_js([
+            _remove_prefixed_js(storage_key + ":"),
+            f"localStorage.removeItem({_js_literal(storage_key)})"
+        ], f"clear_{collection}")
+    
+    def save_settings(self, settings):
+        batch = _WriteBatch("save_settings")
+        batch.set(SETTINGS_STORAGE_KEY, settings)
+        return batch.run()
@@ -0,0 +1,309 @@
+"""
+サーバー側 SQLite バックエンド
+
+レコードは1件1行で保存し、コレクション・日付・並び順にインデックスを張る。
+payload列にメタデータ、body列に本文を持ち、一覧の読み込みでは本文を読まない。
+（body列がNULLの行は旧形式で、payloadに本文込みのレコードが入っている）
+アーカイブ層へ移したレコードは archived=1 にして行（本文）を残し、索引とページは archives テーブルに持つ。
+文字起こしなどの長いテキストは blobs テーブルに内容ハッシュをキーにして1回だけ保存する。
+WALモードのため、読み込みは書き込み中のセッションをブロックしない。
+レコード・アーカイブ・設定の行は名前空間（with_namespace。storage.get_backend ではURLの ?workspace=…。
+指定が無ければ DEFAULT_NAMESPACE）ごとに分ける。ブロブは内容ハッシュがキーのため共有する。
+名前空間の列が無い旧形式のデータベースは、既存の行を DEFAULT_NAMESPACE に移す（これまでどおり開ける）。
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from backends.base import StorageBackend, DATE_FIELDS
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    namespace   TEXT NOT NULL,
+    collection  TEXT NOT NULL,
+    id          TEXT NOT NULL,
+    position    INTEGER NOT NULL,
+    record_date TEXT,
+    payload     TEXT NOT NULL,
+    body        TEXT,
+    archived    INTEGER NOT NULL DEFAULT 0,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (namespace, collection, id)
+);
+CREATE INDEX IF NOT EXISTS idx_records_namespace_date ON records (namespace, collection, record_date);
+CREATE INDEX IF NOT EXISTS idx_records_namespace_position ON records (namespace, collection, position);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash    TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archives (
+    namespace  TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    page       TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    PRIMARY KEY (namespace, collection, page)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    namespace TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    payload   TEXT NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+# 名前空間の列が無い旧形式のテーブルから、既存の行を移す（列は旧形式のまま）
+_LEGACY_COPIES = {
+    'records': "INSERT INTO records (namespace, collection, id, position, record_date, payload, body, archived, "
+               "updated_at) SELECT ?, collection, id, position, record_date, payload, body, archived, updated_at "
+               "FROM records_legacy",
+    'archives': "INSERT INTO archives (namespace, collection, page, payload) "
+                "SELECT ?, collection, page, payload FROM archives_legacy",
+    'settings': "INSERT INTO settings (namespace, key, payload) SELECT ?, key, payload FROM settings_legacy",
+}
+_LEGACY_INDEXES = ("idx_records_collection_date", "idx_records_collection_position")
+
+# ?workspace= を指定しない場合の名前空間（名前空間の列を追加する前に保存されていた行もここに移す）
+DEFAULT_NAMESPACE = "default"
+
+_SETTINGS_KEY = "user_settings"
+
+# archives テーブルで索引を保存する行（ページは番号の文字列）
+_ARCHIVE_INDEX_PAGE = "index"
+
+
+class SQLiteBackend(StorageBackend):
+    """SQLiteファイルに保存するバックエンド（接続はプロセス内で共有し、行は名前空間ごとに分ける）"""
+    
+    name = "sqlite"
+    
+    def __init__(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Streamlitはセッションごとに別スレッドで実行されるため、1接続をロックで共有する
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._namespace = DEFAULT_NAMESPACE
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate()
+    
+    def with_namespace(self, namespace):
+        """同じ接続を使い、namespace の行だけを読み書きするバックエンドを返す"""
+        scoped = copy.copy(self)
+        scoped._namespace = namespace
+        return scoped
+    
+    def _create_tables(self):
+        # executescript は実行中のトランザクションをコミットするため、1文ずつ実行する
+        for statement in _SCHEMA.split(";"):
+            if statement.strip():
+                self._conn.execute(statement)
+    
+    def _migrate(self):
+        """旧形式のテーブルに列を足し、名前空間の無いテーブルは作り直して既存の行を DEFAULT_NAMESPACE に移す"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(records)")]
+        if not columns or 'namespace' in columns:
+            self._create_tables()
+            return
+        if 'body' not in columns:
+            self._conn.execute("ALTER TABLE records ADD COLUMN body TEXT")
+        if 'archived' not in columns:
+            self._conn.execute("ALTER TABLE records ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+        
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for index in _LEGACY_INDEXES:
+                self._conn.execute(f"DROP INDEX IF EXISTS {index}")
+            legacy = [table for table in _LEGACY_COPIES if table in tables]
+            for table in legacy:
+                self._conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+            self._create_tables()
+            for table in legacy:
+                self._conn.execute(_LEGACY_COPIES[table], (DEFAULT_NAMESPACE,))
+                self._conn.execute(f"DROP TABLE {table}_legacy")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+    
+    def _load_collection(self, collection):
+        rows = self._conn.execute(
+            "SELECT payload, body IS NULL FROM records "
+            "WHERE namespace = ? AND collection = ? AND archived = 0 ORDER BY position",
+            (self._namespace, collection)
+        ).fetchall()
+        records = []
+        is_legacy = False
+        for payload, legacy_row in rows:
+            try:
+                records.append(json.loads(payload))
+            except json.JSONDecodeError:
+                continue
+            is_legacy = is_legacy or bool(legacy_row)
+        return records, is_legacy
+    
+    def _load_archive(self, collection, page):
+        row = self._conn.execute(
+            "SELECT payload FROM archives WHERE namespace = ? AND collection = ? AND page = ?",
+            (self._namespace, collection, page)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def load_all(self):
+        result = {'legacy': set(), 'archives': {}}
+        with self._lock:
+            for name in DATE_FIELDS:
+                records, is_legacy = self._load_collection(name)
+                result[name] = records
+                if is_legacy:
+                    result['legacy'].add(name)
+                result['archives'][name] = self._load_archive(name, _ARCHIVE_INDEX_PAGE)
+            row = self._conn.execute(
+                "SELECT payload FROM settings WHERE namespace = ? AND key = ?", (self._namespace, _SETTINGS_KEY)
+            ).fetchone()
+        result['settings'] = json.loads(row[0]) if row else None
+        return result
+    
+    def load_bodies(self, collection, record_ids, version):
+        record_ids = list(record_ids)
+        if not record_ids:
+            return {}
+        placeholders = ",".join("?" * len(record_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, body FROM records WHERE namespace = ? AND collection = ? AND id IN ({placeholders})",
+                [self._namespace, collection, *record_ids]
+            ).fetchall()
+        bodies = {}
+        for record_id, body in rows:
+            if body is None:
+                continue
+            try:
+                bodies[record_id] = json.loads(body)
+            except json.JSONDecodeError:
+                continue
+        return bodies
+    
+    def load_blobs(self, blob_hashes, version):
+        blob_hashes = list(blob_hashes)
+        if not blob_hashes:
+            return {}
+        placeholders = ",".join("?" * len(blob_hashes))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT hash, content FROM blobs WHERE hash IN ({placeholders})",
+                blob_hashes
+            ).fetchall()
+        return dict(rows)
+    
+    def load_archive_page(self, collection, page_no, version):
+        with self._lock:
+            return self._load_archive(collection, str(page_no)) or []
+    
+    def delete_blobs(self, blob_hashes):
+        # 他のセッション（別の名前空間を含む）が同じブロブを参照するレコードを追加している場合は残す
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM blobs WHERE hash = ? "
+                "AND NOT EXISTS (SELECT 1 FROM records WHERE instr(records.payload, blobs.hash) > 0)",
+                [(blob_hash,) for blob_hash in blob_hashes]
+            )
+    
+    def write_records(self, collection, changed, bodies, deleted_ids, metas, blobs=None, migrate=False,
+                      archive=None):
+        positions = {m['id']: i for i, m in enumerate(metas)}
+        date_field = DATE_FIELDS[collection]
+        now = time.time()
+        namespace = self._namespace
+        
+        with self._lock:
+            # 他のプロセスの書き込みと並び順が混ざらないよう、最初から書き込みロックを取る
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)",
+                    list((blobs or {}).items())
+                )
+                # 本文が渡されなかったレコードは既存の本文を残す
+                self._conn.executemany(
+                    "INSERT INTO records (namespace, collection, id, position, record_date, payload, body, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (namespace, collection, id) DO UPDATE SET "
+                    "position = excluded.position, record_date = excluded.record_date, "
+                    "payload = excluded.payload, body = COALESCE(excluded.body, records.body), "
+                    "updated_at = excluded.updated_at",
+                    [
+                        (namespace, collection, m['id'], positions.get(m['id'], 0), m.get(date_field),
+                         json.dumps(m, ensure_ascii=False),
+                         json.dumps(bodies[m['id']], ensure_ascii=False) if m['id'] in bodies else None,
+                         now)
+                        for m in changed
+                    ]
+                )
+                self._conn.executemany(
+                    "DELETE FROM records WHERE namespace = ? AND collection = ? AND id = ?",
+                    [(namespace, collection, record_id) for record_id in deleted_ids]
+                )
+                if archive:
+                    pages = {str(no): page for no, page in archive['pages'].items()}
+                    pages[_ARCHIVE_INDEX_PAGE] = archive['index']
+                    self._conn.executemany(
+                        "INSERT INTO archives (namespace, collection, page, payload) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (namespace, collection, page) DO UPDATE SET payload = excluded.payload",
+                        [(namespace, collection, page, json.dumps(payload, ensure_ascii=False))
+                         for page, payload in pages.items()]
+                    )
+                    self._conn.executemany(
+                        "UPDATE records SET archived = 1 WHERE namespace = ? AND collection = ? AND id = ?",
+                        [(namespace, collection, record_id) for record_id in archive['ids']]
+                    )
+                self._assign_positions(collection, [m['id'] for m in metas])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _assign_positions(self, collection, ordered_ids):
+        """並び順を 0 から振り直す（write_records のトランザクション内で呼ぶ）
+        
+        ordered_ids（このセッションの並び順）を先頭にし、同じ名前空間の別のセッションが追加した行は
+        既存の並び順のまま後ろに続ける。
+        """
+        rows = self._conn.execute(
+            "SELECT id, position FROM records WHERE namespace = ? AND collection = ? AND archived = 0 "
+            "ORDER BY position",
+            (self._namespace, collection)
+        ).fetchall()
+        current = dict(rows)
+        known = set(ordered_ids)
+        order = [record_id for record_id in ordered_ids if record_id in current]
+        order += [record_id for record_id, _ in rows if record_id not in known]
+        self._conn.executemany(
+            "UPDATE records SET position = ? WHERE namespace = ? AND collection = ? AND id = ?",
+            [(i, self._namespace, collection, record_id)
+             for i, record_id in enumerate(order) if current[record_id] != i]
+        )
+    
+    def clear(self, collection):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM records WHERE namespace = ? AND collection = ?", (self._namespace, collection)
+            )
+            self._conn.execute(
+                "DELETE FROM archives WHERE namespace = ? AND collection = ?", (self._namespace, collection)
+            )
+    
+    def save_settings(self, settings):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO settings (namespace, key, payload) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET payload = excluded.payload",
+                (self._namespace, _SETTINGS_KEY, json.dumps(settings, ensure_ascii=False))
+            )
@@ -0,0 +1,54 @@
+"""
+LocalStorage コーデックのベンチマーク
+
+実行: python benchmarks/bench_codec.py
+保存サイズ（LocalStorageの容量単位であるUTF-16コード単位数）と、
+送信サイズ（UTF-8バイト数）、エンコード/デコード時間を比較する。
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from codec import encode_payload, decode_payload, CODEC_BASE64, CODEC_UTF16
+from corpus import make_history_item, make_transcription_item, make_transcript, record_json
+
+
+CODECS = [("raw", None), ("zlib+base64", CODEC_BASE64), ("zlib+utf16", CODEC_UTF16)]
+
+
+def utf16_units(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def bench(label, payload, repeat=20):
+    print(f"\n## {label}  (raw: {len(payload):,} chars / {utf16_units(payload):,} UTF-16 units)")
+    print(f"{'codec':<14}{'UTF-16 units':>14}{'ratio':>8}{'UTF-8 bytes':>14}{'encode ms':>11}{'decode ms':>11}")
+    base_units = utf16_units(payload)
+    for name, codec in CODECS:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            encoded = encode_payload(payload, codec)
+        encode_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decoded = decode_payload(encoded)
+        decode_ms = (time.perf_counter() - start) * 1000 / repeat
+        assert decoded == payload
+
+        units = utf16_units(encoded)
+        print(f"{name:<14}{units:>14,}{units / base_units:>8.2f}{len(encoded.encode('utf-8')):>14,}"
+              f"{encode_ms:>11.2f}{decode_ms:>11.2f}")
+
+
+def main():
+    bench("transcript record 5,000字", record_json(make_transcription_item(5_000, seed=1)))
+    bench("history record 20,000字（1時間程度）", record_json(make_history_item(20_000, seed=2)))
+    bench("transcript 100,000字（長時間配信）", make_transcript(100_000, seed=3))
+    bench("settings (small)", '{"broadcaster_name": "よーちゃん", "episodes": []}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+概要欄生成のモード（DESCRIPTION_MODE）の比較ベンチマーク
+
+実行: python benchmarks/bench_pipeline.py [音声の分数 ...]
+    serial      … 文字起こし → 全文を送って概要欄・タイトル案（2回の呼び出し）
+    pipelined   … 文字起こしと並行して部分ごとに整形・タイトル案を生成
+    single_call … 音声から文字起こし・概要欄・タイトル案を1回で生成（SINGLE_CALL_MAX_SECONDS を超える音声は pipelined）
+    summary     … 文字起こし → 全文を送って要約・話題・タイトル案だけを生成（文字起こしは Python で整形して差し込む）
+                  MAP_REDUCE_THRESHOLD_TOKENS を超える文字起こしは map-reduce（区間ごとの要約 → まとめ）で生成し、
+                  区間の要約のキャッシュが効いた2回目（summary*）も測る
+Gemini は呼び出さず、スタブのモデルで応答時間を模擬する（pipeline.process_audio をそのまま使う）。
+    - 応答時間は「固定の待ち + 出力文字数に比例する時間」（ストリーミングでは少しずつ届く）
+    - 文字起こしは疑似音声（WAV）の各サンプルに書き込んだ秒数から、正解の該当部分を返す
+    - 整形は受け取った部分をそのまま返し、概要欄の本文・タイトル案はJSON（structured.py のスキーマ）で返す
+    - 要約は SUMMARY_CHARS 字、区間の要約は SECTION_SUMMARY_CHARS 字の固定の文で返す
+    - トークン数はテキスト1文字 = 1トークン、音声1秒 = AUDIO_TOKENS_PER_SECOND として数える
+割り当ての消費は、無料枠（FREE_RPM・FREE_TPM）で1分あたりに処理できるファイル数で比べる。
+LONG_AUDIO_THRESHOLD_SECONDS 未満の音声はストリーミングで1回、以上は区間ごとに並列で文字起こしする。
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# スタブのモデルなので流量制御で待たない。疑似音声は前処理（16kHz化）しない
+os.environ.setdefault("GEMINI_RPM", "100000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+os.environ["AUDIO_PREPROCESS"] = "0"
+
+from pipeline import process_audio
+from gemini import AUDIO_TOKENS_PER_SECOND
+from corpus import make_transcript
+
+
+SAMPLE_RATE = 1000              # 疑似音声なので低いサンプルレートで十分
+CHARS_PER_SECOND = 6            # 日本語の話速（文字/秒）の目安
+LATENCY_BASE = 0.3              # 1回の呼び出しの固定の待ち（秒）
+OUTPUT_CHARS_PER_SECOND = 4000  # 出力の速さ（実際より速めにして実行時間を抑える）
+STREAM_CHUNK_CHARS = 400
+FREE_RPM = 15
+FREE_TPM = 1_000_000
+SUMMARY_CHARS = 300
+SECTION_SUMMARY_CHARS = 600
+MODES = ["serial", "pipelined", "single_call", "summary"]
+
+_TITLES = ["副業を始めて一年", "続けることの大切さ", "失敗もつながる"]
+
+
+def make_wav(path, seconds):
+    """各サンプルの値 = 先頭からの秒数 の疑似音声を書き出す"""
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        for second in range(int(seconds)):
+            w.writeframes(second.to_bytes(2, 'little', signed=True) * SAMPLE_RATE)
+
+
+class StubModel:
+    """文字起こし・整形・タイトル案・まとめての生成を、出力の長さに応じた時間をかけて返すスタブ"""
+    
+    def __init__(self, transcript):
+        self.transcript = transcript
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+    
+    def _transcribe(self, path):
+        """音声の位置に対応する正解テキストと、音声の秒数"""
+        with wave.open(path, 'rb') as w:
+            seconds = w.getnframes() / SAMPLE_RATE
+            start = int.from_bytes(w.readframes(1), 'little', signed=True)
+        rng = random.Random(start)
+        begin = int(start * CHARS_PER_SECOND) + (rng.randint(0, 5) if start else 0)
+        return self.transcript[begin:int((start + seconds) * CHARS_PER_SECOND)], seconds
+    
+    @staticmethod
+    def _describe(prompt):
+        if "番目の区間）】" in prompt:
+            return "・" + "区" * SECTION_SUMMARY_CHARS
+        if "文字起こしそのものは出力しない" in prompt or "区間に分け、先頭から順に要約したもの" in prompt:
+            return json.dumps(
+                {'summary': "要" * SUMMARY_CHARS, 'topics': ["話題1", "話題2", "話題3"], 'titles': _TITLES},
+                ensure_ascii=False
+            )
+        if "「タイトル案3つ」を作成" in prompt:
+            return json.dumps({'titles': _TITLES}, ensure_ascii=False)
+        if "formatted_transcript" in prompt:
+            transcript = prompt.split("【文字起こし】\n")[1].split("\n\n=====")[0]
+            return json.dumps({'formatted_transcript': transcript, 'titles': _TITLES}, ensure_ascii=False)
+        return prompt.split("の部分）】\n", 1)[1]
+    
+    def generate_content(self, contents, stream=False, generation_config=None):
+        self.calls += 1
+        if isinstance(contents, str):
+            text = self._describe(contents)
+            self.input_tokens += len(contents)
+        else:
+            path, prompt = contents
+            text, seconds = self._transcribe(path)
+            if "formatted_transcript" in prompt:
+                text = json.dumps(
+                    {'transcript': text, 'formatted_transcript': text, 'titles': _TITLES}, ensure_ascii=False
+                )
+            self.input_tokens += len(prompt) + int(seconds * AUDIO_TOKENS_PER_SECOND)
+        self.output_tokens += len(text)
+        return _Response(text, stream)
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    def __init__(self, text, stream):
+        self.text = text
+        self._stream = stream
+        if not stream:
+            time.sleep(LATENCY_BASE + len(text) / OUTPUT_CHARS_PER_SECOND)
+    
+    def __iter__(self):
+        time.sleep(LATENCY_BASE)
+        for i in range(0, len(self.text), STREAM_CHUNK_CHARS):
+            piece = self.text[i:i + STREAM_CHUNK_CHARS]
+            time.sleep(len(piece) / OUTPUT_CHARS_PER_SECOND)
+            yield _Chunk(piece)
+
+
+class _NoCache:
+    def get(self, key):
+        return None
+    
+    def put(self, key, value):
+        pass
+
+
+class _MemoryCache(dict):
+    """区間の要約のキャッシュ（同じ音声の2回目の summary で使う）"""
+    
+    def put(self, key, value):
+        self[key] = value
+
+
+def stub_upload(path, mime_type=None):
+    return path
+
+
+def run(mode, path, expected, section_cache=None, name=None):
+    model = StubModel(expected)
+    with open(path, 'rb') as f:
+        started = time.perf_counter()
+        result = process_audio(
+            model, stub_upload, f, "episode.wav", "audio/wav", _NoCache(), mode=mode, section_cache=section_cache
+        )
+        elapsed = time.perf_counter() - started
+    timings = result['timings']
+    transcribed = next(end for name, _, end in timings if name in ("transcription", "single call"))
+    stages = sum(end - start for _, start, end in timings)
+    tokens = model.input_tokens + model.output_tokens
+    files_per_minute = min(FREE_RPM / model.calls, FREE_TPM / tokens)
+    body = result['description'].split("【AI要約】\n", 1)[1]
+    if mode == "summary":
+        body = body.split("【文字起こし】\n", 1)[1]
+    coverage = len(body.replace("\n", "")) / len(expected.replace("\n", ""))
+    print(f"{name or mode:<13}{elapsed:>7.2f}s{transcribed:>12.2f}s{elapsed - transcribed:>8.2f}s"
+          f"{max(stages - elapsed, 0):>9.2f}s{model.calls:>7}{model.input_tokens:>10,}{model.output_tokens:>10,}"
+          f"{files_per_minute:>11.1f}{coverage:>10.1%}")
+    return timings
+
+
+def main():
+    minutes_list = [float(m) for m in sys.argv[1:]] or [10, 60]
+    for minutes in minutes_list:
+        seconds = int(minutes * 60)
+        expected = make_transcript(seconds * CHARS_PER_SECOND + 100, seed=7)[:seconds * CHARS_PER_SECOND]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "episode.wav")
+            make_wav(path, seconds)
+            print(f"\n## {minutes:g}分の音声（文字起こし {len(expected):,}字）")
+            print(f"{'mode':<13}{'total':>8}{'transcribed':>13}{'after':>9}{'overlap':>10}"
+                  f"{'calls':>7}{'in tok':>10}{'out tok':>10}{'files/min':>11}{'coverage':>10}")
+            section_cache = _MemoryCache()
+            timings = {mode: run(mode, path, expected, section_cache) for mode in MODES}
+            if section_cache:
+                run("summary", path, expected, section_cache, name="summary*")
+        
+        print("pipelined の段階ごとの時刻（文字起こし開始からの秒）")
+        for name, start, end in sorted(timings["pipelined"], key=lambda timing: timing[1]):
+            print(f"  {name:<16}{start:>7.2f}s → {end:>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
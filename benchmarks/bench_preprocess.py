@@ -0,0 +1,77 @@
+"""
+音声の前処理（モノラル・16kHz化・無音カット）によるアップロードサイズ・時間の削減ベンチマーク
+
+実行: python benchmarks/bench_preprocess.py [音声の分数] [回線速度Mbps]
+録音アプリの書き出しに多い形式の疑似音声（WAV）を用意し、preprocess.prepared_audio で変換する。
+アップロード時間は指定した回線速度（既定 10Mbps の上り）での転送時間として見積もる。
+ffmpeg がある場合は Opus、無い場合は NumPy で 16bit PCM の WAV に変換される。
+"""
+import math
+import os
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocess import prepared_audio
+
+
+FORMATS = [
+    # (ラベル, サンプルレート, チャンネル数, サンプル幅, 無音の割合)
+    ("48kHz stereo 24bit", 48_000, 2, 3, 0.0),
+    ("44.1kHz stereo 16bit", 44_100, 2, 2, 0.0),
+    ("48kHz mono 16bit", 48_000, 1, 2, 0.0),
+    ("16kHz mono 16bit", 16_000, 1, 2, 0.0),
+    ("44.1kHz stereo +20% gap", 44_100, 2, 2, 0.2),
+]
+
+
+def write_wav(path, seconds, rate, channels, sampwidth, silence_ratio):
+    """話し声の帯域の和音を1秒ずつ書き出す（ピークメモリを抑える）
+    
+    10秒ごとに、末尾の silence_ratio の割合を無音（間）にする。
+    """
+    one_second = bytearray()
+    for n in range(rate):
+        t = n / rate
+        value = 0.3 * math.sin(2 * math.pi * 220 * t) + 0.2 * math.sin(2 * math.pi * 1800 * t)
+        sample = int(value * (2 ** (8 * sampwidth - 1) - 1))
+        one_second += struct.pack('<i', sample)[:sampwidth] * channels
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(channels)
+        w.setsampwidth(sampwidth)
+        w.setframerate(rate)
+        silent_second = bytes(len(one_second))
+        for second in range(int(seconds)):
+            silent = second % 10 >= 10 * (1 - silence_ratio)
+            w.writeframesraw(silent_second if silent else bytes(one_second))
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    mbps = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    bytes_per_second = mbps * 1e6 / 8
+    print(f"## {minutes:g}分の音声（上り {mbps:g}Mbps でのアップロード時間を見積もり）")
+    print(f"{'format':<26}{'method':>8}{'before':>10}{'after':>10}{'saved':>8}"
+          f"{'convert':>10}{'upload before':>15}{'upload after':>14}{'silence cut':>13}")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, rate, channels, sampwidth, silence_ratio in FORMATS:
+            path = os.path.join(tmp_dir, "episode.wav")
+            write_wav(path, minutes * 60, rate, channels, sampwidth, silence_ratio)
+            started = time.perf_counter()
+            with prepared_audio(path, "audio/wav") as prepared:
+                elapsed = time.perf_counter() - started
+            before = prepared['original_bytes']
+            after = prepared['bytes']
+            removed = prepared['silence']['removed_seconds'] if prepared['silence'] else 0
+            print(f"{label:<26}{prepared['method']:>8}{before / 1e6:>8.1f}MB{after / 1e6:>8.1f}MB"
+                  f"{1 - after / before:>8.0%}{elapsed:>9.2f}s"
+                  f"{before / bytes_per_second:>14.1f}s{after / bytes_per_second + elapsed:>13.1f}s{removed:>12.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+起動時間のベンチマーク（インポート時間の内訳と、プロセス起動から最初の描画完了まで）
+
+実行: python benchmarks/bench_startup.py [回数] [インポート時間の予算ms]
+1. python -X importtime で app を読み込み、トップレベルのパッケージごとの累積インポート時間を表示する。
+   合計が予算を超えた場合や、生成を始めるまで遅らせているパッケージ（DEFERRED）が読み込まれていた場合は
+   終了コード1で終わる。
+2. streamlit.testing の AppTest で app.py を[回数]回実行し、プロセス起動から "[PERF] render complete" が
+   出力されるまでの時間を計る（ブラウザを開いて最初の画面が出るまでの待ち時間に相当）。
+どちらも requirements.txt のパッケージがインストールされた環境で実行する。
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 最初の描画では読み込まない（生成・文字起こしを始める時に読み込む）パッケージ
+DEFERRED = ("google.genai", "numpy")
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+_RENDER_COMPLETE = re.compile(r"\[PERF\] render complete: ([\d.]+)ms")
+
+# AppTest で app.py を1回実行する（スクリプトの print はそのまま標準出力に出る）
+_RUN_APP = (
+    "from streamlit.testing.v1 import AppTest\n"
+    "AppTest.from_file('app.py', default_timeout=120).run()\n"
+)
+
+
+def import_times():
+    """python -X importtime -c 'import app' の結果。戻り値: (トップレベルの [(パッケージ, 累積ms)], 読み込まれた全モジュール名)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr)
+    
+    top_level = {}
+    modules = set()
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        modules.add(name)
+        # インデントの無い行が app から直接読み込まれたモジュール（累積に子の時間を含む）
+        if len(indent) == 1:
+            package = name.split(".")[0]
+            top_level[package] = top_level.get(package, 0) + int(cumulative_us) / 1000
+    return sorted(top_level.items(), key=lambda item: -item[1]), modules
+
+
+def time_to_first_render():
+    """プロセス起動から "[PERF] render complete" が出力されるまでの秒数と、スクリプト内での描画時間(ms)"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _RUN_APP],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        for line in proc.stdout:
+            match = _RENDER_COMPLETE.search(line)
+            if match:
+                return time.perf_counter() - started, float(match.group(1))
+    finally:
+        proc.kill()
+        proc.wait()
+    sys.exit("render complete のログが出力されませんでした")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 1500
+    
+    print("## import app（トップレベルのパッケージごとの累積インポート時間）")
+    top_level, modules = import_times()
+    total_ms = sum(ms for _, ms in top_level)
+    for package, ms in top_level[:15]:
+        print(f"{package:<28}{ms:>10.1f}ms{ms / total_ms:>8.0%}")
+    print(f"{'total':<28}{total_ms:>10.1f}ms  (予算 {budget_ms:g}ms)")
+    
+    loaded = [name for name in DEFERRED if name in modules]
+    for name in DEFERRED:
+        print(f"{name:<28}{'読み込まれている' if name in loaded else '遅延読み込み':>12}")
+    
+    print(f"\n## プロセス起動から最初の描画完了まで（{runs}回）")
+    results = [time_to_first_render() for _ in range(runs)]
+    to_render = [seconds * 1000 for seconds, _ in results]
+    in_script = [ms for _, ms in results]
+    print(f"{'起動 → render complete':<24}median {statistics.median(to_render):>8.0f}ms  "
+          f"min {min(to_render):>8.0f}ms  max {max(to_render):>8.0f}ms")
+    print(f"{'main() → render complete':<24}median {statistics.median(in_script):>8.0f}ms")
+    
+    if total_ms > budget_ms or loaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+長時間音声の文字起こしベンチマーク（1回の呼び出し vs 区間分割の並列処理）
+
+実行: python benchmarks/bench_transcribe.py [音声の分数]
+Gemini は呼び出さず、スタブのモデルで処理時間と出力上限を模擬する。
+    - 応答時間は「固定の待ち + 音声の長さに比例する時間」
+    - 1回の出力は MAX_OUTPUT_CHARS 文字で打ち切られる（出力トークン上限）
+疑似音声（WAV）の各サンプルには先頭からの秒数を書き込んであり、スタブはそこから
+区間の位置を読み取って、正解の文字起こしの該当部分を返す。
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# スタブのモデルなので、Gemini の流量制御（rate_limiter.py）で待たないようにする
+os.environ.setdefault("GEMINI_RPM", "100000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+
+from transcriber import transcribe_segments
+from corpus import make_transcript
+
+
+SAMPLE_RATE = 1000          # 疑似音声なので低いサンプルレートで十分
+CHARS_PER_SECOND = 6        # 日本語の話速（文字/秒）の目安
+MAX_OUTPUT_CHARS = 12_000   # 1回の応答の上限（出力トークン上限の模擬）
+LATENCY_BASE = 0.3          # 1回の呼び出しの固定の待ち（秒）
+LATENCY_PER_AUDIO_SECOND = 0.002
+
+
+def make_wav(path, seconds):
+    """各サンプルの値 = 先頭からの秒数 の疑似音声を書き出す"""
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        for second in range(int(seconds)):
+            w.writeframes(second.to_bytes(2, 'little', signed=True) * SAMPLE_RATE)
+
+
+class StubModel:
+    """音声の位置に対応する正解テキストを返すスタブ（区間の端は数文字欠ける）"""
+    
+    def __init__(self, transcript):
+        self.transcript = transcript
+        self.calls = 0
+    
+    def generate_content(self, contents, stream=False):
+        path = contents[0]
+        with wave.open(path, 'rb') as w:
+            frames = w.getnframes()
+            start = int.from_bytes(w.readframes(1), 'little', signed=True)
+        seconds = frames / SAMPLE_RATE
+        self.calls += 1
+        time.sleep(LATENCY_BASE + seconds * LATENCY_PER_AUDIO_SECOND)
+        
+        rng = random.Random(start)
+        begin = int(start * CHARS_PER_SECOND) + rng.randint(0, 5)
+        end = int((start + seconds) * CHARS_PER_SECOND) - rng.randint(0, 5)
+        return _Response(self.transcript[begin:end][:MAX_OUTPUT_CHARS])
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+def stub_upload(path, mime_type=None):
+    return path
+
+
+def report(label, transcript, expected, elapsed, calls):
+    coverage = min(len(transcript), len(expected)) / len(expected)
+    duplicated = max(len(transcript) - len(expected), 0)
+    print(f"{label:<28}{elapsed:>9.2f}s{calls:>7}{len(transcript):>10,}{coverage:>10.1%}{duplicated:>8,}"
+          f"{'  exact' if transcript == expected else ''}")
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    seconds = int(minutes * 60)
+    expected = make_transcript(seconds * CHARS_PER_SECOND + 100, seed=7)[:seconds * CHARS_PER_SECOND]
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "episode.wav")
+        make_wav(path, seconds)
+        print(f"## {minutes:g}分の音声（正解 {len(expected):,}字, 出力上限 {MAX_OUTPUT_CHARS:,}字/回）")
+        print(f"{'mode':<28}{'time':>10}{'calls':>7}{'chars':>10}{'coverage':>10}{'dup':>8}")
+        
+        model = StubModel(expected)
+        start = time.perf_counter()
+        transcript = model.generate_content([stub_upload(path)]).text
+        report("single call", transcript, expected, time.perf_counter() - start, model.calls)
+        
+        for segment_seconds, workers in [(600, 1), (600, 4), (300, 4), (300, 8)]:
+            model = StubModel(expected)
+            start = time.perf_counter()
+            transcript = transcribe_segments(
+                model, stub_upload, path, "audio/wav", seconds,
+                segment_seconds=segment_seconds, overlap_seconds=20, max_workers=workers
+            )
+            report(f"segments {segment_seconds}s x{workers} threads", transcript, expected,
+                   time.perf_counter() - start, model.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+アップロード音声の書き出し・区間分割のピークメモリ（RSS）ベンチマーク
+
+実行: python benchmarks/bench_upload.py [音声の分数]
+Streamlit の UploadedFile と同じく、アップロードされたバイト列を参照したままの BytesIO を用意し、
+各方式を別プロセスで実行して、ピークRSSが用意した直後からどれだけ増えたかを測る（Linux）。
+    spool: getvalue() して書き込む（変更前） / temporary_audio_file（チャンクごとにコピー）
+    split: 区間全体を readframes する（変更前） / audio.split_audio（チャンクごとに書き写す）
+"""
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import temporary_audio_file, plan_segments, split_audio
+
+
+SAMPLE_RATE = 16_000
+SEGMENT_SECONDS = 600
+MODES = ["spool:getvalue", "spool:chunked", "split:whole-segment", "split:chunked"]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_wav(path, seconds):
+    """ピークRSSを押し上げないよう、チャンクごとに書き出す"""
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        for _ in range(int(seconds)):
+            w.writeframesraw(os.urandom(SAMPLE_RATE * 2))
+
+
+def split_whole_segment(path, segments, out_dir):
+    """変更前の分割（区間全体を1回で読み込む）"""
+    with wave.open(path, 'rb') as src:
+        params = src.getparams()
+        for i, (start, end) in enumerate(segments):
+            src.setpos(int(start * SAMPLE_RATE))
+            with wave.open(os.path.join(out_dir, f"segment_{i:03d}.wav"), 'wb') as dst:
+                dst.setparams(params)
+                dst.writeframes(src.readframes(int((end - start) * SAMPLE_RATE)))
+
+
+def run_mode(mode, seconds):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "episode.wav")
+        write_wav(path, seconds)
+        with open(path, 'rb') as f:
+            data = f.read()
+        uploaded = io.BytesIO(data)   # data は参照されたまま（UploadedFile と同じ）
+        segments = plan_segments(seconds, SEGMENT_SECONDS, 20)
+        
+        baseline = peak_rss_mb()
+        if mode == "spool:getvalue":
+            with open(os.path.join(tmp_dir, "spooled.wav"), 'wb') as f:
+                f.write(uploaded.getvalue())
+        elif mode == "spool:chunked":
+            with temporary_audio_file(uploaded, ".wav") as spooled:
+                os.path.getsize(spooled)
+        elif mode == "split:whole-segment":
+            split_whole_segment(path, segments, tmp_dir)
+        elif mode == "split:chunked":
+            split_audio(path, segments, tmp_dir)
+        print(f"{peak_rss_mb() - baseline:.1f}")
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--mode":
+        run_mode(sys.argv[2], float(sys.argv[3]))
+        return
+    
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 60
+    seconds = minutes * 60
+    size_mb = seconds * SAMPLE_RATE * 2 / 1024 / 1024
+    print(f"## {minutes:g}分の音声（16kHz mono WAV, {size_mb:.0f}MB, 区間 {SEGMENT_SECONDS}秒）")
+    print(f"{'mode':<24}{'peak RSS増加':>14}")
+    for mode in MODES:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, str(seconds)],
+            capture_output=True, text=True, check=True
+        )
+        print(f"{mode:<24}{float(result.stdout.strip()):>12.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
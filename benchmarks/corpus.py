@@ -0,0 +1,77 @@
+"""
+ベンチマーク用の疑似コーパス（音声配信の文字起こし風テキスト）
+"""
+import json
+import random
+import uuid
+
+
+_OPENINGS = [
+    "皆さんこんにちは、今日も聞いてくださってありがとうございます。",
+    "おはようございます、今日は少し長めにお話ししようと思います。",
+    "こんばんは、今日はリスナーさんからいただいた質問に答えていきます。",
+]
+
+_SUBJECTS = [
+    "副業", "理学療法士の仕事", "Webライター", "インタビュー企画", "朝の時間", "家族との時間",
+    "ブログ運営", "読書", "筋トレ", "転職活動", "子育て", "発信活動", "営業の仕事", "リスナーさんの質問",
+    "新しい企画", "先週のイベント", "最近読んだ本", "お金の使い方", "睡眠", "コミュニティ運営",
+]
+_PREDICATES = [
+    "を始めてから{n}年が経ちました", "で一番苦労したのは最初の{n}ヶ月でした",
+    "について正直に話してみようと思います", "がきっかけで考え方が変わったんです",
+    "は思っていたよりずっと奥が深くて", "を続けるコツは小さく始めることだと気づきました",
+    "に{n}時間くらい使っているんですけど", "で失敗した話をしたいと思います",
+    "がうまくいかなかった時期もありました", "を通じて{n}人くらいの方と知り合えました",
+    "のおかげで毎日が少し楽しくなりました", "に対する見方がガラッと変わったんですよね",
+]
+_CONNECTORS = ["でも", "それで", "実は", "ちなみに", "正直", "なので", "そういえば", "結局", ""]
+_ENDINGS = ["。", "ね。", "よ。", "と思います。", "んです。", "かなと。", "んですよね。"]
+
+
+def _sentence(rng):
+    predicate = rng.choice(_PREDICATES).format(n=rng.randint(1, 30))
+    return rng.choice(_CONNECTORS) + rng.choice(_SUBJECTS) + predicate + rng.choice(_ENDINGS)
+
+
+def make_transcript(target_chars, seed=0):
+    """指定文字数程度の文字起こし風テキストを生成する"""
+    rng = random.Random(seed)
+    parts = [rng.choice(_OPENINGS)]
+    length = len(parts[0])
+    while length < target_chars:
+        sentence = _sentence(rng)
+        if rng.random() < 0.15:
+            sentence += "\n\n"
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)
+
+
+def make_history_item(transcript_chars, seed=0):
+    """履歴アイテム（storage.add_to_history と同じ形）を生成する"""
+    transcript = make_transcript(transcript_chars, seed)
+    return {
+        'id': str(uuid.UUID(int=seed)),
+        'datetime': '2026/01/01 12:00',
+        'display_title': '副業を始めて一年',
+        'titles': "1. 副業を始めて一年\n2. 続けることの大切さ\n3. 失敗もつながる",
+        'description': "▼このチャンネルでは\n...\n【AI要約】\n" + transcript,
+        'transcript': transcript,
+        'filename': f'episode_{seed}.mp3'
+    }
+
+
+def make_transcription_item(content_chars, seed=0):
+    """文字起こしデータ（components/transcriptions.py と同じ形）を生成する"""
+    return {
+        'id': str(uuid.UUID(int=seed)),
+        'title': f'#{seed} 副業の話',
+        'date': '2026/01/01',
+        'content': make_transcript(content_chars, seed),
+        'tags': ['副業', '体験談']
+    }
+
+
+def record_json(record):
+    return json.dumps(record, ensure_ascii=False)
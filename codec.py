@@ -0,0 +1,128 @@
+"""
+LocalStorage 保存用のペイロード圧縮コーデック
+
+先頭1文字をヘッダーとして形式を判別する。
+    ヘッダー無し（'[' '{' など） … 旧形式の生JSON（そのまま読み込める）
+    'B' … zlib + base64（ASCII中心のデータ向け）
+    'U' … zlib + 15bit/文字パッキング（日本語テキスト向け。LocalStorageの容量はUTF-16単位で数えるため最も小さくなる）
+"""
+import base64
+import zlib
+
+
+CODEC_BASE64 = "B"
+CODEC_UTF16 = "U"
+
+# 圧縮の効果が無い小さな値は生JSONのまま保存する
+MIN_COMPRESS_LENGTH = 256
+
+_ZLIB_LEVEL = 6
+
+# 15bit値を U+0020〜U+801F の文字に割り当てる（制御文字・サロゲートを避ける）
+_UTF16_OFFSET = 0x20
+_GROUP_BYTES = 15   # 15バイト = 120bit = 8文字
+_GROUP_CHARS = 8
+
+
+def _pack_groups(data):
+    """_GROUP_BYTES の倍数の長さのバイト列を、1文字15bitの文字列に詰める"""
+    chars = []
+    for start in range(0, len(data), _GROUP_BYTES):
+        value = int.from_bytes(data[start:start + _GROUP_BYTES], "big")
+        chars.extend(
+            chr(_UTF16_OFFSET + ((value >> shift) & 0x7FFF))
+            for shift in range(105, -1, -15)
+        )
+    return "".join(chars)
+
+
+def _pack_utf16(data):
+    """バイト列を1文字15bitの文字列に詰める（先頭の1文字は末尾に足したパディングのバイト数）"""
+    padding = (-len(data)) % _GROUP_BYTES
+    return chr(_UTF16_OFFSET + padding) + _pack_groups(data + b"\x00" * padding)
+
+
+def _unpack_utf16(text):
+    """_pack_utf16の逆変換"""
+    padding = ord(text[0]) - _UTF16_OFFSET
+    out = bytearray()
+    for start in range(1, len(text), _GROUP_CHARS):
+        value = 0
+        for ch in text[start:start + _GROUP_CHARS]:
+            value = (value << 15) | (ord(ch) - _UTF16_OFFSET)
+        out += value.to_bytes(_GROUP_BYTES, "big")
+    return bytes(out[:len(out) - padding])
+
+
+def encode_payload(text, codec=CODEC_UTF16):
+    """JSON文字列を保存用の文字列に変換する"""
+    if codec is None or len(text) < MIN_COMPRESS_LENGTH:
+        return text
+    
+    compressed = zlib.compress(text.encode("utf-8"), _ZLIB_LEVEL)
+    if codec == CODEC_BASE64:
+        encoded = CODEC_BASE64 + base64.b64encode(compressed).decode("ascii")
+    elif codec == CODEC_UTF16:
+        encoded = CODEC_UTF16 + _pack_utf16(compressed)
+    else:
+        raise ValueError(f"unknown storage codec: {codec}")
+    
+    # 圧縮で大きくなる場合は生JSONのまま
+    return encoded if len(encoded) < len(text) else text
+
+
+class PayloadEncoder:
+    """encode_payload を少しずつ行う（大きな値を、全体を1つの文字列にせずに分割して送るため）
+    
+    feed(text) と finish() が返す文字列を順につなぎ、先頭に header（finish() の後に確定する）を付けると
+    保存用の文字列になる。UTF-16形式はパディングのバイト数が最後まで分からないため、header に含める。
+    encode_payload と違い、小さな値・圧縮で大きくなる値も生JSONに切り替えない（大きな値にだけ使う）。
+    """
+    
+    def __init__(self, codec=CODEC_UTF16):
+        if codec not in (None, CODEC_BASE64, CODEC_UTF16):
+            raise ValueError(f"unknown storage codec: {codec}")
+        self.codec = codec
+        self.header = codec or ""
+        self._compressor = zlib.compressobj(_ZLIB_LEVEL) if codec else None
+        self._pending = b""
+    
+    def _encode(self, data, final=False):
+        data = self._pending + data
+        if self.codec == CODEC_BASE64:
+            size = len(data) if final else len(data) - len(data) % 3
+            self._pending = data[size:]
+            return base64.b64encode(data[:size]).decode("ascii")
+        
+        if final:
+            padding = (-len(data)) % _GROUP_BYTES
+            self.header = CODEC_UTF16 + chr(_UTF16_OFFSET + padding)
+            data += b"\x00" * padding
+        size = len(data) - len(data) % _GROUP_BYTES
+        self._pending = data[size:]
+        return _pack_groups(data[:size])
+    
+    def feed(self, text):
+        """JSON文字列の続きを渡し、確定した分の保存用の文字列を返す"""
+        if self._compressor is None:
+            return text
+        return self._encode(self._compressor.compress(text.encode("utf-8")))
+    
+    def finish(self):
+        """残りの保存用の文字列を返す（この後に header が確定する）"""
+        if self._compressor is None:
+            return ""
+        return self._encode(self._compressor.flush(), final=True)
+
+
+def decode_payload(stored):
+    """保存された文字列をJSON文字列に戻す（旧形式の生JSONはそのまま返す）"""
+    if not stored:
+        return stored
+    
+    header = stored[0]
+    if header == CODEC_BASE64:
+        return zlib.decompress(base64.b64decode(stored[1:])).decode("utf-8")
+    if header == CODEC_UTF16:
+        return zlib.decompress(_unpack_utf16(stored[1:])).decode("utf-8")
+    return stored
@@ -0,0 +1,38 @@
+"""
+アーカイブ一覧コンポーネント（ホット層からあふれた古いレコード）
+"""
+import streamlit as st
+
+from storage import archive_count, get_archive_page
+
+
+def render_archive(name, render_item, label="🗄️ アーカイブ"):
+    """アーカイブのレコードを新しい順に表示する（ボタンを押すたびに1ページずつ読み込む）
+    
+    render_item: メタデータを受け取り、1レコードを表示する関数
+    """
+    total = archive_count(name)
+    if not total:
+        return
+    
+    state_key = f"archive_show_pages_{name}"
+    if state_key not in st.session_state:
+        st.session_state[state_key] = 0
+    
+    st.markdown(f"**{label}**（{total}件）")
+    
+    shown = 0
+    for page_index in range(st.session_state[state_key]):
+        page = get_archive_page(name, page_index)
+        if page is None:
+            st.caption("⏳ 読み込み中...")
+            return
+        for meta in page:
+            render_item(meta)
+        shown += len(page)
+    
+    if shown < total:
+        button_label = "📂 アーカイブを表示" if shown == 0 else f"📜 もっと見る（残り{total - shown}件）"
+        if st.button(button_label, key=f"archive_more_{name}", use_container_width=True):
+            st.session_state[state_key] += 1
+            st.rerun()
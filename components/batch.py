@@ -0,0 +1,267 @@
+"""
+まとめて処理（複数ファイルの文字起こし・概要欄生成のキュー）
+
+キュー全体を1つのバックグラウンドジョブ（jobs.py）として実行し、その中で BATCH_CONCURRENCY 件ずつ並列に処理する。
+ファイルごとの状態は session_state.batch_jobs に置き、終わった結果はスクリプトのスレッドで保存する。
+"""
+import streamlit as st
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from audio import detached_copy
+from config import log_perf, GEMINI_MODEL, BATCH_CONCURRENCY, BATCH_MAX_ATTEMPTS, BATCH_RETRY_BASE_SECONDS
+from storage import add_to_history, register_transcription
+from pipeline import process_audio
+from transcript_cache import get_transcript_cache, get_section_cache
+from jobs import JobCancelled, submit_job, get_job, poll_job
+from gemini_client import get_client
+from rate_limiter import PRIORITY_BATCH
+
+
+# 処理中の表示を更新する間隔（秒）
+_POLL_INTERVAL = 0.5
+
+# 段階ごとの進捗バーの値と表示
+_STAGES = {
+    'queued': (0.0, "⏳ 待機中"),
+    'starting': (0.05, "🔍 準備中"),
+    'transcribing': (0.2, "🎧 文字起こし中"),
+    'describing': (0.7, "📝 概要欄とタイトルを生成中"),
+    'retrying': (0.05, "🔁 再試行待ち"),
+    'done': (1.0, "✅ 完了"),
+    'failed': (1.0, "❌ 失敗"),
+}
+
+
+def _sync_jobs(files):
+    """アップロードされているファイルとジョブの一覧を揃える（新しいファイルは待機中として追加）"""
+    jobs = st.session_state.setdefault('batch_jobs', [])
+    file_ids = [f.file_id for f in files]
+    known = {job['id'] for job in jobs}
+    jobs[:] = [job for job in jobs if job['id'] in file_ids]
+    for f in files:
+        if f.file_id not in known:
+            jobs.append({
+                'id': f.file_id, 'name': f.name, 'stage': 'queued', 'attempt': 0, 'error': None, 'batch': None
+            })
+    return jobs
+
+
+def _retry(job_id):
+    """失敗したファイルを待機中に戻し、次の実行で処理する（前のバッチジョブの進捗は反映しない）"""
+    for job in st.session_state.batch_jobs:
+        if job['id'] == job_id:
+            job.update(stage='queued', attempt=0, error=None, batch=None)
+    st.session_state.batch_autorun = True
+
+
+def _render_row(placeholder, job):
+    value, label = _STAGES[job['stage']]
+    text = f"{label} — {job['name']}"
+    if job['attempt'] > 1 and job['stage'] not in ('done', 'failed'):
+        text += f"（{job['attempt']}回目）"
+    if job['stage'] == 'failed' and job['error']:
+        text += f"：{job['error'][:80]}"
+    placeholder.progress(value, text=text)
+
+
+def _run_job(client, audio, file_id, transcript_cache, section_cache, stages, batch_job):
+    """1ファイルを処理する（ワーカースレッドで実行。失敗した場合は待ち時間を倍にしながらやり直す）
+    
+    audio: (写した音声, ファイル名, MIMEタイプ)。写した音声は audio.detached_copy で作り、終わったら閉じる
+    stages[file_id] に (段階, 試行回数) を書き込み、キューのスレッドがジョブの進捗に反映する。
+    """
+    fileobj, filename, mime_type = audio
+    try:
+        return _run_attempts(client, fileobj, filename, mime_type, file_id, transcript_cache, section_cache,
+                             stages, batch_job)
+    finally:
+        fileobj.close()
+
+
+def _run_attempts(client, fileobj, filename, mime_type, file_id, transcript_cache, section_cache, stages,
+                  batch_job):
+    """_run_job の本体（BATCH_MAX_ATTEMPTS 回まで試す）"""
+    def on_stage(stage):
+        # 中止された場合は、実行中のファイルも次の段階に進む前に止める
+        if batch_job.cancelled:
+            raise JobCancelled()
+        stages[file_id] = (stage, attempt)
+    
+    for attempt in range(1, BATCH_MAX_ATTEMPTS + 1):
+        on_stage('starting')
+        try:
+            return process_audio(
+                client.model(GEMINI_MODEL),
+                client.upload_file,
+                fileobj,
+                filename,
+                mime_type,
+                transcript_cache,
+                on_stage=on_stage,
+                priority=PRIORITY_BATCH,
+                section_cache=section_cache
+            )
+        except JobCancelled:
+            raise
+        except Exception as e:
+            log_perf(f"batch {filename}: attempt {attempt}/{BATCH_MAX_ATTEMPTS} failed ({e})")
+            if attempt == BATCH_MAX_ATTEMPTS:
+                raise
+            stages[file_id] = ('retrying', attempt + 1)
+            time.sleep(BATCH_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+
+
+def _run_queue(job, client, files, transcript_cache, section_cache):
+    """待機中のファイルを BATCH_CONCURRENCY 件ずつ並列に処理する（バックグラウンドジョブ）
+    
+    進捗は job.progress の 'stages'（file_id → (段階, 試行回数)）・'results'・'errors' に書き込む。
+    保存は結果を受け取ったスクリプトのスレッドで行う（_save_results）。
+    """
+    stages = {}
+    results = {}
+    errors = {}
+    started = time.perf_counter()
+    
+    executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch")
+    futures = {
+        executor.submit(_run_job, client, audio, file_id, transcript_cache, section_cache, stages, job): file_id
+        for file_id, audio in files
+    }
+    remaining = set(futures)
+    try:
+        while remaining:
+            done, remaining = wait(remaining, timeout=_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_id = futures[future]
+                try:
+                    results[file_id] = future.result()
+                except JobCancelled:
+                    continue
+                except Exception as e:
+                    errors[file_id] = str(e)
+            job.update(stages=dict(stages), results=dict(results), errors=dict(errors))
+    finally:
+        # 中止された場合は、まだ始まっていないファイルを実行せず、実行中のファイルの終わりも待たない
+        # （実行中のファイルは次の段階に進む前に止まる。_run_job の on_stage）
+        executor.shutdown(wait=not job.cancelled, cancel_futures=True)
+    
+    log_perf(
+        f"batch: {len(files)} files (concurrency {BATCH_CONCURRENCY}) "
+        f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+
+
+def _detach(uploaded_file):
+    """ワーカースレッドに渡す (写した音声, ファイル名, MIMEタイプ)（スクリプトのスレッドで写す）"""
+    return detached_copy(uploaded_file), uploaded_file.name, uploaded_file.type
+
+
+def _sync_progress(jobs, batch_job, progress):
+    """バッチジョブの進捗を、そのジョブで処理しているファイルの状態に反映する
+    
+    再試行で待機中に戻したファイル（item['batch'] が None）には、前のジョブの進捗を反映しない。
+    """
+    stages = progress.get('stages', {})
+    errors = progress.get('errors', {})
+    for item in jobs:
+        if item['batch'] != batch_job.id or item['stage'] in ('done', 'failed', 'queued'):
+            continue
+        if item['id'] in errors:
+            item.update(stage='failed', error=errors[item['id']])
+        elif item['id'] in stages:
+            item['stage'], item['attempt'] = stages[item['id']]
+
+
+def _save_results(jobs, batch_job, progress):
+    """終わったファイルの結果を履歴と文字起こしデータに保存する（スクリプトのスレッドで実行）"""
+    results = progress.get('results', {})
+    for item in jobs:
+        result = results.get(item['id'])
+        if result is None or item['batch'] != batch_job.id or item['stage'] == 'done':
+            continue
+        add_to_history(result['titles'], result['description'], result['transcript'], item['name'])
+        register_transcription(result['titles'], result['transcript'], item['name'])
+        item['stage'] = 'done'
+
+
+def _render_rows(jobs, with_retry):
+    for item in jobs:
+        col_row, col_retry = st.columns([6, 1])
+        with col_row:
+            _render_row(st.empty(), item)
+        with col_retry:
+            if with_retry and item['stage'] == 'failed':
+                st.button("🔁", key=f"batch_retry_{item['id']}", help="再試行", on_click=_retry, args=(item['id'],))
+
+
+def _render_running(jobs, batch_job):
+    """実行中の各ファイルの進捗（新しい結果が届いたら全体を再実行して保存する）"""
+    progress = batch_job.snapshot()
+    if any(
+        item['batch'] == batch_job.id and item['stage'] != 'done' and item['id'] in progress.get('results', {})
+        for item in jobs
+    ):
+        st.rerun()
+    _sync_progress(jobs, batch_job, progress)
+    _render_rows(jobs, with_retry=False)
+    st.button("⏹️ まとめて処理を中止", key=f"cancel_batch_{batch_job.id}", on_click=batch_job.cancel)
+
+
+def render_batch(api_key):
+    """複数ファイルをまとめて処理する欄（結果は履歴と文字起こしデータに保存）"""
+    with st.expander("📦 複数ファイルをまとめて処理", expanded=bool(st.session_state.get('batch_jobs'))):
+        st.caption(f"最大{BATCH_CONCURRENCY}件ずつ並列に処理し、結果は履歴と文字起こしデータに保存します。")
+        files = st.file_uploader(
+            "対応形式: mp3, m4a, wav（複数選択可）",
+            type=['mp3', 'm4a', 'wav'],
+            accept_multiple_files=True,
+            key="batch_files"
+        ) or []
+        files_by_id = {f.file_id: f for f in files}
+        jobs = _sync_jobs(files)
+        
+        batch_job = get_job('batch')
+        if batch_job is not None:
+            progress = batch_job.snapshot()
+            _save_results(jobs, batch_job, progress)
+            _sync_progress(jobs, batch_job, progress)
+            if not batch_job.finished:
+                poll_job('batch', lambda job: _render_running(jobs, job))
+                return
+            if not batch_job.applied:
+                batch_job.applied = True
+                for item in jobs:
+                    if item['batch'] == batch_job.id and item['stage'] not in ('done', 'failed', 'queued'):
+                        # 中止・失敗したバッチで終わらなかったファイル
+                        item.update(stage='failed', error=str(batch_job.error or "中止しました"))
+        
+        _render_rows(jobs, with_retry=True)
+        
+        done = sum(1 for item in jobs if item['stage'] == 'done')
+        failed = sum(1 for item in jobs if item['stage'] == 'failed')
+        queued = sum(1 for item in jobs if item['stage'] == 'queued')
+        if done or failed:
+            st.caption(f"完了 {done}件 / 失敗 {failed}件 / 待機中 {queued}件")
+        
+        autorun = st.session_state.pop('batch_autorun', False)
+        clicked = st.button(f"🚀 まとめて生成する（{queued}件）", disabled=not queued, key="batch_start")
+        if not (clicked or autorun) or not queued:
+            return
+        if not api_key:
+            st.error("APIキーを設定してください。")
+            return
+        
+        pending = [item for item in jobs if item['stage'] == 'queued']
+        batch_job = submit_job(
+            'batch',
+            _run_queue,
+            get_client(api_key),
+            [(item['id'], _detach(files_by_id[item['id']])) for item in pending],
+            get_transcript_cache(),
+            get_section_cache(),
+            label="batch"
+        )
+        for item in pending:
+            item.update(stage='starting', batch=batch_job.id)
+        st.rerun()
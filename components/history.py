@@ -5,7 +5,19 @@ import streamlit as st
 from datetime import datetime
 from streamlit_js_eval import streamlit_js_eval
 
-from storage import save_scripts_to_storage, clear_scripts_storage
+from storage import get_body, archive_count, save_scripts_to_storage, clear_scripts_storage
+from components.archive import render_archive
+
+
+def _render_archived_script(script):
+    """アーカイブの台本（閲覧のみ）"""
+    with st.expander(f"🗄️ {script['title']} ─ {script['createdAt']}", expanded=False):
+        if st.checkbox("台本を表示", key=f"show_script_{script['id']}"):
+            body = get_body('scripts', script['id'])
+            if body is None:
+                st.caption("⏳ 読み込み中...")
+            else:
+                st.markdown(body.get('content', ''))
 
 
 def render_script_history():
@@ -13,11 +25,12 @@ def render_script_history():
     st.markdown("### 📚 保存した台本")
     st.markdown("作成した台本の履歴を確認できます。")
     
-    if not st.session_state.saved_scripts:
+    archived_count = archive_count('scripts')
+    if not st.session_state.saved_scripts and not archived_count:
         st.info("まだ保存された台本がありません。\n\n「📝 台本作成」タブで台本を作成し、「💾 履歴に保存する」ボタンで保存してください。")
         return
     
-    st.markdown(f"*保存済み: {len(st.session_state.saved_scripts)}件*")
+    st.markdown(f"*保存済み: {len(st.session_state.saved_scripts) + archived_count}件*")
     
     if st.button("🗑️ すべての履歴を削除", type="secondary"):
         st.session_state.saved_scripts = []
@@ -28,15 +41,23 @@ def render_script_history():
     
     for i, script in enumerate(st.session_state.saved_scripts):
         with st.expander(f"📄 {script['title']} ─ {script['createdAt']}", expanded=False):
-            st.markdown(script['content'])
+            # 本文は表示を求められた時だけ読み込む
+            content = None
+            if st.checkbox("台本を表示", key=f"show_script_{script['id']}"):
+                body = get_body('scripts', script['id'])
+                if body is None:
+                    st.caption("⏳ 読み込み中...")
+                else:
+                    content = body.get('content', '')
+                    st.markdown(content)
             
             st.markdown("---")
             
             col1, col2 = st.columns(2)
             
             with col1:
-                if st.button("📋 コピー", key=f"copy_saved_{i}", use_container_width=True):
-                    escaped_text = script['content'].replace('\\', '\\\\').replace('`', '\\`').replace('$', '\\$')
+                if st.button("📋 コピー", key=f"copy_saved_{i}", use_container_width=True, disabled=content is None):
+                    escaped_text = content.replace('\\', '\\\\').replace('`', '\\`').replace('$', '\\$')
                     streamlit_js_eval(
                         js_expressions=f"navigator.clipboard.writeText(`{escaped_text}`).then(() => true)",
                         key=f"copy_saved_script_{i}_{datetime.now().strftime('%H%M%S%f')}"
@@ -48,3 +69,6 @@ def render_script_history():
                     st.session_state.saved_scripts.pop(i)
                     save_scripts_to_storage()
                     st.rerun()
+    
+    st.markdown("---")
+    render_archive('scripts', _render_archived_script)
@@ -2,16 +2,133 @@
 ホーム画面（概要欄作成）
 """
 import streamlit as st
-import os
-import tempfile
-import uuid
 from datetime import datetime
-import google.generativeai as genai
 from streamlit_js_eval import streamlit_js_eval
 
+from audio import detached_copy
 from config import DEFAULT_API_KEY, GEMINI_MODEL
-from storage import add_to_history, save_transcriptions_to_storage
-from prompts import get_transcription_prompt, get_combined_prompt
+from storage import add_to_history, register_transcription, get_body, update_body
+from transcript_cache import get_transcript_cache, get_section_cache
+from pipeline import process_audio
+from jobs import submit_job, get_job, poll_job
+from gemini_client import get_client
+from gemini import is_rate_limit_error
+from rate_limiter import get_rate_limiter
+from components.batch import render_batch
+
+
+def _preprocess_caption(report):
+    """音声の前処理で削減したサイズ・アップロード時間の表示"""
+    if report['method'] == "none":
+        return "🎛️ 音声の前処理: 変換なし（元のファイルをアップロード）"
+    ratio = report['saved_bytes'] / report['original_bytes']
+    caption = (
+        f"🎛️ 音声の前処理（{report['method']}）: {report['original_bytes'] / 1e6:.1f}MB → "
+        f"{report['bytes'] / 1e6:.1f}MB（-{ratio:.0%}）"
+    )
+    if report['saved_seconds'] is not None:
+        caption += f" / アップロード {report['upload_seconds']:.1f}秒（推定 {report['saved_seconds']:.1f}秒短縮）"
+    silence = report['silence']
+    if silence is not None:
+        caption += (
+            f"  \n🔇 無音カット: {silence['cuts']}か所・{silence['removed_seconds']:.0f}秒"
+            f"（{silence['original_seconds'] / 60:.1f}分 → {silence['trimmed_seconds'] / 60:.1f}分）"
+        )
+    return caption
+
+
+def _generate_job(job, client, audio_file, filename, mime_type, transcript_cache, section_cache):
+    """概要欄生成ジョブ（バックグラウンドで実行。Streamlitの関数は呼ばない）
+    
+    audio_file: スクリプトのスレッドで写した音声（audio.detached_copy。終わったら閉じる）
+    """
+    # 同じ音声を文字起こし済みならアップロードと文字起こしを省略する
+    try:
+        return process_audio(
+            client.model(GEMINI_MODEL),
+            client.upload_file,
+            audio_file,
+            filename,
+            mime_type,
+            transcript_cache,
+            on_stage=lambda stage: job.update(stage=stage, partial=""),
+            placeholder=job.placeholder(),
+            on_preprocessed=lambda report: job.update(preprocess=report),
+            section_cache=section_cache
+        ), filename
+    finally:
+        audio_file.close()
+
+
+def _render_generate_job(job):
+    """実行中の概要欄生成ジョブの進捗"""
+    progress = job.snapshot()
+    stage = progress.get('stage')
+    if stage == "describing":
+        st.info(f"📝 概要欄とタイトルを生成中...（{job.elapsed:.0f}秒）")
+    elif stage == "transcribing":
+        st.info(f"🎧 音声を文字起こし中...（{job.elapsed:.0f}秒）")
+    else:
+        st.info(f"🔍 準備中...（{job.elapsed:.0f}秒）")
+    
+    if progress.get('preprocess'):
+        st.caption(_preprocess_caption(progress['preprocess']))
+    if progress.get('partial'):
+        st.markdown(progress['partial'])
+    st.button("⏹️ 生成を中止", key=f"cancel_home_{job.id}", on_click=job.cancel)
+
+
+def _show_error(err_msg):
+    if is_rate_limit_error(err_msg):
+        st.error("⚠️ API利用制限に達しました（自動の再試行でも解消しませんでした）")
+        st.info("💡 1〜2分待ってから再度お試しください。Gemini無料枠は1分あたりのリクエスト数に制限があります。")
+        with st.expander("エラー詳細を確認"):
+            st.code(err_msg)
+    else:
+        st.error(f"エラーが発生しました: {err_msg}")
+
+
+def _apply_generate_job(job):
+    """終わった概要欄生成ジョブの結果を表示用にセットし、履歴と文字起こしデータに保存する"""
+    if job.status == 'cancelled':
+        st.info("⏹️ 生成を中止しました")
+        return
+    if job.status == 'failed':
+        _show_error(str(job.error))
+        return
+    
+    result, filename = job.result
+    st.session_state.transcript = result['transcript']
+    st.session_state.description = result['description']
+    st.session_state.titles = result['titles']
+    
+    add_to_history(result['titles'], result['description'], result['transcript'], filename)
+    st.session_state.viewing_history_id = None
+    
+    # 文字起こしデータにも自動登録
+    register_transcription(result['titles'], result['transcript'], filename)
+    
+    if result['cached']:
+        st.success("✓ 文字起こし完了（前回の結果を再利用）")
+    st.success("✅ 生成完了！文字起こしが自動登録され、台本作成に活用できます。")
+    st.rerun()
+
+
+def _load_viewing_history():
+    """サイドバーで選択された履歴の本文を読み込んで表示用にセットする"""
+    if not st.session_state.get('history_view_pending', False):
+        return
+    
+    # アーカイブの履歴も同じIDで読み込める
+    body = get_body('history', st.session_state.viewing_history_id)
+    if body is None:
+        st.caption("⏳ 履歴を読み込み中...")
+        return
+    
+    st.session_state.transcript = body['transcript']
+    st.session_state.description = body['description']
+    st.session_state.titles = body['titles']
+    st.session_state.history_view_pending = False
 
 
 def render_home():
@@ -20,10 +137,12 @@ def render_home():
     st.markdown("音声をアップロードするだけで、Stand.fm用の概要欄を自動生成します。")
     
     # 履歴表示中の通知
-    if st.session_state.viewing_history_index is not None:
+    if st.session_state.viewing_history_id is not None:
         st.info(f"📚 履歴を表示中（サイドバーから選択）")
+        _load_viewing_history()
         if st.button("✨ 新規作成に戻る"):
-            st.session_state.viewing_history_index = None
+            st.session_state.viewing_history_id = None
+            st.session_state.history_view_pending = False
             if 'description' in st.session_state:
                 del st.session_state.description
             if 'titles' in st.session_state:
@@ -42,6 +161,21 @@ def render_home():
         )
         if api_key:
             st.success("✓ APIキー設定済み")
+        cache_stats = get_transcript_cache().stats()
+        st.caption(
+            f"文字起こしキャッシュ: ヒット {cache_stats['hits']}回 / ミス {cache_stats['misses']}回"
+            f" / 削除 {cache_stats['evictions']}件"
+        )
+        section_stats = get_section_cache().stats()
+        st.caption(
+            f"区間の要約キャッシュ（長い音声）: ヒット {section_stats['hits']}回 / ミス {section_stats['misses']}回"
+        )
+        limiter_stats = get_rate_limiter(api_key or None).stats()
+        st.caption(
+            f"API呼び出し: 待ち {limiter_stats['depth']}件（最大 {limiter_stats['max_depth']}件）"
+            f" / 平均待ち {limiter_stats['avg_wait']:.1f}秒（最大 {limiter_stats['max_wait']:.1f}秒）"
+            f" / 利用制限 {limiter_stats['throttled']}回"
+        )
     
     st.markdown("---")
     
@@ -56,90 +190,34 @@ def render_home():
     if uploaded_file:
         st.audio(uploaded_file)
     
-    # 生成ボタン
+    # 生成ボタン（生成はバックグラウンドで実行し、実行中の再生成は前のジョブを置き換える）
     if st.button("🚀 概要欄を生成する", disabled=not uploaded_file):
         if not api_key:
             st.error("APIキーを設定してください。")
             return
         
-        try:
-            suffix = "." + uploaded_file.name.split('.')[-1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            
-            with st.spinner("🎧 音声を文字起こし中..."):
-                remote_file = genai.upload_file(tmp_path, mime_type=uploaded_file.type)
-                transcript_response = model.generate_content([
-                    remote_file,
-                    get_transcription_prompt()
-                ])
-                transcript = transcript_response.text
-            
-            st.success("✓ 文字起こし完了")
-            
-            with st.spinner("📝 概要欄とタイトルを生成中..."):
-                combined_response = model.generate_content(get_combined_prompt(transcript))
-                combined_text = combined_response.text
-                
-                if "---DESCRIPTION_START---" in combined_text and "---DESCRIPTION_END---" in combined_text:
-                    description = combined_text.split("---DESCRIPTION_START---")[1].split("---DESCRIPTION_END---")[0].strip()
-                else:
-                    description = combined_text
-                
-                if "---TITLES_START---" in combined_text and "---TITLES_END---" in combined_text:
-                    titles = combined_text.split("---TITLES_START---")[1].split("---TITLES_END---")[0].strip()
-                else:
-                    titles = "1. タイトル生成エラー\n2. もう一度お試しください\n3. -"
-            
-            os.remove(tmp_path)
-            
-            st.session_state.transcript = transcript
-            st.session_state.description = description
-            st.session_state.titles = titles
-            
-            add_to_history(titles, description, transcript, uploaded_file.name)
-            st.session_state.viewing_history_index = None
-            
-            # 文字起こしデータにも自動登録
-            first_title = ""
-            for line in titles.split('\n'):
-                if line.strip().startswith('1.'):
-                    first_title = line.strip()[2:].strip()
-                    break
-            if not first_title:
-                first_title = uploaded_file.name[:30]
-            
-            trans_item = {
-                'id': str(uuid.uuid4()),
-                'title': first_title,
-                'date': datetime.now().strftime('%Y/%m/%d'),
-                'content': transcript,
-                'tags': []
-            }
-            st.session_state.transcriptions.insert(0, trans_item)
-            if len(st.session_state.transcriptions) > 20:
-                st.session_state.transcriptions = st.session_state.transcriptions[:20]
-            save_transcriptions_to_storage()
-            
-            st.success("✅ 生成完了！文字起こしが自動登録され、台本作成に活用できます。")
-            st.rerun()
-            
-        except Exception as e:
-            err_msg = str(e)
-            if "429" in err_msg or "Quota" in err_msg or "Resource has been exhausted" in err_msg:
-                st.error("⚠️ API利用制限に達しました")
-                st.info("💡 1〜2分待ってから再度お試しください。Gemini無料枠は1分あたりのリクエスト数に制限があります。")
-                with st.expander("エラー詳細を確認"):
-                    st.code(err_msg)
-            else:
-                st.error(f"エラーが発生しました: {e}")
-            
-            if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                os.remove(tmp_path)
+        # クライアントはAPIキーごとに共有する（プロセス全体の既定クライアントは使わない）
+        submit_job(
+            'home',
+            _generate_job,
+            get_client(api_key),
+            detached_copy(uploaded_file),
+            uploaded_file.name,
+            uploaded_file.type,
+            get_transcript_cache(),
+            get_section_cache(),
+            label="description"
+        )
+    
+    job = get_job('home')
+    if job is not None and not job.finished:
+        poll_job('home', _render_generate_job)
+    elif job is not None and not job.applied:
+        job.applied = True
+        _apply_generate_job(job)
+    
+    # 複数ファイルのまとめて処理
+    render_batch(api_key)
     
     # 結果表示
     if 'description' in st.session_state:
@@ -158,12 +236,9 @@ def render_home():
             )
             st.session_state.description = edited_description
             
-            if st.session_state.viewing_history_index is not None:
-                idx = st.session_state.viewing_history_index
-                if idx < len(st.session_state.history):
-                    st.session_state.history[idx]['description'] = edited_description
-                    from storage import save_history_to_storage
-                    save_history_to_storage()
+            if st.session_state.viewing_history_id is not None:
+                # 本文に変更が無ければ何も書き込まれない（アーカイブの履歴は保存しない）
+                update_body('history', st.session_state.viewing_history_id, description=edited_description)
             
             col1, col2 = st.columns(2)
             with col1:
@@ -4,12 +4,77 @@
 import streamlit as st
 import uuid
 from datetime import datetime
-import google.generativeai as genai
 from streamlit_js_eval import streamlit_js_eval
 
-from config import DEFAULT_API_KEY, GEMINI_MODEL, get_default_settings
-from storage import save_scripts_to_storage
+from config import DEFAULT_API_KEY, GEMINI_MODEL, ARCHIVE_SEARCH_PAGES, get_default_settings
+from storage import add_record, get_bodies, archive_count, iter_archive
 from prompts import search_relevant_transcriptions, get_script_prompt_with_transcriptions
+from gemini import generate_text, is_rate_limit_error
+from jobs import submit_job, get_job, poll_job
+from gemini_client import get_model
+
+
+def _find_references(memo, transcriptions):
+    """メモに関連する文字起こしを本文込みで検索する（最大2件。本文・アーカイブが読み込み待ちの場合は None）
+    
+    最近の文字起こしで見つからない場合は、アーカイブをページ単位で読み進める（LRUには入れない）。
+    """
+    bodies = {}
+    if transcriptions:
+        bodies = get_bodies('transcriptions', [t['id'] for t in transcriptions], cache=False)
+        if bodies is None:
+            return None
+    
+    waiting = []
+    relevant = search_relevant_transcriptions(
+        memo,
+        [{**t, **bodies.get(t['id'], {})} for t in transcriptions],
+        max_results=2,
+        archive_pages=iter_archive(
+            'transcriptions',
+            max_pages=ARCHIVE_SEARCH_PAGES,
+            with_bodies=True,
+            on_pending=lambda: waiting.append(True)
+        )
+    )
+    return None if waiting else relevant
+
+
+def _generate_script_job(job, model, prompt, used_titles):
+    """台本生成ジョブ（バックグラウンドで実行。Streamlitの関数は呼ばない）"""
+    script = generate_text(model, prompt, placeholder=job.placeholder(), label="script")
+    return script, used_titles
+
+
+def _render_script_job(job):
+    """実行中の台本生成ジョブの進捗（届いた部分を表示し、完成後は下の編集欄に置き換える）"""
+    st.info(f"📝 台本を生成中...（{job.elapsed:.0f}秒）")
+    partial = job.snapshot().get('partial')
+    if partial:
+        st.markdown(partial)
+    st.button("⏹️ 生成を中止", key=f"cancel_script_{job.id}", on_click=job.cancel)
+
+
+def _apply_script_job(job):
+    """終わった台本生成ジョブの結果を編集欄にセットする"""
+    if job.status == 'cancelled':
+        st.info("⏹️ 生成を中止しました")
+        return
+    if job.status == 'failed':
+        err_msg = str(job.error)
+        if is_rate_limit_error(err_msg):
+            st.error("⚠️ API利用制限に達しました（自動の再試行でも解消しませんでした）")
+            st.info("💡 1〜2分待ってから再度お試しください")
+        else:
+            st.error(f"エラーが発生しました: {err_msg}")
+        return
+    
+    script, used_titles = job.result
+    st.session_state.generated_script = script
+    if used_titles:
+        st.success(f"✅ 台本を生成しました！（参照: {', '.join(used_titles)}）")
+    else:
+        st.success("✅ 台本を生成しました！")
 
 
 def render_script():
@@ -26,7 +91,7 @@ def render_script():
         st.markdown(f"- **配信者名**: {settings.get('broadcaster_name') or '未設定'}")
         st.markdown(f"- **ターゲット**: {settings.get('target_audience') or '未設定'}")
         st.markdown(f"- **口調**: {settings.get('speaking_style', '親しみやすく')}")
-        trans_count = len(st.session_state.get('transcriptions', []))
+        trans_count = len(st.session_state.get('transcriptions', [])) + archive_count('transcriptions')
         st.markdown(f"- **文字起こしデータ**: {trans_count}件登録済み")
         st.markdown("*設定を変更するには「⚙️ 設定」タブへ*")
     
@@ -40,50 +105,48 @@ def render_script():
     )
     
     transcriptions = st.session_state.get('transcriptions', [])
+    archived_count = archive_count('transcriptions')
+    
     if transcriptions:
         with st.expander(f"📄 参照される文字起こしデータ（{len(transcriptions)}件）", expanded=False):
             st.caption("メモのキーワードに基づいて、最大2件の文字起こしが自動選択されます")
             for trans in transcriptions[:5]:
                 st.markdown(f"- **{trans.get('title', '無題')}** ({trans.get('date', '')})")
+            if archived_count:
+                st.caption(f"ほかにアーカイブ{archived_count}件（最近の文字起こしで見つからない場合に検索されます）")
     else:
         st.info("💡 「📄 文字起こし」タブで過去の放送を登録すると、あなたの口調を模倣した台本が生成されます")
     
     st.markdown("---")
     
+    # 参照する文字起こしは押したときに検索する（本文・アーカイブの読み込みを待ってから生成を始める）
+    # 生成はバックグラウンドで実行し、実行中に押し直した場合は前のジョブを置き換える
     if st.button("🚀 台本を生成する", disabled=not memo, type="primary", use_container_width=True):
-        try:
-            genai.configure(api_key=DEFAULT_API_KEY)
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            
-            with st.spinner("📝 台本を生成中..."):
-                relevant_transcriptions = search_relevant_transcriptions(
-                    memo, 
-                    st.session_state.get('transcriptions', []),
-                    max_results=2
-                )
-                
-                if relevant_transcriptions:
-                    st.session_state.used_transcriptions = [t.get('title', '無題') for t in relevant_transcriptions]
-                
-                response = model.generate_content(
-                    get_script_prompt_with_transcriptions(memo, settings, relevant_transcriptions)
-                )
-                script = response.text
-            
-            st.session_state.generated_script = script
-            
-            if relevant_transcriptions:
-                st.success(f"✅ 台本を生成しました！（参照: {', '.join(st.session_state.used_transcriptions)}）")
-            else:
-                st.success("✅ 台本を生成しました！")
-            
-        except Exception as e:
-            err_msg = str(e)
-            if "429" in err_msg or "Quota" in err_msg:
-                st.error("⚠️ API利用制限に達しました")
-                st.info("💡 1〜2分待ってから再度お試しください")
-            else:
-                st.error(f"エラーが発生しました: {e}")
+        st.session_state.script_request = memo
+    
+    request = st.session_state.get('script_request')
+    if request is not None:
+        relevant_transcriptions = _find_references(request, transcriptions)
+        if relevant_transcriptions is None:
+            st.info("🔎 参照する文字起こしを読み込み中...")
+        else:
+            del st.session_state.script_request
+            model = get_model(DEFAULT_API_KEY, GEMINI_MODEL)
+            submit_job(
+                'script',
+                _generate_script_job,
+                model,
+                get_script_prompt_with_transcriptions(request, settings, relevant_transcriptions),
+                [t.get('title', '無題') for t in relevant_transcriptions],
+                label="script"
+            )
+    
+    job = get_job('script')
+    if job is not None and not job.finished:
+        poll_job('script', _render_script_job)
+    elif job is not None and not job.applied:
+        job.applied = True
+        _apply_script_job(job)
     
     if 'generated_script' in st.session_state:
         st.markdown("---")
@@ -130,10 +193,5 @@ def render_script():
                     'createdAt': datetime.now().strftime('%Y/%m/%d %H:%M')
                 }
                 
-                st.session_state.saved_scripts.insert(0, script_item)
-                
-                if len(st.session_state.saved_scripts) > 20:
-                    st.session_state.saved_scripts = st.session_state.saved_scripts[:20]
-                
-                save_scripts_to_storage()
+                add_record('scripts', script_item)
                 st.success("✅ 履歴に保存しました！")
@@ -15,9 +15,9 @@ def render_settings():
     if 'user_settings' not in st.session_state:
         st.session_state.user_settings = get_default_settings()
     
+    # 読み込みの応答（storage.load_all_data）で次の実行が始まるため、ここでは再実行しない
     if not st.session_state.get('settings_loaded', False):
         st.info("⏳ 設定を読み込み中...")
-        st.rerun()
         return
     
     settings = st.session_state.user_settings
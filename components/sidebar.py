@@ -3,6 +3,27 @@
 """
 import streamlit as st
 from storage import save_history_to_storage, clear_storage
+from components.archive import render_archive
+
+
+def _view_history(record_id):
+    """履歴を選択してホーム画面に表示する（本文はホーム画面で読み込む）"""
+    st.session_state.viewing_history_id = record_id
+    st.session_state.history_view_pending = True
+    for key in ('description', 'titles', 'transcript'):
+        if key in st.session_state:
+            del st.session_state[key]
+    st.rerun()
+
+
+def _render_archived_history(item):
+    """アーカイブの履歴（閲覧のみ）"""
+    if st.button(
+        f"🗄️ {item['display_title'][:25]}...\n\n🕐 {item['datetime']}",
+        key=f"archived_history_{item['id']}",
+        use_container_width=True
+    ):
+        _view_history(item['id'])
 
 
 def render_sidebar():
@@ -24,7 +45,7 @@ def render_sidebar():
             st.markdown("---")
             if st.button("🗑️ すべての履歴を削除", type="secondary", use_container_width=True):
                 st.session_state.history = []
-                st.session_state.viewing_history_index = None
+                st.session_state.viewing_history_id = None
                 st.session_state.sidebar_show_count = 5
                 clear_storage()
                 if 'description' in st.session_state:
@@ -44,11 +65,7 @@ def render_sidebar():
                         key=f"history_{i}",
                         use_container_width=True
                     ):
-                        st.session_state.viewing_history_index = i
-                        st.session_state.transcript = item['transcript']
-                        st.session_state.description = item['description']
-                        st.session_state.titles = item['titles']
-                        st.rerun()
+                        _view_history(item['id'])
                     
                     if st.button(
                         "🗑️ この履歴を削除",
@@ -58,8 +75,8 @@ def render_sidebar():
                     ):
                         st.session_state.history.pop(i)
                         save_history_to_storage()
-                        if st.session_state.viewing_history_index == i:
-                            st.session_state.viewing_history_index = None
+                        if st.session_state.viewing_history_id == item['id']:
+                            st.session_state.viewing_history_id = None
                         st.rerun()
                     
                     st.markdown("---")
@@ -68,3 +85,6 @@ def render_sidebar():
                 if st.button(f"📜 もっと見る（残り{total - show_count}件）", use_container_width=True):
                     st.session_state.sidebar_show_count += 5
                     st.rerun()
+            else:
+                # 最近の履歴をすべて表示したら、古い履歴をアーカイブから読み込めるようにする
+                render_archive('history', _render_archived_history)
@@ -5,7 +5,39 @@ import streamlit as st
 import uuid
 from datetime import datetime
 
-from storage import save_transcriptions_to_storage, clear_transcriptions_storage
+from storage import (
+    add_record,
+    get_body,
+    archive_count,
+    save_transcriptions_to_storage,
+    clear_transcriptions_storage
+)
+from components.archive import render_archive
+
+
+def _render_transcription_body(trans):
+    """本文は表示を求められた時だけ読み込む"""
+    if st.checkbox("本文を表示", key=f"show_body_{trans['id']}"):
+        body = get_body('transcriptions', trans['id'])
+        if body is None:
+            st.caption("⏳ 読み込み中...")
+        else:
+            content = body.get('content', '')
+            if len(content) > 500:
+                st.markdown(content[:500] + "...")
+                if st.checkbox("全文を表示", key=f"show_full_{trans['id']}"):
+                    st.markdown(content)
+            else:
+                st.markdown(content)
+
+
+def _render_archived_transcription(trans):
+    """アーカイブの文字起こし（閲覧のみ）"""
+    tags_str = ", ".join(trans.get('tags', [])) if trans.get('tags') else "なし"
+    with st.expander(f"🗄️ {trans['title']} ─ {trans.get('date', '')}", expanded=False):
+        st.markdown(f"**タグ:** {tags_str}")
+        st.caption(f"{trans.get('size', 0):,}字")
+        _render_transcription_body(trans)
 
 
 def render_transcriptions():
@@ -39,8 +71,7 @@ def render_transcriptions():
                     'tags': tags
                 }
                 
-                st.session_state.transcriptions.insert(0, new_item)
-                save_transcriptions_to_storage()
+                add_record('transcriptions', new_item)
                 st.success("✅ 文字起こしを登録しました！")
                 st.rerun()
             else:
@@ -51,11 +82,12 @@ def render_transcriptions():
     # 登録済みデータ一覧
     st.markdown("### 📚 登録済みデータ")
     
-    if not st.session_state.transcriptions:
+    archived_count = archive_count('transcriptions')
+    if not st.session_state.transcriptions and not archived_count:
         st.info("まだ文字起こしデータがありません。上のフォームから登録してください。")
         return
     
-    st.markdown(f"*{len(st.session_state.transcriptions)}件登録済み*")
+    st.markdown(f"*{len(st.session_state.transcriptions) + archived_count}件登録済み*")
     
     if st.button("🗑️ すべて削除", type="secondary"):
         st.session_state.transcriptions = []
@@ -68,15 +100,10 @@ def render_transcriptions():
         tags_str = ", ".join(trans.get('tags', [])) if trans.get('tags') else "なし"
         with st.expander(f"📄 {trans['title']} ─ {trans.get('date', '')}", expanded=False):
             st.markdown(f"**タグ:** {tags_str}")
+            st.caption(f"{trans.get('size', 0):,}字")
             st.markdown("---")
             
-            content = trans.get('content', '')
-            if len(content) > 500:
-                st.markdown(content[:500] + "...")
-                if st.checkbox("全文を表示", key=f"show_full_{i}"):
-                    st.markdown(content)
-            else:
-                st.markdown(content)
+            _render_transcription_body(trans)
             
             st.markdown("---")
             
@@ -84,3 +111,6 @@ def render_transcriptions():
                 st.session_state.transcriptions.pop(i)
                 save_transcriptions_to_storage()
                 st.rerun()
+    
+    st.markdown("---")
+    render_archive('transcriptions', _render_archived_transcription)
@@ -0,0 +1,167 @@
+"""
+Gemini API 呼び出しヘルパー（ストリーミング表示・レイテンシ計測・流量制御）
+
+呼び出しはすべて rate_limiter のトークンバケットを通し、429の場合は再試行ヒント（無ければ
+指数バックオフ + ジッター）の間待ってから再試行する。
+"""
+import random
+import re
+import time
+
+from config import (
+    log_perf,
+    GEMINI_STREAMING,
+    STREAM_RENDER_INTERVAL,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BACKOFF_BASE_SECONDS,
+    RATE_LIMIT_BACKOFF_MAX_SECONDS
+)
+from rate_limiter import get_rate_limiter, PRIORITY_INTERACTIVE
+
+
+# 生成中のテキストの末尾に表示するカーソル
+_CURSOR = "▌"
+
+# トークン数の見積もり（実際の使用量は応答の usage_metadata で精算する）
+AUDIO_TOKENS_PER_SECOND = 32
+_FILE_TOKEN_ESTIMATE = AUDIO_TOKENS_PER_SECOND * 10 * 60
+_OUTPUT_TOKEN_ESTIMATE = 2000
+
+# エラーメッセージ中の再試行ヒント（"Please retry in 27.6s" / RetryInfo の retry_delay）
+_RETRY_HINT_PATTERNS = (
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry-after:?\s*([\d.]+)", re.IGNORECASE),
+)
+
+
+def _chunk_text(chunk):
+    """ストリームのチャンクからテキストを取り出す（テキストを含まないチャンクは空文字）"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def estimate_tokens(contents):
+    """呼び出しのトークン数の見積もり（テキストは1文字1トークン、ファイルは10分の音声として数える）"""
+    if isinstance(contents, str):
+        contents = [contents]
+    prompt_tokens = sum(len(part) if isinstance(part, str) else _FILE_TOKEN_ESTIMATE for part in contents)
+    return prompt_tokens + _OUTPUT_TOKEN_ESTIMATE
+
+
+def is_rate_limit_error(error):
+    """API利用制限（429）のエラーか"""
+    err_msg = str(error)
+    return "429" in err_msg or "Quota" in err_msg or "Resource has been exhausted" in err_msg
+
+
+def retry_delay(error, attempt):
+    """再試行までの待ち時間（秒）
+    
+    サーバーの再試行ヒントがあればそれに従い、無ければ指数バックオフにする。
+    どちらもジッターを加え、同時に制限された呼び出しが一斉に再試行しないようにする。
+    """
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1)) + random.uniform(0, 1)
+    backoff = min(RATE_LIMIT_BACKOFF_BASE_SECONDS * 2 ** attempt, RATE_LIMIT_BACKOFF_MAX_SECONDS)
+    return random.uniform(backoff / 2, backoff)
+
+
+def _usage_tokens(response):
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None) or None
+
+
+def _generation_kwargs(schema):
+    """schema がある場合は、応答をそのJSONスキーマに沿ったJSONにする（structured.py 参照）"""
+    if schema is None:
+        return {}
+    return {'generation_config': {'response_mime_type': "application/json", 'response_schema': schema}}
+
+
+def _generate(model, contents, placeholder, label, preview, stream, on_text, schema):
+    """1回の generate_content（流量制御の内側）。戻り値: (text, response)"""
+    started = time.perf_counter()
+    kwargs = _generation_kwargs(schema)
+    
+    if not stream:
+        response = model.generate_content(contents, **kwargs)
+        text = response.text
+        total_ms = (time.perf_counter() - started) * 1000
+        log_perf(f"gemini {label}: total {total_ms:.0f}ms (non-streaming), {len(text)} chars")
+        return text, response
+    
+    response = model.generate_content(contents, stream=True, **kwargs)
+    parts = []
+    first_chunk_ms = None
+    last_render = 0.0
+    for chunk in response:
+        piece = _chunk_text(chunk)
+        if not piece:
+            continue
+        if first_chunk_ms is None:
+            first_chunk_ms = (time.perf_counter() - started) * 1000
+        parts.append(piece)
+        
+        now = time.perf_counter()
+        if (placeholder is not None or on_text is not None) and now - last_render >= STREAM_RENDER_INTERVAL:
+            partial = "".join(parts)
+            if placeholder is not None:
+                placeholder.markdown(preview(partial) + _CURSOR)
+            if on_text is not None:
+                on_text(partial)
+            last_render = now
+    
+    # テキストが1つも届かなかった場合（ブロック等）は非ストリーミングと同じくエラーにする
+    text = "".join(parts) if parts else response.text
+    if placeholder is not None:
+        placeholder.markdown(preview(text))
+    
+    total_ms = (time.perf_counter() - started) * 1000
+    log_perf(
+        f"gemini {label}: TTFT {first_chunk_ms or total_ms:.0f}ms / total {total_ms:.0f}ms, "
+        f"{len(parts)} chunks, {len(text)} chars"
+    )
+    return text, response
+
+
+def generate_text(model, contents, placeholder=None, label="generate", preview=None, stream=None,
+                  priority=PRIORITY_INTERACTIVE, tokens=None, on_text=None, schema=None):
+    """generate_content を呼び出して全文を返す
+    
+    stream=True（既定は GEMINI_STREAMING）の場合はチャンクが届くたびに placeholder（st.empty()）へ
+    途中経過を表示する。表示は STREAM_RENDER_INTERVAL 秒ごとにまとめて更新する。
+    preview: 途中のテキストを表示用に整形する関数
+    priority: 流量制御の待ち行列での優先度（rate_limiter 参照）
+    tokens: 使用トークン数の見積もり（省略時は estimate_tokens）
+    on_text(text): ストリーミング中に、それまでに届いたテキスト全体を渡して呼ぶ（表示と同じ間隔）
+    schema: 応答のJSONスキーマ（指定すると応答はJSONのテキストになる）
+    最初のチャンクまでの時間（TTFT）と全体の時間をログに出す。
+    """
+    if stream is None:
+        stream = GEMINI_STREAMING
+    preview = preview or (lambda text: text)
+    # 割り当てはAPIキーごとのため、モデルのキーのバケットで数える（gemini_client.GeminiModel）
+    limiter = get_rate_limiter(getattr(model, 'api_key', None))
+    estimated = tokens or estimate_tokens(contents)
+    
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        limiter.acquire(estimated, priority)
+        try:
+            text, response = _generate(model, contents, placeholder, label, preview, stream, on_text, schema)
+            break
+        except Exception as e:
+            # 失敗した試行のトークンは使われていないため、見積もりを戻す（settle は最後に成功した試行だけ）
+            limiter.refund(estimated)
+            if not is_rate_limit_error(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            limiter.penalize(delay)
+            log_perf(f"gemini {label}: rate limited, retry {attempt + 1}/{RATE_LIMIT_MAX_RETRIES} in {delay:.1f}s")
+    
+    limiter.settle(estimated, _usage_tokens(response))
+    return text
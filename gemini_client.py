@@ -0,0 +1,133 @@
+"""
+APIキーごとの Gemini クライアント（プロセス内の全セッションで共有）
+
+別のAPIキーを使うセッションが同時に生成しても互いの設定を上書きしないよう、プロセス全体の既定クライアントは使わず、
+APIキーごとに google.genai.Client（接続を保持したまま再利用）を作り、生成とファイルのアップロードはそのクライアントを通す。
+model() は generate_content(contents, stream, generation_config) で呼べるモデルを返す（gemini.py・benchmarks のスタブと同じ呼び方）。
+流量制御（rate_limiter.py）のバケットも、割り当てがキーごとのため、モデルの api_key ごとに分ける。
+アップロードは RemoteFileManager（remote_files.py）を通し、同じ内容の音声はアップロード済みのファイルを再利用する。
+google.genai の読み込みは重いため、最初にクライアントを作る時（生成を始める時）まで遅らせる。
+"""
+import streamlit as st
+import mimetypes
+import os
+import pathlib
+import threading
+
+from config import log_perf, GEMINI_MODEL
+from remote_files import RemoteFileManager
+
+
+class _StreamedResponse:
+    """generate_content_stream のチャンクを順に返し、最後の使用トークン数を usage_metadata に残す"""
+    
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._last = None
+        self.usage_metadata = None
+    
+    def __iter__(self):
+        for chunk in self._chunks:
+            self._last = chunk
+            self.usage_metadata = getattr(chunk, 'usage_metadata', None) or self.usage_metadata
+            yield chunk
+    
+    @property
+    def text(self):
+        """テキストが1つも届かなかった場合（ブロック等）は ValueError"""
+        return _response_text(self._last)
+
+
+def _response_text(response):
+    """応答のテキスト（テキストを含まない応答は、終了理由を添えて ValueError にする）"""
+    text = getattr(response, 'text', None)
+    if text is None:
+        candidates = getattr(response, 'candidates', None) or []
+        reason = getattr(candidates[0], 'finish_reason', None) if candidates else None
+        raise ValueError(f"応答にテキストが含まれていません（finish_reason: {reason}）")
+    return text
+
+
+class GeminiModel:
+    """1つのAPIキー・モデル名の呼び出し（google.genai.Client の models を使う）"""
+    
+    def __init__(self, client, model_name, api_key):
+        self._client = client
+        self.model_name = model_name
+        self.api_key = api_key
+    
+    def generate_content(self, contents, stream=False, generation_config=None):
+        """stream=True の場合はチャンクを返すイテラブル（_StreamedResponse）を返す"""
+        if stream:
+            return _StreamedResponse(self._client.models.generate_content_stream(
+                model=self.model_name,
+                contents=contents,
+                config=generation_config
+            ))
+        response = self._client.models.generate_content(
+            model=self.model_name,
+            contents=contents,
+            config=generation_config
+        )
+        _response_text(response)
+        return response
+
+
+class GeminiClient:
+    """1つのAPIキー用のクライアント（google.genai.Client と、モデル名ごとの GeminiModel を保持する）"""
+    
+    def __init__(self, api_key):
+        try:
+            from google import genai
+        except ImportError as e:
+            # 以前の requirements.txt（google-generativeai）で作った環境
+            raise ImportError(
+                "google-genai がインストールされていません。pip install -r requirements.txt を実行してください"
+                "（Gemini の SDK を google-generativeai から google-genai に切り替えました）"
+            ) from e
+        
+        self._api_key = api_key
+        self._client = genai.Client(api_key=api_key)
+        self._models = {}
+        self._lock = threading.Lock()
+        self.files = RemoteFileManager(self._create_file, self._get_file, self._delete_file)
+    
+    def model(self, model_name=GEMINI_MODEL):
+        """モデル名ごとに1つの GeminiModel を返す（このキーのクライアントを使う）"""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = GeminiModel(self._client, model_name, self._api_key)
+                self._models[model_name] = model
+            return model
+    
+    def upload_file(self, path, mime_type=None):
+        """ファイルをアップロードする（同じ内容のファイルはアップロード済みのものを再利用する）"""
+        return self.files.upload(path, mime_type)
+    
+    def _create_file(self, path, mime_type=None):
+        path = pathlib.Path(os.fspath(path))
+        if mime_type is None:
+            mime_type, _ = mimetypes.guess_type(path)
+        return self._client.files.upload(
+            file=path,
+            config={'mime_type': mime_type, 'display_name': path.name}
+        )
+    
+    def _get_file(self, name):
+        return self._client.files.get(name=name)
+    
+    def _delete_file(self, name):
+        self._client.files.delete(name=name)
+
+
+@st.cache_resource
+def get_client(api_key):
+    """APIキーごとのクライアント（初回だけ作成し、以降は接続ごと再利用する）"""
+    log_perf("gemini client created")
+    return GeminiClient(api_key)
+
+
+def get_model(api_key, model_name=GEMINI_MODEL):
+    """APIキーとモデル名に対応する GeminiModel"""
+    return get_client(api_key).model(model_name)
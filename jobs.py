@@ -0,0 +1,168 @@
+"""
+バックグラウンドジョブ（生成処理をスクリプトの実行から切り離す）
+
+Streamlitはウィジェットを操作するたびにスクリプトを再実行するため、生成処理をスクリプトのスレッドで
+行うと、その間は画面が固まり、途中で操作すると処理が捨てられる。
+生成処理はプロセス共有のスレッドプール（get_executor）で実行し、session_state にはジョブのハンドルだけを置く。
+    submit_job(slot, fn, ...) … slotごとに1件。実行中のジョブがあれば取り消して置き換える
+    poll_job(slot, render)    … 実行中は JOB_POLL_INTERVAL 秒ごとに進捗を表示し、終わったら全体を再実行する
+ジョブの関数は第1引数に Job を受け取り、job.update() で進捗を書き込む（取り消されていれば JobCancelled）。
+ジョブの関数の中ではStreamlitの関数を呼ばない。保存など session_state を使う処理は、結果を受け取った側で行う。
+"""
+import streamlit as st
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import log_perf, JOB_WORKERS, JOB_POLL_INTERVAL
+
+
+_FINISHED = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """ジョブが取り消された（新しいジョブに置き換えられた）"""
+
+
+class Job:
+    """バックグラウンドで実行する1件の処理の状態
+    
+    status: 'pending' → 'running' → 'done' / 'failed' / 'cancelled'
+    progress: ジョブの関数が書き込む進捗（snapshot() で読む）
+    applied: 結果を画面・保存に反映済みか（呼び出し側が設定する）
+    """
+    
+    def __init__(self, slot, label):
+        self.id = uuid.uuid4().hex[:8]
+        self.slot = slot
+        self.label = label
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.applied = False
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self._progress = {}
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+    
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+    
+    @property
+    def finished(self):
+        return self.status in _FINISHED
+    
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.created_at
+    
+    def cancel(self):
+        """取り消す（実行中の場合は次に update() を呼んだ時点で止まる）"""
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            self._finish('cancelled')
+    
+    def update(self, **progress):
+        """進捗を書き込む（ワーカースレッドから呼ぶ）"""
+        if self.cancelled:
+            raise JobCancelled()
+        with self._lock:
+            self._progress.update(progress)
+    
+    def snapshot(self):
+        """進捗のコピー（スクリプトのスレッドから読む）"""
+        with self._lock:
+            return dict(self._progress)
+    
+    def placeholder(self, key='partial'):
+        """st.empty() の代わりに generate_text / transcribe_audio へ渡し、途中経過を progress[key] に書き込む"""
+        return _JobPlaceholder(self, key)
+    
+    def _finish(self, status):
+        self.status = status
+        self.finished_at = time.time()
+        log_perf(f"job {self.label} ({self.id}) {status} in {self.elapsed * 1000:.0f}ms")
+
+
+class _JobPlaceholder:
+    def __init__(self, job, key):
+        self._job = job
+        self._key = key
+    
+    def markdown(self, text):
+        self._job.update(**{self._key: text})
+
+
+def _run(job, fn, args, kwargs):
+    if job.cancelled:
+        job._finish('cancelled')
+        return
+    job.status = 'running'
+    try:
+        result = fn(job, *args, **kwargs)
+    except JobCancelled:
+        job._finish('cancelled')
+        return
+    except Exception as e:
+        job.error = e
+        job._finish('failed')
+        return
+    if job.cancelled:
+        # 置き換えられた後に終わった結果は使わない
+        job._finish('cancelled')
+        return
+    job.result = result
+    job._finish('done')
+
+
+@st.cache_resource
+def get_executor():
+    """ジョブを実行するスレッドプール（プロセス内の全セッションで共有）"""
+    return ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+def _jobs():
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = {}
+    return st.session_state.jobs
+
+
+def submit_job(slot, fn, *args, label=None, **kwargs):
+    """fn(job, *args, **kwargs) をバックグラウンドで実行し、Job を返す
+    
+    同じ slot に実行中のジョブがある場合は取り消して置き換える。
+    """
+    previous = _jobs().get(slot)
+    if previous is not None and not previous.finished:
+        previous.cancel()
+        log_perf(f"job {previous.label} ({previous.id}) superseded")
+    
+    job = Job(slot, label or slot)
+    _jobs()[slot] = job
+    job.future = get_executor().submit(_run, job, fn, args, kwargs)
+    return job
+
+
+def get_job(slot):
+    """slot の最新のジョブ（無い場合は None）"""
+    return _jobs().get(slot)
+
+
+def poll_job(slot, render):
+    """実行中のジョブを render(job) で表示し、JOB_POLL_INTERVAL 秒ごとにその部分だけ再描画する
+    
+    ジョブが終わったらスクリプト全体を再実行する（結果の反映・保存は全体の実行で行う）。
+    render の中で st.rerun() を呼べば、途中でも全体を再実行できる。
+    """
+    @st.fragment(run_every=JOB_POLL_INTERVAL)
+    def _poll():
+        job = get_job(slot)
+        if job is None or job.finished:
+            st.rerun()
+        render(job)
+    
+    _poll()
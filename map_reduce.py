@@ -0,0 +1,149 @@
+"""
+長い文字起こしの要約（map-reduce。Streamlitの関数は呼ばない）
+
+DESCRIPTION_MODE=summary で、文字起こしが MAP_REDUCE_THRESHOLD_TOKENS を超える場合に使う（pipeline.py 参照）。
+1回の呼び出しに全文を渡すと、遅いうえに後半の内容が要約から抜けやすいため、区間に分けて要約してからまとめる。
+    map    … 文字起こしを MAP_REDUCE_SECTION_TOKENS 以内の区間に段落（無ければ文）の切れ目で分け、
+             区間ごとの要約（get_section_summary_prompt）を MAP_REDUCE_FAN_OUT 並列で作る
+    reduce … 区間の要約から、全体の要約・話題・タイトル案（get_reduce_prompt。SUMMARY_SCHEMA のJSON）を作る。
+             区間の要約の合計も MAP_REDUCE_SECTION_TOKENS を超える場合は、要約をまとめた区間をもう一度要約する
+区間の要約は「区間のテキスト・位置（何個中の何番目）のSHA-256」+「プロンプトのバージョン」をキーにキャッシュする
+（transcript_cache.get_section_cache）。プロンプトに区間の位置が入るため、同じテキストでも位置が違えば別のキーにする。
+同じ音声の再生成や、要約だけの作り直しでは、キャッシュ済みの区間の呼び出しを省く。
+トークン数は gemini.estimate_tokens と同じく、テキスト1文字 = 1トークンとして見積もる。
+"""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import log_perf, MAP_REDUCE_SECTION_TOKENS, MAP_REDUCE_FAN_OUT
+from gemini import generate_text
+from prompts import get_section_summary_prompt, get_section_summary_prompt_version, get_reduce_prompt
+from rate_limiter import PRIORITY_INTERACTIVE
+from structured import parse_result, preview_field, SUMMARY_SCHEMA
+from transcript_format import split_sentences
+
+
+def section_cache_key(section, index, total):
+    """区間のテキスト・位置（total 個中の index 番目）とプロンプトのバージョンからキャッシュキーを作る"""
+    digest = hashlib.sha256(f"{index}/{total}\n{section}".encode('utf-8')).hexdigest()
+    return f"{digest}-{get_section_summary_prompt_version()}"
+
+
+def _pieces(text, max_tokens):
+    """段落 → 文 → 文字数 の順に、max_tokens 以内の切れ目で分ける"""
+    for paragraph in text.split("\n"):
+        if len(paragraph) + 1 <= max_tokens:
+            yield paragraph + "\n"
+            continue
+        for sentence in split_sentences(paragraph):
+            for i in range(0, len(sentence), max_tokens):
+                yield sentence[i:i + max_tokens]
+
+
+def split_sections(text, max_tokens=MAP_REDUCE_SECTION_TOKENS):
+    """文字起こしを max_tokens 以内の区間に分ける（なるべく段落の切れ目で区切る）"""
+    sections = []
+    current = ""
+    for piece in _pieces(text, max_tokens):
+        if current and len(current) + len(piece) > max_tokens:
+            sections.append(current.strip())
+            current = ""
+        current += piece
+    if current.strip():
+        sections.append(current.strip())
+    return sections
+
+
+class MapReduceSummary:
+    """区間ごとの要約を並列で作り、全体の要約・話題・タイトル案にまとめる
+    
+    section_cache: get(key) / put(key, text) を持つキャッシュ（None の場合はキャッシュしない）
+    timings: 段階ごとの (名前, 開始秒, 終了秒)（started からの経過時間）
+    """
+    
+    def __init__(self, model, section_cache=None, priority=PRIORITY_INTERACTIVE, started=None):
+        self._model = model
+        self._cache = section_cache
+        self._priority = priority
+        self._started = started or time.perf_counter()
+        self.timings = []
+        self.calls = 0
+        self.cached = 0
+    
+    def elapsed(self):
+        return time.perf_counter() - self._started
+    
+    def _summarize_section(self, name, section, index, total):
+        """1区間の要約（ワーカースレッドで実行）。キャッシュ済みなら呼び出さない"""
+        key = section_cache_key(section, index, total)
+        if self._cache is not None:
+            summary = self._cache.get(key)
+            if summary is not None:
+                self.cached += 1
+                return summary
+        
+        start = self.elapsed()
+        summary = generate_text(
+            self._model,
+            get_section_summary_prompt(section, index, total),
+            label=name,
+            stream=False,
+            priority=self._priority
+        ).strip()
+        self.timings.append((name, start, self.elapsed()))
+        self.calls += 1
+        if self._cache is not None and summary:
+            self._cache.put(key, summary)
+        return summary
+    
+    def _map(self, sections, level, on_progress):
+        """区間ごとの要約を MAP_REDUCE_FAN_OUT 並列で作る（結果は区間の順）"""
+        prefix = "section" if level == 0 else f"section L{level + 1}"
+        summaries = []
+        with ThreadPoolExecutor(max_workers=MAP_REDUCE_FAN_OUT, thread_name_prefix="map") as executor:
+            futures = [
+                executor.submit(self._summarize_section, f"{prefix} {i + 1}", section, i, len(sections))
+                for i, section in enumerate(sections)
+            ]
+            for future in futures:
+                summaries.append(future.result())
+                if on_progress is not None:
+                    on_progress(len(summaries), len(sections))
+        return summaries
+    
+    def run(self, transcript, placeholder=None, on_progress=None):
+        """文字起こしの全文を要約し、DescriptionResult（body は要約と話題、titles はタイトル案）を返す
+        
+        placeholder: reduce の途中経過（要約）を表示する
+        on_progress(done, total): 区間の要約が先頭から揃うたびに呼ぶ
+        """
+        sections = split_sections(transcript)
+        summaries = self._map(sections, 0, on_progress)
+        level = 1
+        # 区間の要約をまとめても1回に渡せる長さを超える場合は、要約をさらに要約する
+        while len("\n\n".join(summaries)) > MAP_REDUCE_SECTION_TOKENS and len(summaries) > 1:
+            grouped = split_sections("\n\n".join(summaries))
+            if len(grouped) >= len(summaries):
+                break
+            summaries = self._map(grouped, level, None)
+            level += 1
+        log_perf(
+            f"map-reduce: {len(sections)} sections, {level} levels, "
+            f"{self.calls} calls, {self.cached} cached (fan-out {MAP_REDUCE_FAN_OUT})"
+        )
+        
+        start = self.elapsed()
+        response = generate_text(
+            self._model,
+            get_reduce_prompt(summaries),
+            placeholder=placeholder,
+            label="reduce",
+            preview=lambda text: preview_field(text, 'summary'),
+            priority=self._priority,
+            schema=SUMMARY_SCHEMA
+        )
+        self.timings.append(("reduce", start, self.elapsed()))
+        result = parse_result(response)
+        result.transcript = transcript
+        return result
@@ -0,0 +1,412 @@
+"""
+1本の音声から文字起こし・概要欄・タイトル案を作る処理（Streamlitの関数は呼ばない）
+
+バックグラウンドジョブ（jobs.py）として、ホーム画面・まとめて処理（components/batch.py）から実行する。
+保存（add_to_history / register_transcription）は結果を受け取ったスクリプトのスレッドで行う。
+
+概要欄・タイトル案の作り方は DESCRIPTION_MODE で選ぶ。
+    pipelined   … 文字起こしの完了を待たずに、先頭から揃った部分を PIPELINE_CHUNK_CHARS ごとに概要欄用に整形し、
+                  PIPELINE_TITLE_CHARS 字が揃った時点でタイトル案の生成も始める。文字起こしが終わったら残りを整形し、
+                  定型文（DESCRIPTION_HEADER）と整形済みの部分をつないで概要欄にする
+    serial      … 文字起こしの全文を1回の呼び出し（get_combined_prompt）で概要欄とタイトル案にする
+    single_call … アップロードした音声から、文字起こし・概要欄・タイトル案を1回の呼び出し
+                  （get_single_call_prompt）で作る。文字起こしを再送しないため、入力トークンと呼び出しが1回分減る
+    summary     … モデルには短い要約・話題・タイトル案だけを作らせ（get_summary_prompt）、概要欄には
+                  transcript_format で整形した文字起こしを差し込む。出力トークンが文字起こしの長さに比例しない。
+                  文字起こしが MAP_REDUCE_THRESHOLD_TOKENS を超える場合は、区間ごとに要約してからまとめる（map_reduce.py）
+serial で文字起こしが MAP_REDUCE_THRESHOLD_TOKENS を超える場合は、1回の呼び出しに全文を渡さず pipelined と同じく
+PIPELINE_CHUNK_CHARS ごとに整形する。
+応答はJSONスキーマで形を指定して受け取る（structured.py 参照）。概要欄の本文・タイトル案が足りない・
+壊れている場合は、全体をやり直さず、その部分だけを文字起こしから作り直す（_regenerate_missing）。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from audio import temporary_audio_file, probe_duration, can_split
+from config import (
+    log_perf,
+    DESCRIPTION_MODE,
+    SINGLE_CALL_MAX_SECONDS,
+    PIPELINE_CHUNK_CHARS,
+    PIPELINE_TITLE_CHARS,
+    PIPELINE_CONCURRENCY,
+    MAP_REDUCE_THRESHOLD_TOKENS
+)
+from gemini import generate_text
+from map_reduce import MapReduceSummary
+from structured import (
+    DescriptionResult,
+    parse_result,
+    format_titles,
+    preview_field,
+    TITLES_SCHEMA,
+    DESCRIPTION_SCHEMA,
+    SINGLE_CALL_SCHEMA,
+    SUMMARY_SCHEMA
+)
+from prompts import (
+    get_combined_prompt,
+    get_single_call_prompt,
+    get_summary_prompt,
+    get_titles_prompt,
+    get_format_prompt,
+    DESCRIPTION_HEADER
+)
+from rate_limiter import PRIORITY_INTERACTIVE
+from transcriber import transcribe_audio, transcribe_with_prompt
+from transcript_cache import audio_digest, audio_cache_key
+from transcript_format import format_transcript
+
+
+# serial / summary で、文字起こしの後に1回だけ呼ぶ生成（プロンプト, スキーマ, 途中経過として表示する項目）
+_DESCRIBE_CALLS = {
+    'serial': (get_combined_prompt, DESCRIPTION_SCHEMA, 'formatted_transcript'),
+    'summary': (get_summary_prompt, SUMMARY_SCHEMA, 'summary'),
+}
+
+# 文字起こしの途中経過のうち、後から書き換わりうる末尾の文字数
+# （長時間音声の区間のつなぎ目は、前の区間の末尾600字の範囲で重複を除いてつなぎ直される）
+_UNSTABLE_TAIL = 1000
+
+
+def assemble_description(formatted):
+    """定型文と、整形済みの文字起こし（部分ごと）をつないで概要欄にする"""
+    return f"{DESCRIPTION_HEADER}\n【AI要約】\n" + "\n\n".join(formatted)
+
+
+def assemble_summary_description(summary, transcript):
+    """定型文・要約と、Python で整形した文字起こしをつないで概要欄にする（DESCRIPTION_MODE=summary）"""
+    return f"{DESCRIPTION_HEADER}\n【AI要約】\n{summary}\n\n【文字起こし】\n{format_transcript(transcript)}"
+
+
+# =============================================================================
+# Pipelined Description
+# =============================================================================
+
+class PipelinedDescription:
+    """文字起こしの途中経過から、概要欄の整形とタイトル案の生成を並行して進める
+    
+    feed(text)         … 文字起こしの途中経過（先頭から揃った部分）を渡す。確定した部分を整形に回す
+    finish(transcript) … 文字起こしの全文を渡し、残りを整形して DescriptionResult を返す
+    with_titles=False の場合はタイトル案を作らない（本文だけを作り直す場合）
+    close()            … まだ始まっていない呼び出しを取り消す
+    timings: 段階ごとの (名前, 開始秒, 終了秒)（started からの経過時間）
+    """
+    
+    def __init__(self, model, priority=PRIORITY_INTERACTIVE, started=None, with_titles=True):
+        self._model = model
+        self._priority = priority
+        self._with_titles = with_titles
+        self._started = started or time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=PIPELINE_CONCURRENCY, thread_name_prefix="describe")
+        self._text = ""
+        self._consumed = 0
+        self._chunks = []
+        self._titles = None
+        self.timings = []
+    
+    def elapsed(self):
+        return time.perf_counter() - self._started
+    
+    def _timed_generate(self, name, prompt, schema=None):
+        """1回の生成（ワーカースレッドで実行）の開始・終了時刻を timings に記録する"""
+        start = self.elapsed()
+        text = generate_text(self._model, prompt, label=name, stream=False, priority=self._priority, schema=schema)
+        self.timings.append((name, start, self.elapsed()))
+        return text
+    
+    def _submit_chunk(self, end):
+        index = len(self._chunks)
+        prompt = get_format_prompt(self._text[self._consumed:end], index)
+        self._chunks.append(self._executor.submit(self._timed_generate, f"format {index + 1}", prompt))
+        self._consumed = end
+    
+    def _submit_titles(self, partial):
+        prompt = get_titles_prompt(self._text, partial=partial)
+        self._titles = self._executor.submit(self._timed_generate, "titles", prompt, TITLES_SCHEMA)
+    
+    def _next_cut(self, limit):
+        """まだ整形に回していない部分から PIPELINE_CHUNK_CHARS 字ほどを、段落（無ければ文）の切れ目で区切る
+        
+        limit までに PIPELINE_CHUNK_CHARS 字が揃っていなければ None。
+        """
+        start = self._consumed
+        end = start + PIPELINE_CHUNK_CHARS
+        if end > limit:
+            return None
+        for separator in ("\n", "。"):
+            cut = self._text.rfind(separator, start + PIPELINE_CHUNK_CHARS // 2, end)
+            if cut != -1:
+                return cut + 1
+        return end
+    
+    def _dispatch(self, limit):
+        while True:
+            end = self._next_cut(limit)
+            if end is None:
+                return
+            self._submit_chunk(end)
+    
+    def feed(self, text):
+        """文字起こしの途中経過を受け取る（文字起こしのスレッドから呼ぶ）"""
+        self._text = text
+        if self._with_titles and self._titles is None and len(text) >= PIPELINE_TITLE_CHARS:
+            self._submit_titles(partial=True)
+        self._dispatch(len(text) - _UNSTABLE_TAIL)
+    
+    def finish(self, transcript, on_progress=None):
+        """文字起こしの全文から概要欄の本文とタイトル案を組み立てる
+        
+        on_progress(done, total, description): 整形済みの部分が先頭から揃うたびに呼ぶ
+        戻り値: DescriptionResult（タイトル案の応答が壊れている場合は titles が None）
+        """
+        if transcript[:self._consumed] != self._text[:self._consumed]:
+            # 整形に回した部分が全文と食い違った場合（つなぎ目の書き換えなど）は最初から整形し直す
+            log_perf("pipeline: transcript changed after dispatch, reformatting from the start")
+            for future in self._chunks:
+                future.cancel()
+            self._chunks = []
+            self._consumed = 0
+        
+        self._text = transcript
+        self._dispatch(len(transcript))
+        if transcript[self._consumed:].strip():
+            self._submit_chunk(len(transcript))
+        if self._with_titles and self._titles is None:
+            self._submit_titles(partial=False)
+        
+        formatted = []
+        for future in self._chunks:
+            formatted.append(future.result().strip())
+            if on_progress is not None:
+                on_progress(len(formatted), len(self._chunks), assemble_description(formatted))
+        titles = parse_result(self._titles.result()).titles if self._titles is not None else None
+        return DescriptionResult(transcript=transcript, body="\n\n".join(formatted), titles=titles)
+    
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def log_timings(timings, total):
+    """段階ごとの開始・終了時刻と、並行して進んだ分の時間をログに出す"""
+    for name, start, end in sorted(timings, key=lambda timing: timing[1]):
+        log_perf(f"pipeline {name}: {start * 1000:.0f}ms → {end * 1000:.0f}ms ({(end - start) * 1000:.0f}ms)")
+    serial = sum(end - start for _, start, end in timings)
+    log_perf(
+        f"pipeline total: {total * 1000:.0f}ms "
+        f"(stages sum {serial * 1000:.0f}ms, overlapped {max(serial - total, 0) * 1000:.0f}ms)"
+    )
+
+
+# =============================================================================
+# Single Call
+# =============================================================================
+
+def _fits_single_call(path):
+    """1回の呼び出しの出力上限に収まる長さの音声か（長さが分からない場合は収まるものとする）"""
+    duration = probe_duration(path) if can_split(path) else None
+    if duration is not None and duration > SINGLE_CALL_MAX_SECONDS:
+        log_perf(f"single call: {duration:.0f}s audio exceeds {SINGLE_CALL_MAX_SECONDS}s, using pipelined")
+        return False
+    return True
+
+
+# =============================================================================
+# Describe Once / Regeneration
+# =============================================================================
+
+def _describe_once(model, transcript, mode, placeholder, priority, started, timings, label=None):
+    """文字起こしの全文から、1回の呼び出しで概要欄の本文とタイトル案を作る（_DESCRIBE_CALLS の mode）"""
+    get_prompt, schema, preview_key = _DESCRIBE_CALLS[mode]
+    label = label or ("description" if mode == "serial" else mode)
+    start = time.perf_counter() - started
+    response = generate_text(
+        model,
+        get_prompt(transcript),
+        placeholder=placeholder,
+        label=label,
+        preview=lambda text: preview_field(text, preview_key),
+        priority=priority,
+        schema=schema
+    )
+    timings.append((label, start, time.perf_counter() - started))
+    return parse_result(response)
+
+
+def _is_long(transcript):
+    """1回の呼び出しに全文を渡さない長さの文字起こしか（1文字1トークンとして見積もる）"""
+    return len(transcript) > MAP_REDUCE_THRESHOLD_TOKENS
+
+
+def _map_reduce(model, transcript, placeholder, priority, started, timings, section_cache, label="map-reduce"):
+    """長い文字起こしを区間ごとに要約してからまとめる（DESCRIPTION_MODE=summary）"""
+    log_perf(f"{label}: {len(transcript):,} chars exceeds {MAP_REDUCE_THRESHOLD_TOKENS:,} tokens")
+    summarizer = MapReduceSummary(model, section_cache, priority, started)
+    
+    def show_progress(done, total):
+        if placeholder is not None:
+            placeholder.markdown(f"*区間の要約 {done}/{total} 完了*")
+    
+    result = summarizer.run(transcript, placeholder=placeholder, on_progress=show_progress)
+    timings.extend(summarizer.timings)
+    return result
+
+
+def _regenerate_missing(model, transcript, result, priority, started, timings, mode, section_cache=None):
+    """構造化出力で足りない・壊れている部分（result.missing）だけを、文字起こしから作り直す
+    
+    タイトル案は文字起こしの冒頭（PIPELINE_TITLE_CHARS 字）だけを渡す小さなプロンプトで作る。
+    本文は、summary では要約をもう一度作り（長い文字起こしはキャッシュ済みの区間の要約からまとめ直す）、それ以外は文字起こしを PIPELINE_CHUNK_CHARS ごとに
+    整形し直す（どちらもタイトル案は使わない）。
+    """
+    if 'titles' in result.missing:
+        log_perf("structured output: titles missing, regenerating titles only")
+        start = time.perf_counter() - started
+        head = transcript[:PIPELINE_TITLE_CHARS]
+        text = generate_text(
+            model,
+            get_titles_prompt(head, partial=len(head) < len(transcript)),
+            label="titles (regenerate)",
+            stream=False,
+            priority=priority,
+            schema=TITLES_SCHEMA
+        )
+        result.titles = parse_result(text).titles
+        timings.append(("titles (regenerate)", start, time.perf_counter() - started))
+    
+    if 'body' in result.missing and mode == "summary" and _is_long(transcript):
+        log_perf("structured output: summary missing, regenerating summary only")
+        result.body = _map_reduce(
+            model, transcript, None, priority, started, timings, section_cache, label="map-reduce (regenerate)"
+        ).body
+    elif 'body' in result.missing and mode == "summary":
+        log_perf("structured output: summary missing, regenerating summary only")
+        result.body = _describe_once(
+            model, transcript, mode, None, priority, started, timings, label="summary (regenerate)"
+        ).body
+    elif 'body' in result.missing:
+        log_perf("structured output: description body missing, regenerating body only")
+        describer = PipelinedDescription(model, priority, started, with_titles=False)
+        try:
+            result.body = describer.finish(transcript).body
+        finally:
+            describer.close()
+        timings.extend((f"{name} (regenerate)", start, end) for name, start, end in describer.timings)
+
+
+# =============================================================================
+# Processing
+# =============================================================================
+
+def process_audio(model, upload_file, fileobj, filename, mime_type, transcript_cache,
+                  on_stage=None, placeholder=None, on_preprocessed=None, priority=PRIORITY_INTERACTIVE,
+                  mode=DESCRIPTION_MODE, section_cache=None):
+    """音声（file-like）を文字起こしし、概要欄とタイトル案を生成する
+    
+    on_stage(stage): 段階が変わるたびに呼ぶ（"transcribing" / "describing"）
+    placeholder: 各段階の途中経過を表示する（st.empty() または Job.placeholder()）
+    on_preprocessed: transcribe_audio に渡す（音声の前処理の結果）
+    priority: Gemini呼び出しの流量制御での優先度（まとめて処理は PRIORITY_BATCH）
+    mode: "pipelined" / "serial" / "single_call" / "summary"（既定は DESCRIPTION_MODE。config.py 参照）
+          文字起こしがキャッシュ済みの場合、single_call は pipelined と同じく文字起こしから作る
+    section_cache: map-reduce の区間の要約のキャッシュ（transcript_cache.get_section_cache。None の場合はキャッシュしない）
+    戻り値: {'transcript', 'description', 'titles', 'cached', 'timings'}
+    """
+    on_stage = on_stage or (lambda stage: None)
+    started = time.perf_counter()
+    timings = []
+    result = None
+    describer = None
+    
+    try:
+        # single_call の文字起こしは別のプロンプトで作るため、別のキーにする（通常の文字起こしは使ってよい）
+        digest = audio_digest(fileobj)
+        sources = ("single_call", "transcribe") if mode == "single_call" else ("transcribe",)
+        transcript = None
+        for source in sources:
+            transcript = transcript_cache.get(audio_cache_key(digest, source))
+            if transcript is not None:
+                break
+        cached = transcript is not None
+        if not cached:
+            on_stage("transcribing")
+            suffix = "." + filename.split('.')[-1]
+            with temporary_audio_file(fileobj, suffix) as tmp_path:
+                if mode == "single_call" and _fits_single_call(tmp_path):
+                    response = transcribe_with_prompt(
+                        model,
+                        upload_file,
+                        tmp_path,
+                        mime_type,
+                        get_single_call_prompt(),
+                        placeholder=placeholder,
+                        preview=lambda text: preview_field(text, 'transcript'),
+                        on_preprocessed=on_preprocessed,
+                        priority=priority,
+                        schema=SINGLE_CALL_SCHEMA
+                    )
+                    result = parse_result(response)
+                    timings.append(("single call", 0.0, time.perf_counter() - started))
+                    if result.transcript is None:
+                        # 文字起こしが無ければ作り直せないため、通常の文字起こしからやり直す
+                        log_perf("single call: transcript missing, transcribing again")
+                        result = None
+                
+                if result is None:
+                    if mode not in _DESCRIBE_CALLS:
+                        describer = PipelinedDescription(model, priority, started)
+                    transcript = transcribe_audio(
+                        model,
+                        upload_file,
+                        tmp_path,
+                        mime_type,
+                        placeholder=placeholder,
+                        on_preprocessed=on_preprocessed,
+                        priority=priority,
+                        on_text=describer.feed if describer else None
+                    )
+                    timings.append(("transcription", 0.0, time.perf_counter() - started))
+                else:
+                    transcript = result.transcript
+            source = "transcribe" if result is None else "single_call"
+            transcript_cache.put(audio_cache_key(digest, source), transcript)
+        
+        on_stage("describing")
+        if result is None and mode == "summary" and _is_long(transcript):
+            result = _map_reduce(model, transcript, placeholder, priority, started, timings, section_cache)
+        elif result is None and mode in _DESCRIBE_CALLS and not _is_long(transcript):
+            result = _describe_once(model, transcript, mode, placeholder, priority, started, timings)
+        elif result is None:
+            if mode == "serial":
+                log_perf(
+                    f"serial: {len(transcript):,} chars exceeds {MAP_REDUCE_THRESHOLD_TOKENS:,} tokens, "
+                    "formatting in chunks"
+                )
+            describer = describer or PipelinedDescription(model, priority, started)
+            
+            def show_progress(done, total, partial):
+                if placeholder is not None:
+                    placeholder.markdown(f"*整形 {done}/{total} 完了*\n\n{partial}")
+            
+            result = describer.finish(transcript, on_progress=show_progress)
+            timings.extend(describer.timings)
+        
+        if result.missing:
+            _regenerate_missing(model, transcript, result, priority, started, timings, mode, section_cache)
+    finally:
+        if describer is not None:
+            describer.close()
+    
+    if mode == "summary":
+        description = assemble_summary_description(result.body or "", transcript)
+    else:
+        description = assemble_description([result.body or ""])
+    
+    log_timings(timings, time.perf_counter() - started)
+    return {
+        'transcript': transcript,
+        'description': description,
+        'titles': format_titles(result.titles),
+        'cached': cached,
+        'timings': timings,
+    }
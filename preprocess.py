@@ -0,0 +1,258 @@
+"""
+文字起こし前の音声の前処理（アップロードサイズの削減）
+
+モノラル・16kHzの PCM に変換し、長い無音を縮めてから（SILENCE_TRIM, vad.py 参照）圧縮形式で再エンコードする。
+    ffmpeg がある場合 … すべての形式をデコードし、Opus（.ogg）に再エンコードする
+    ffmpeg が無い場合 … PCMのWAVのみ NumPy で変換し、16bit PCM の WAV のままアップロードする（mp3/m4a・浮動小数点のWAVなどはそのまま）
+変換後の方が大きくなる場合は元のファイルを使う。
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from contextlib import contextmanager
+
+import numpy as np
+
+from audio import is_pcm_wav, has_ffmpeg
+from config import log_perf, PREPROCESS_SAMPLE_RATE, PREPROCESS_BITRATE, SILENCE_TRIM
+from remote_files import last_upload_reused
+from vad import trim_silence
+
+
+# NumPy変換で1回に読み込むフレーム数
+_BLOCK_FRAMES = 256 * 1024
+# ダウンサンプリング前のローパスフィルタのタップ数
+_LOWPASS_TAPS = 63
+
+
+# =============================================================================
+# NumPy (WAV)
+# =============================================================================
+
+def _decode_pcm(data, sampwidth):
+    """PCMのバイト列を [-1, 1) の float32 配列にする"""
+    if sampwidth == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sampwidth == 2:
+        return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+    if sampwidth == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        return values.astype(np.float32) / 8388608
+    if sampwidth == 4:
+        return np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648
+    raise ValueError(f"unsupported sample width: {sampwidth}")
+
+
+def _lowpass_taps(cutoff):
+    """窓関数法（ハミング窓）のローパスFIR。cutoff は入力サンプルレートに対する比（0〜0.5）"""
+    n = np.arange(_LOWPASS_TAPS) - (_LOWPASS_TAPS - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(_LOWPASS_TAPS)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+def convert_wav(src_path, dst_path, target_rate=PREPROCESS_SAMPLE_RATE):
+    """WAVをモノラル・target_rate・16bit PCM に変換する（ブロックごとに処理し、全体を読み込まない）"""
+    with wave.open(src_path, 'rb') as src, wave.open(dst_path, 'wb') as dst:
+        channels = src.getnchannels()
+        sampwidth = src.getsampwidth()
+        rate = src.getframerate()
+        dst.setnchannels(1)
+        dst.setsampwidth(2)
+        dst.setframerate(min(rate, target_rate))
+        
+        out_rate = min(rate, target_rate)
+        step = rate / out_rate
+        taps = _lowpass_taps(0.45 * out_rate / rate) if rate > out_rate else None
+        history = np.zeros(_LOWPASS_TAPS - 1, dtype=np.float32)
+        previous = np.zeros(1, dtype=np.float32)   # 前のブロックの最後のサンプル（補間用）
+        block_start = 0                            # ブロック先頭の入力サンプル番号
+        next_out = 0                               # 次に出力するサンプル番号
+        
+        while True:
+            data = src.readframes(_BLOCK_FRAMES)
+            if not data:
+                break
+            mono = _decode_pcm(data, sampwidth).reshape(-1, channels).mean(axis=1)
+            if taps is not None:
+                padded = np.concatenate([history, mono])
+                history = padded[-(_LOWPASS_TAPS - 1):]
+                mono = np.convolve(padded, taps, mode='valid').astype(np.float32)
+            
+            # 出力サンプルの時刻（入力サンプル単位）で線形補間する
+            block_end = block_start + len(mono)
+            last_out = int(np.floor((block_end - 1) / step))
+            positions = np.arange(next_out, last_out + 1) * step - block_start
+            samples = np.concatenate([previous, mono])
+            resampled = np.interp(positions + 1, np.arange(len(samples)), samples)
+            dst.writeframesraw((np.clip(resampled, -1, 1 - 1 / 32768) * 32768).astype('<i2').tobytes())
+            
+            previous = mono[-1:]
+            next_out = last_out + 1
+            block_start = block_end
+
+
+# =============================================================================
+# ffmpeg
+# =============================================================================
+
+def decode_ffmpeg(src_path, dst_path, target_rate=PREPROCESS_SAMPLE_RATE):
+    """ffmpegでモノラル・target_rate・16bit PCM の WAV にデコードする（失敗した場合は False）"""
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", src_path, "-vn", "-ac", "1", "-ar", str(target_rate),
+         "-c:a", "pcm_s16le", dst_path],
+        capture_output=True
+    )
+    return result.returncode == 0
+
+
+def encode_ffmpeg(src_path, dst_path):
+    """ffmpegで Opus（.ogg）に再エンコードする（失敗した場合は False）
+    
+    bitexact を指定し、同じ音声からは同じバイト列を作る（Oggのシリアル番号を乱数にしない）。
+    内容のハッシュでアップロード済みのファイルを再利用できるようにするため（remote_files.py 参照）。
+    """
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-i", src_path,
+         "-c:a", "libopus", "-b:a", PREPROCESS_BITRATE, "-application", "voip",
+         "-fflags", "+bitexact", dst_path],
+        capture_output=True
+    )
+    return result.returncode == 0
+
+
+# =============================================================================
+# Pipeline
+# =============================================================================
+
+def _to_pcm(path, work_dir):
+    """モノラル・16kHz・16bit PCM の WAV を作る（対応していない形式の場合は None）"""
+    pcm_path = os.path.join(work_dir, "pcm.wav")
+    if has_ffmpeg() and decode_ffmpeg(path, pcm_path):
+        return pcm_path
+    if is_pcm_wav(path):
+        try:
+            convert_wav(path, pcm_path)
+        except (wave.Error, EOFError, ValueError) as e:
+            # 読めないWAVは前処理せず、元のファイルをアップロードする
+            log_perf(f"preprocess: wav conversion skipped ({e})")
+            return None
+        return pcm_path
+    return None
+
+
+@contextmanager
+def prepared_audio(path, mime_type):
+    """前処理した音声を渡すコンテキストマネージャー（変換後のファイルはブロックを抜けると削除）
+    
+    渡す値: {'path', 'mime_type', 'method', 'original_bytes', 'bytes', 'elapsed', 'silence'}
+    silence は無音カットの統計と対応表（vad.trim_silence の戻り値。カットしなかった場合は None）
+    """
+    started = time.perf_counter()
+    original_bytes = os.path.getsize(path)
+    result = {
+        'path': path,
+        'mime_type': mime_type,
+        'method': "none",
+        'original_bytes': original_bytes,
+        'bytes': original_bytes,
+        'elapsed': 0.0,
+        'silence': None,
+    }
+    
+    work_dir = tempfile.mkdtemp()
+    try:
+        pcm_path = _to_pcm(path, work_dir)
+        silence = None
+        if pcm_path is not None and SILENCE_TRIM:
+            trimmed_path = os.path.join(work_dir, "trimmed.wav")
+            silence = trim_silence(pcm_path, trimmed_path)
+            if silence['trimmed']:
+                pcm_path = trimmed_path
+            else:
+                silence = None
+        
+        candidate = None
+        if pcm_path is not None:
+            out_path = os.path.join(work_dir, "prepared.ogg")
+            if has_ffmpeg() and encode_ffmpeg(pcm_path, out_path):
+                candidate = (out_path, "audio/ogg", "ffmpeg")
+            else:
+                candidate = (pcm_path, "audio/wav", "numpy")
+        
+        if candidate is not None and os.path.getsize(candidate[0]) < original_bytes:
+            result.update(
+                path=candidate[0],
+                mime_type=candidate[1],
+                method=candidate[2],
+                bytes=os.path.getsize(candidate[0]),
+                silence=silence
+            )
+        result['elapsed'] = time.perf_counter() - started
+        log_perf(
+            f"audio preprocess ({result['method']}): {original_bytes / 1e6:.1f}MB -> "
+            f"{result['bytes'] / 1e6:.1f}MB in {result['elapsed'] * 1000:.0f}ms"
+        )
+        if result['silence'] is not None:
+            log_perf(
+                f"silence trim: {silence['original_seconds']:.0f}s -> {silence['trimmed_seconds']:.0f}s "
+                f"({silence['cuts']} cuts)"
+            )
+        yield result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class UploadMeter:
+    """upload_file を包み、アップロードしたバイト数と時間を集計する（スレッドから呼ばれてもよい）
+    
+    アップロード済みのファイルを再利用した場合（remote_files.py）は転送していないため数えない。
+    """
+    
+    def __init__(self, upload_file):
+        self._upload_file = upload_file
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.seconds = 0.0
+    
+    def upload(self, path, **kwargs):
+        started = time.perf_counter()
+        remote_file = self._upload_file(path, **kwargs)
+        elapsed = time.perf_counter() - started
+        if last_upload_reused():
+            return remote_file
+        with self._lock:
+            self.bytes += os.path.getsize(path)
+            self.seconds += elapsed
+        return remote_file
+
+
+def savings_report(prepared, meter):
+    """前処理によるサイズとアップロード時間の削減量
+    
+    元のファイルのアップロード時間は、実際のアップロードの転送速度から推定する。
+    """
+    saved_bytes = prepared['original_bytes'] - prepared['bytes']
+    saved_seconds = None
+    if meter.bytes and meter.seconds > 0:
+        throughput = meter.bytes / meter.seconds
+        saved_seconds = saved_bytes / throughput - prepared['elapsed']
+    report = {
+        'method': prepared['method'],
+        'original_bytes': prepared['original_bytes'],
+        'bytes': prepared['bytes'],
+        'saved_bytes': saved_bytes,
+        'upload_seconds': meter.seconds,
+        'saved_seconds': saved_seconds,
+        'silence': prepared['silence'],
+    }
+    log_perf(
+        f"audio preprocess savings: {saved_bytes / 1e6:.1f}MB, upload {meter.seconds * 1000:.0f}ms"
+        + (f" (est. {saved_seconds * 1000:.0f}ms saved)" if saved_seconds is not None else "")
+    )
+    return report
@@ -1,6 +1,7 @@
 """
 AIプロンプトテンプレート
 """
+import hashlib
 import re
 
 
@@ -21,18 +22,24 @@ def get_transcription_prompt():
 """
 
 
-def get_combined_prompt(transcript):
-    """概要欄とタイトルを同時生成するプロンプト（API節約）"""
-    return f"""
-以下の文字起こしを元に、「概要欄」と「タイトル案3つ」を同時に作成してください。
+def get_segment_transcription_prompt(index, total):
+    """長時間音声を分割した区間の文字起こし用プロンプト"""
+    return get_transcription_prompt() + f"""
+【補足】
+この音声は長い配信を{total}個に分割したうちの{index + 1}番目の区間です。
+前後の区間と一部が重なっていますが、この区間で聞こえる内容をすべて書き起こしてください。
+区間の最初と最後が文の途中で切れていても、補ったり省いたりせずにそのまま書き起こすこと。
+"""
 
-【文字起こし】
-{transcript}
 
-===== 出力形式（この形式を厳守）=====
+def get_transcription_prompt_version():
+    """文字起こしプロンプトのバージョン（内容のハッシュ。変更するとキャッシュ済みの文字起こしは使われない）"""
+    prompt = get_transcription_prompt() + get_segment_transcription_prompt(0, 2)
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
 
----DESCRIPTION_START---
-▼このチャンネルでは
+
+# 概要欄の冒頭の定型文（チャンネル紹介・リンク）
+DESCRIPTION_HEADER = """▼このチャンネルでは
 理学療法士、Webライター、副業、インタビュー企画など、実体験をもとに発信しています。
 "今、挑戦している人"の背中を押せるような内容を目指しています。
 
@@ -41,16 +48,152 @@ https://x.com/kurayota0714
 
 ▪️おもろい図鑑
 https://omoroi-zukan.jp/
+"""
+
+
+# タイトル案の条件（構造化出力の titles）
+_TITLE_RULES = """- titles: タイトル案を3つ（それぞれ30文字以内、キャッチーに。番号は付けない）"""
+
+# 概要欄の本文の条件（構造化出力の formatted_transcript）
+_BODY_RULES = """- formatted_transcript: 概要欄の【AI要約】に載せる本文。文字起こしを話し言葉を残しつつ読みやすく整形した全文
+  （要約ではなく全文を整形する。チャンネル紹介などの定型文は付けない）"""
+
+
+def get_combined_prompt(transcript):
+    """概要欄の本文とタイトルを同時生成するプロンプト（API節約。応答は structured.DESCRIPTION_SCHEMA のJSON）"""
+    return f"""
+以下の文字起こしを元に、概要欄の本文と「タイトル案3つ」を同時に作成してください。
+
+【文字起こし】
+{transcript}
+
+===== 出力（JSON）=====
+{_BODY_RULES}
+{_TITLE_RULES}
+"""
 
-【AI要約】
-（ここに整形した文字起こしを出力。話し言葉を残しつつ読みやすく整形。要約ではなく全文を整形。）
----DESCRIPTION_END---
 
----TITLES_START---
-1. タイトル案1（30文字以内、キャッチーに）
-2. タイトル案2（30文字以内、キャッチーに）
-3. タイトル案3（30文字以内、キャッチーに）
----TITLES_END---
+def get_single_call_prompt():
+    """音声から文字起こし・概要欄の本文・タイトル案を1回で生成するプロンプト（応答は structured.SINGLE_CALL_SCHEMA のJSON）"""
+    return f"""
+この音声ファイルを文字起こしし、その内容を元に概要欄の本文と「タイトル案3つ」も同時に作成してください。
+
+【文字起こしの指示】
+- 話された内容を一言一句漏らさず書き起こす
+- 「えー」「あー」「うーん」などのフィラー（つなぎ言葉）は除去する
+- 言い直しや重複は整理して読みやすくする
+- 段落分けして見やすく整形する
+- 要約はせず、必ず全文を書き起こすこと
+
+===== 出力（JSON）=====
+- transcript: 文字起こしの全文
+{_BODY_RULES}
+{_TITLE_RULES}
+"""
+
+
+def get_summary_prompt(transcript):
+    """短い要約・話題・タイトル案だけを生成するプロンプト（DESCRIPTION_MODE=summary。応答は structured.SUMMARY_SCHEMA のJSON）
+    
+    文字起こしの全文は出力させない（概要欄には transcript_format で整形した文字起こしを差し込む）。
+    """
+    return f"""
+以下の文字起こしを元に、概要欄の冒頭に載せる要約と「タイトル案3つ」を作成してください。
+文字起こしそのものは出力しないでください。
+
+【文字起こし】
+{transcript}
+
+===== 出力（JSON）=====
+- summary: 配信内容の要約（3〜5文。話し手の口調を残し、リスナーが聞きたくなるように）
+- topics: 話題の見出しを3〜6個（それぞれ20文字以内。番号や記号は付けない）
+{_TITLE_RULES}
+"""
+
+
+def get_section_summary_prompt(section, index, total):
+    """長い文字起こしの1区間を要約するプロンプト（map-reduce の map。map_reduce.py 参照）
+    
+    区間の要約をまとめ直す段階（要約の要約）でも使う。応答はテキストのみ（キャッシュにそのまま保存する）。
+    """
+    return f"""
+以下は長い音声配信の文字起こしを{total}個に分けたうちの{index + 1}番目の区間です。
+後で全体の要約とタイトル案を作るため、この区間の内容を要約してください。
+
+【指示】
+- 話題ごとに、話された内容・具体的なエピソード・結論を箇条書き（「・」始まり）で書く
+- 固有名詞・数字は省かずに残す
+- 区間の最初と最後が話の途中で切れていても、補ったり推測したりしない
+- 見出しや前置きは付けず、箇条書きのみを出力する
+
+【文字起こし（{index + 1}番目の区間）】
+{section}
+"""
+
+
+def get_single_call_prompt_version():
+    """1回で生成するプロンプトのバージョン（内容のハッシュ。変更すると single_call でキャッシュした文字起こしは使われない）"""
+    return hashlib.sha1(get_single_call_prompt().encode('utf-8')).hexdigest()[:12]
+
+
+def get_section_summary_prompt_version():
+    """区間の要約プロンプトのバージョン（内容のハッシュ。変更するとキャッシュ済みの区間の要約は使われない）"""
+    prompt = get_section_summary_prompt("", 0, 2)
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
+
+
+def get_reduce_prompt(section_summaries):
+    """区間ごとの要約から、全体の要約・話題・タイトル案を生成するプロンプト（map-reduce の reduce。
+    応答は structured.SUMMARY_SCHEMA のJSON）
+    """
+    sections = "\n\n".join(
+        f"【区間{i}】\n{summary}" for i, summary in enumerate(section_summaries, start=1)
+    )
+    return f"""
+以下は長い音声配信の文字起こしを区間に分け、先頭から順に要約したものです。
+配信全体を通して、概要欄の冒頭に載せる要約と「タイトル案3つ」を作成してください。
+
+{sections}
+
+===== 出力（JSON）=====
+- summary: 配信全体の要約（3〜5文。話し手の口調を残し、リスナーが聞きたくなるように）
+- topics: 配信全体の話題の見出しを3〜6個（それぞれ20文字以内。番号や記号は付けない。配信の順に並べる）
+{_TITLE_RULES}
+"""
+
+
+def get_titles_prompt(transcript, partial=False):
+    """タイトル案3つだけを生成するプロンプト（応答は structured.TITLES_SCHEMA のJSON）
+    
+    概要欄の整形と並行して呼ぶほか、応答のタイトル案が足りない場合にタイトル案だけを作り直すのに使う。
+    partial=True の場合は、文字起こしが配信の冒頭部分であることをプロンプトに書き添える。
+    """
+    note = "\n（文字起こしは配信の冒頭部分です。冒頭から読み取れるテーマでタイトルを付けてください）" if partial else ""
+    return f"""
+以下の文字起こしを元に、音声配信の「タイトル案3つ」を作成してください。{note}
+
+【文字起こし】
+{transcript}
+
+===== 出力（JSON）=====
+{_TITLE_RULES}
+"""
+
+
+def get_format_prompt(text, index):
+    """文字起こしの一部を概要欄の【AI要約】用に整形するプロンプト（文字起こしの途中から順に呼ぶため、全体の個数は渡さない）"""
+    return f"""
+以下は音声配信の文字起こしを先頭から順に区切った{index + 1}番目の部分です。
+概要欄に載せるため、読みやすく整形してください。
+
+【指示】
+- 話し言葉を残しつつ読みやすく整形する
+- 要約ではなく全文を整形する（内容を省略しない）
+- 部分の最初と最後が文の途中で切れていても、補ったり省いたりしない
+- 見出しや前置きは付けず、整形したテキストのみを出力する
+
+【文字起こし（{index + 1}番目の部分）】
+{text}
 """
 
 
@@ -108,33 +251,50 @@ def get_script_prompt(memo, settings, selected_episodes):
 """
 
 
-def search_relevant_transcriptions(memo_text, transcriptions, max_results=2):
-    """メモからキーワードを抽出し、関連する文字起こしを検索（簡易RAG）"""
-    if not transcriptions or not memo_text:
+def _score_transcription(trans, keywords):
+    """キーワードとの一致度（本文・タイトルの出現回数 + タグ一致は3点）"""
+    score = 0
+    content = trans.get('content', '') + ' ' + trans.get('title', '')
+    tags = trans.get('tags', [])
+    
+    for keyword in keywords:
+        if keyword in content:
+            score += content.count(keyword)
+        for tag in tags:
+            if keyword in tag or tag in keyword:
+                score += 3
+    return score
+
+
+def search_relevant_transcriptions(memo_text, transcriptions, max_results=2, archive_pages=None):
+    """メモからキーワードを抽出し、関連する文字起こしを検索（簡易RAG）
+    
+    archive_pages: アーカイブのページ（文字起こしのリスト）を新しい順に返すイテラブル
+                   最近の文字起こしで max_results 件見つからない場合だけ、必要な分を読み進める
+    """
+    if not memo_text or not (transcriptions or archive_pages):
         return []
     
     words = re.split(r'[、。！？\s\n・「」『』（）\(\)]+', memo_text)
     keywords = [w.strip() for w in words if len(w.strip()) >= 2]
     
     if not keywords:
-        return transcriptions[:max_results]
+        return (transcriptions or [])[:max_results]
     
     scored_transcriptions = []
-    for trans in transcriptions:
-        score = 0
-        content = trans.get('content', '') + ' ' + trans.get('title', '')
-        tags = trans.get('tags', [])
-        
-        for keyword in keywords:
-            if keyword in content:
-                score += content.count(keyword)
-            for tag in tags:
-                if keyword in tag or tag in keyword:
-                    score += 3
-        
+    for trans in transcriptions or []:
+        score = _score_transcription(trans, keywords)
         if score > 0:
             scored_transcriptions.append((trans, score))
     
+    for page in archive_pages or []:
+        if len(scored_transcriptions) >= max_results:
+            break
+        for trans in page:
+            score = _score_transcription(trans, keywords)
+            if score > 0:
+                scored_transcriptions.append((trans, score))
+    
     scored_transcriptions.sort(key=lambda x: x[1], reverse=True)
     return [t[0] for t in scored_transcriptions[:max_results]]
 
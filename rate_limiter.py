@@ -0,0 +1,133 @@
+"""
+Gemini呼び出しの流量制御（APIキーごとに、プロセス内の全セッションで共有するトークンバケット）
+
+割り当てはAPIキーごとのため、セッションごとに429を待つのではなく、同じキーを使う呼び出しの合計で
+1分あたりのリクエスト数（GEMINI_RPM）とトークン数（GEMINI_TPM）を超えないよう呼び出しを待たせる。
+別のキーの呼び出しは、別のバケット（get_rate_limiter(api_key)）で数える。
+    acquire(tokens, priority) … 両方のバケットに空きができるまで待つ（priorityの小さい順、同じなら到着順）
+    penalize(seconds)         … 429の再試行ヒントの間、全員の呼び出しを止める
+    settle(estimated, actual) … 見積もりと実際の使用トークン数の差をバケットに反映する
+    refund(estimated)         … 失敗した呼び出し（429・サーバーエラー）の見積もりをトークンのバケットに戻す
+"""
+import streamlit as st
+import heapq
+import itertools
+import threading
+import time
+
+from config import log_perf, GEMINI_RPM, GEMINI_TPM
+
+
+# 優先度（小さいほど先に通す）
+PRIORITY_INTERACTIVE = 0    # 画面で結果を待っている生成
+PRIORITY_BATCH = 10         # まとめて処理
+
+
+class _Bucket:
+    """1分あたり rate_per_minute まで溜まるトークンバケット"""
+    
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.level = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+    
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount):
+        """amount が溜まるまでの秒数"""
+        return max(amount - self.level, 0) / self.rate
+
+
+class RateLimiter:
+    """RPM・TPM の2つのバケットと優先度つきの待ち行列"""
+    
+    def __init__(self, rpm, tpm):
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        self.admitted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth = 0
+    
+    def acquire(self, tokens, priority=PRIORITY_INTERACTIVE):
+        """呼び出しの許可が出るまで待ち、待った秒数を返す"""
+        # バケットの容量を超える見積もりは、満杯になれば通す
+        tokens = min(tokens, self._tokens.capacity)
+        entry = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            while True:
+                now = time.monotonic()
+                self._requests.refill(now)
+                self._tokens.refill(now)
+                if self._queue[0] == entry:
+                    delay = max(
+                        self._blocked_until - now,
+                        self._requests.wait_time(1),
+                        self._tokens.wait_time(tokens)
+                    )
+                    if delay <= 0:
+                        break
+                else:
+                    delay = None   # 先頭が通るまで待つ
+                self._cond.wait(delay)
+            
+            heapq.heappop(self._queue)
+            self._requests.level -= 1
+            self._tokens.level -= tokens
+            waited = time.monotonic() - started
+            self.admitted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._cond.notify_all()
+        
+        if waited >= 0.1:
+            log_perf(f"rate limiter: waited {waited * 1000:.0f}ms (priority {priority}, {tokens} tokens)")
+        return waited
+    
+    def penalize(self, seconds):
+        """サーバーから再試行を求められた場合に、全員の呼び出しを seconds 秒止める"""
+        with self._cond:
+            self.throttled += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+    
+    def settle(self, estimated, actual):
+        """実際の使用トークン数が見積もりと違った分をバケットに反映する（不足分は借りとして残る）"""
+        if actual is None:
+            return
+        with self._cond:
+            self._tokens.level -= actual - min(estimated, self._tokens.capacity)
+            self._cond.notify_all()
+    
+    def refund(self, estimated):
+        """失敗した呼び出しの見積もりを戻す（再試行のたびに acquire で見積もりを差し引き直すため。リクエスト数は戻さない）"""
+        self.settle(estimated, 0)
+    
+    def stats(self):
+        """待ち行列の長さ・待ち時間などの計測値"""
+        with self._cond:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'admitted': self.admitted,
+                'throttled': self.throttled,
+                'avg_wait': self.total_wait / self.admitted if self.admitted else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+
+@st.cache_resource
+def get_rate_limiter(api_key=None):
+    """APIキーごとの Gemini呼び出しの流量制御（プロセス内で共有。キーを持たないスタブのモデルは None で共有）"""
+    return RateLimiter(GEMINI_RPM, GEMINI_TPM)
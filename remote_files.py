@@ -0,0 +1,221 @@
+"""
+Gemini にアップロードした音声ファイルの管理（APIキーごと。プロセス内の全セッションで共有）
+
+同じ内容の音声（SHA-256 が同じ）は、再試行や再生成のたびにアップロードし直さず、アップロード済みのファイルを使う。
+    upload(path, mime_type) … アップロード済みで有効期限内ならそのファイルを返す。無ければアップロードし、
+                               処理中（PROCESSING）の間は REMOTE_FILE_POLL_INTERVAL 秒ごとに状態を確認する
+    sweep()                 … 最後に使ってから REMOTE_FILE_IDLE_SECONDS 秒たったファイルと、サーバー側の
+                               有効期限が近いファイルを削除する（バックグラウンドのスレッドから定期的に呼ぶ）
+削除できなかったファイルや、プロセスの終了で削除されなかったファイルも、サーバー側で48時間後に消える。
+"""
+import hashlib
+import threading
+import time
+
+from config import (
+    log_perf,
+    REMOTE_FILE_IDLE_SECONDS,
+    REMOTE_FILE_EXPIRY_MARGIN_SECONDS,
+    REMOTE_FILE_POLL_INTERVAL,
+    REMOTE_FILE_POLL_TIMEOUT,
+    REMOTE_FILE_SWEEP_INTERVAL
+)
+
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+# スレッドごとの、最後の upload が再利用だったか（last_upload_reused 参照）
+_local = threading.local()
+# サーバー側の有効期限（ファイルに期限が無い場合の既定）
+_DEFAULT_LIFETIME_SECONDS = 48 * 60 * 60
+
+
+def file_digest(path):
+    """ファイルの内容の SHA-256（チャンクごとに読み込む）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def last_upload_reused():
+    """このスレッドで最後に呼んだ upload がアップロード済みのファイルの再利用だったか
+    
+    アップロード時間の計測（preprocess.UploadMeter）から再利用を除くために使う。
+    """
+    return getattr(_local, 'reused', False)
+
+
+def _state(remote_file):
+    """ファイルの処理状態（"PROCESSING" / "ACTIVE" / "FAILED"。状態を持たない場合は None）"""
+    state = getattr(remote_file, 'state', None)
+    return getattr(state, 'name', state)
+
+
+def _expires_at(remote_file):
+    expiration = getattr(remote_file, 'expiration_time', None)
+    if expiration is not None and hasattr(expiration, 'timestamp'):
+        return expiration.timestamp()
+    return time.time() + _DEFAULT_LIFETIME_SECONDS
+
+
+class RemoteFileManager:
+    """内容のハッシュ → アップロード済みのファイル の対応を持ち、再利用と削除を行う
+    
+    create_file(path, mime_type) / get_file(name) / delete_file(name) は GeminiClient から渡す
+    （スタブに差し替えられるよう、SDKは直接呼ばない）。
+    """
+    
+    def __init__(self, create_file, get_file, delete_file):
+        self._create_file = create_file
+        self._get_file = get_file
+        self._delete_file = delete_file
+        self._entries = {}
+        # 内容のハッシュ → {'lock', 'users'}（upload 中・待機中のスレッドがいる間だけ残す）
+        self._uploading = {}
+        self._trash = []
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.uploads = 0
+        self.reused = 0
+        self.deleted = 0
+    
+    def upload(self, path, mime_type=None):
+        """path の内容のファイルを返す（アップロード済みで使えるなら再利用する）"""
+        digest = file_digest(path)
+        with self._lock:
+            uploading = self._uploading.setdefault(digest, {'lock': threading.Lock(), 'users': 0})
+            uploading['users'] += 1
+        
+        # 同じ内容を同時にアップロードしない（後から来た方は先の結果を再利用する）
+        # ロックは使うスレッドがいなくなった時にだけ外す（使用中に外すと、別のロックで同時にアップロードしてしまう）
+        try:
+            with uploading['lock']:
+                return self._upload(digest, path, mime_type)
+        finally:
+            with self._lock:
+                uploading['users'] -= 1
+                if uploading['users'] == 0:
+                    del self._uploading[digest]
+    
+    def _upload(self, digest, path, mime_type):
+        """upload の本体（同じ内容のロックを持った状態で呼ぶ）"""
+        remote_file = self._reusable(digest)
+        _local.reused = remote_file is not None
+        if remote_file is not None:
+            with self._lock:
+                self.reused += 1
+            log_perf(f"remote file reused: {remote_file.name}")
+            return remote_file
+        
+        started = time.perf_counter()
+        remote_file = self._wait_active(self._create_file(path, mime_type))
+        with self._lock:
+            self._entries[digest] = {
+                'file': remote_file,
+                'last_used': time.time(),
+                'expires_at': _expires_at(remote_file),
+            }
+            self.uploads += 1
+        self._start_sweeper()
+        log_perf(f"remote file uploaded: {remote_file.name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return remote_file
+    
+    def _reusable(self, digest):
+        """再利用できるファイル（期限が近い・サーバー側で消えている場合は None）"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry['expires_at'] - time.time() < REMOTE_FILE_EXPIRY_MARGIN_SECONDS:
+                self._trash.append(self._entries.pop(digest)['file'].name)
+                return None
+        
+        try:
+            remote_file = self._get_file(entry['file'].name)
+        except Exception as e:
+            log_perf(f"remote file {entry['file'].name} unavailable, uploading again: {e}")
+            remote_file = None
+        with self._lock:
+            if self._entries.get(digest) is not entry:
+                # 確認している間に sweep が削除した
+                return None
+            if remote_file is None or _state(remote_file) not in (None, "ACTIVE"):
+                self._entries.pop(digest, None)
+                if remote_file is not None:
+                    self._trash.append(remote_file.name)
+                return None
+            entry['last_used'] = time.time()
+        return entry['file']
+    
+    def _wait_active(self, remote_file):
+        """処理中（PROCESSING）のファイルが使えるようになるまで待つ（REMOTE_FILE_POLL_TIMEOUT 秒まで）"""
+        deadline = time.monotonic() + REMOTE_FILE_POLL_TIMEOUT
+        while _state(remote_file) == "PROCESSING":
+            if time.monotonic() >= deadline:
+                self._discard(remote_file)
+                raise TimeoutError(
+                    f"アップロードしたファイルの処理が{REMOTE_FILE_POLL_TIMEOUT}秒以内に終わりませんでした: {remote_file.name}"
+                )
+            time.sleep(REMOTE_FILE_POLL_INTERVAL)
+            remote_file = self._get_file(remote_file.name)
+        
+        if _state(remote_file) == "FAILED":
+            self._discard(remote_file)
+            raise RuntimeError(f"アップロードしたファイルの処理に失敗しました: {remote_file.name}")
+        return remote_file
+    
+    def _discard(self, remote_file):
+        with self._lock:
+            self._trash.append(remote_file.name)
+    
+    def _start_sweeper(self):
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="remote-files", daemon=True)
+        self._sweeper.start()
+    
+    def _sweep_loop(self):
+        while True:
+            time.sleep(REMOTE_FILE_SWEEP_INTERVAL)
+            self.sweep()
+    
+    def sweep(self, now=None):
+        """使われなくなったファイル・期限が近いファイルを削除し、削除した数を返す"""
+        now = now or time.time()
+        with self._lock:
+            expired = [
+                digest for digest, entry in self._entries.items()
+                if now - entry['last_used'] >= REMOTE_FILE_IDLE_SECONDS
+                or entry['expires_at'] - now < REMOTE_FILE_EXPIRY_MARGIN_SECONDS
+            ]
+            names = self._trash + [self._entries.pop(digest)['file'].name for digest in expired]
+            self._trash = []
+        
+        deleted = 0
+        for name in names:
+            try:
+                self._delete_file(name)
+                deleted += 1
+            except Exception as e:
+                # 削除できなくてもサーバー側の有効期限で消えるため、やり直さない
+                log_perf(f"remote file delete failed: {name}: {e}")
+        if names:
+            log_perf(f"remote files swept: {deleted}/{len(names)} deleted")
+        with self._lock:
+            self.deleted += deleted
+        return deleted
+    
+    def stats(self):
+        """アップロード・再利用・削除の回数と、保持しているファイル数"""
+        with self._lock:
+            return {
+                'files': len(self._entries),
+                'uploads': self.uploads,
+                'reused': self.reused,
+                'deleted': self.deleted,
+            }
@@ -1,216 +1,704 @@
 """
-LocalStorage 操作関連の関数
+データ永続化の窓口（UIからはこのモジュールの関数だけを使う）
 注意: streamlit_js_evalは固定キーを使用すること（動的キーは無限ループの原因）
+
+実際の保存先は config.STORAGE_BACKEND で選択する（backends/ 参照）。
+    "local"  … ブラウザ LocalStorage（既定）
+    "sqlite" … サーバー側 SQLite
+
+レコードは「メタデータ」と「本文」に分けて保存する。
+    メタデータ … id・タイトル・日付・タグ・文字数など（起動時に一括で読み込む軽量な索引）
+    本文       … 文字起こし・概要欄・台本など（初めて必要になった時に読み込み、LRUで保持）
+    ブロブ     … 文字起こし・台本のテキスト（SHA-256で参照し、同じ内容は1回だけ保存する）
+session_stateのリスト（history / saved_scripts / transcriptions）はメタデータのみを持つ。
+変更のあったレコードだけを書き込むため、内容ハッシュで差分を追跡する。
+
+レコードはホット層とアーカイブ層に分ける。
+    ホット層     … 新しい HOT_RECORD_LIMIT 件（session_stateのリスト）
+    アーカイブ層 … あふれた古いレコードのメタデータ（ARCHIVE_PAGE_SIZE 件ずつのページ）
+                   索引（先頭ページ + 封印済みページの一覧）だけを起動時に読み込み、
+                   封印済みページは一覧・検索で必要になった時に読み込む（読み取り専用）
+
+LocalStorage への書き込みはブラウザ側で非同期に行われ、直後の st.rerun() で破棄されることもある。
+書き込みごとの完了を次の実行以降に確認し（_confirm_writes）、完了を確認できなかった内容は未保存に戻して送り直す。
 """
 import streamlit as st
 import json
+import hashlib
+import uuid
+from collections import OrderedDict
 from datetime import datetime
-from streamlit_js_eval import streamlit_js_eval
 
+from backends import LocalStorageBackend, SQLiteBackend
+from backends.sqlite import DEFAULT_NAMESPACE
+from backends.base import DATE_FIELDS
 from config import (
-    STORAGE_KEY,
-    SCRIPT_STORAGE_KEY,
-    TRANSCRIPTION_STORAGE_KEY,
-    SETTINGS_STORAGE_KEY,
+    log_perf,
+    STORAGE_BACKEND,
+    SQLITE_DB_PATH,
+    WORKSPACE_QUERY_PARAM,
+    BODY_CACHE_SIZE,
+    HOT_RECORD_LIMIT,
+    ARCHIVE_PAGE_SIZE,
     get_default_settings
 )
 
 
+# コレクション名 → session_stateのキー
+COLLECTIONS = {
+    'history': 'history',
+    'scripts': 'saved_scripts',
+    'transcriptions': 'transcriptions',
+}
+
+# 本文として遅延読み込みするフィールド（それ以外はメタデータ）
+BODY_FIELDS = {
+    'history': ('titles', 'description', 'transcript'),
+    'scripts': ('content',),
+    'transcriptions': ('content',),
+}
+
+# 本文のうち、内容ハッシュで参照するブロブとして保存するフィールド
+# 同じ文字起こしが履歴と文字起こしデータの両方にあっても、保存・送信は1回で済む
+BLOB_FIELDS = {
+    'history': ('transcript',),
+    'scripts': ('content',),
+    'transcriptions': ('content',),
+}
+
+# メタデータの 'size'（文字数）を計算するフィールド
+_SIZE_FIELDS = {
+    'history': 'transcript',
+    'scripts': 'content',
+    'transcriptions': 'content',
+}
+
+_LOADED_FLAGS = ('history_loaded', 'settings_loaded', 'scripts_loaded', 'transcriptions_loaded')
+
+# 完了を確認できなかった書き込みを続けて送り直す回数（超えたら次の保存まで待つ）
+_WRITE_ATTEMPTS = 3
+# 実行中のまま終わらない書き込みの完了を確認する回数（超えたら失敗とみなす）
+_CONFIRM_ROUNDS = 5
+
+
+@st.cache_resource
+def _shared_backend():
+    """設定に応じたストレージバックエンド（プロセス内で共有）"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_DB_PATH)
+    return LocalStorageBackend()
+
+
+def _workspace():
+    """SQLiteの行を分ける名前空間（URLの ?workspace=…。指定が無ければ DEFAULT_NAMESPACE）
+    
+    データを分けたい場合だけ ?workspace= を付けて開く（付けなければ、ブックマーク・新しいタブでも同じデータを開く）。
+    """
+    return st.query_params.get(WORKSPACE_QUERY_PARAM) or DEFAULT_NAMESPACE
+
+
+def get_backend():
+    """このセッションのストレージバックエンドを返す（SQLiteはURLの workspace ごとに行を分ける）"""
+    if STORAGE_BACKEND != "sqlite":
+        return _shared_backend()
+    if 'storage_backend' not in st.session_state:
+        st.session_state.storage_backend = _shared_backend().with_namespace(_workspace())
+    return st.session_state.storage_backend
+
+
+def _content_hash(value):
+    """レコード内容のハッシュ（差分検出用）"""
+    serialized = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def _mark_persisted(name, records):
+    """現在のレコードを保存済みとして記録する"""
+    st.session_state.persisted_hashes[name] = {r['id']: _content_hash(r) for r in records}
+    st.session_state.persisted_order[name] = [r['id'] for r in records]
+
+
 # =============================================================================
-# History Storage
+# Metadata / Body
 # =============================================================================
 
-def load_history_from_storage():
-    """LocalStorageから履歴を読み込む（初回のみ）"""
-    if st.session_state.get('history_loaded', False):
-        return
+def _ensure_ids(records):
+    """IDの無いレコード（旧形式の履歴など）にIDを付与する"""
+    for record in records:
+        if not record.get('id'):
+            record['id'] = str(uuid.uuid4())
+
+
+def _blob_hash(text):
+    """本文テキストの内容アドレス"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def split_record(name, record):
+    """レコードをメタデータ・本文・ブロブに分ける
     
-    # 固定キーを使用
-    stored_data = streamlit_js_eval(
-        js_expressions=f"localStorage.getItem('{STORAGE_KEY}')",
-        key="load_history_fixed"
-    )
+    BLOB_FIELDS のテキストはハッシュで参照し（meta['blob_refs']）、同じ内容は1回だけ保存する。
+    戻り値: (meta, body, blobs)  blobs = {hash: text}
+    """
+    blob_fields = BLOB_FIELDS.get(name, ())
+    body = {field: record.get(field, '') for field in BODY_FIELDS[name] if field not in blob_fields}
+    blobs = {}
+    blob_refs = {}
+    for field in blob_fields:
+        text = record.get(field) or ''
+        blob_refs[field] = _blob_hash(text)
+        blobs[blob_refs[field]] = text
     
-    # None = JSがまだ実行されていない → 次のリロードを待つ
-    if stored_data is None:
-        return
+    meta = {k: v for k, v in record.items() if k not in BODY_FIELDS[name]}
+    meta['size'] = len(record.get(_SIZE_FIELDS[name]) or '')
+    meta['body_hash'] = _content_hash(body)
+    if blob_refs:
+        meta['blob_refs'] = blob_refs
+    return meta, body, blobs
+
+
+def _body_cache():
+    if 'body_cache' not in st.session_state:
+        st.session_state.body_cache = OrderedDict()
+    return st.session_state.body_cache
+
+
+def _cache_body(name, record_id, body):
+    """本文をLRUに入れる（上限を超えたら古いものから捨てる）"""
+    cache = _body_cache()
+    cache[(name, record_id)] = body
+    cache.move_to_end((name, record_id))
+    while len(cache) > BODY_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _find_meta(name, record_id, archived=True):
+    """IDからメタデータを探す（archived=True の場合は読み込み済みのアーカイブも探す）"""
+    for meta in st.session_state.get(COLLECTIONS[name], []):
+        if meta.get('id') == record_id:
+            return meta
+    if archived:
+        for meta in _loaded_archive_metas(name):
+            if meta.get('id') == record_id:
+                return meta
+    return None
+
+
+def _short_hash(parts):
+    """読み込み対象を識別する短いハッシュ（LocalStorageの読み込みキー用）"""
+    return hashlib.sha1(",".join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def _has_stored_body(name, meta):
+    """ブロブ以外に保存された本文があるか（旧形式のレコードは本文にすべて含む）"""
+    if 'blob_refs' not in meta:
+        return True
+    return any(field not in BLOB_FIELDS.get(name, ()) for field in BODY_FIELDS[name])
+
+
+def get_bodies(name, record_ids, cache=True):
+    """複数レコードの本文を読み込む（ブロブ参照は解決済みで返す）
     
-    # "null" or "" = LocalStorageが空 → フラグを立てて終了
-    if stored_data == "null" or stored_data == "":
-        st.session_state.history_loaded = True
-        return
+    戻り値: {id: body}  LocalStorageの応答待ちの場合は None
+    cache=False の場合はLRUに入れない（検索などの一時的な利用向け）
+    """
+    bodies = {}
+    missing = []
+    for record_id in record_ids:
+        cached = _body_cache().get((name, record_id))
+        if cached is not None:
+            bodies[record_id] = cached
+            if cache:
+                _body_cache().move_to_end((name, record_id))
+        else:
+            meta = _find_meta(name, record_id)
+            if meta is not None:
+                missing.append(meta)
     
-    # データがある場合は読み込み
-    try:
-        loaded_history = json.loads(stored_data)
-        if isinstance(loaded_history, list):
-            st.session_state.history = loaded_history
-    except (json.JSONDecodeError, TypeError):
-        pass
+    if not missing:
+        return bodies
     
-    st.session_state.history_loaded = True
+    # 本文とブロブは同じ実行内で要求するため、LocalStorageでも待ちは1回で済む
+    body_metas = [m for m in missing if _has_stored_body(name, m)]
+    stored_bodies = {}
+    if body_metas:
+        stored_bodies = get_backend().load_bodies(
+            name,
+            [m['id'] for m in body_metas],
+            _short_hash(f"{m['id']}:{m.get('body_hash', '')}" for m in body_metas)
+        )
+    
+    blob_hashes = sorted({h for m in missing for h in (m.get('blob_refs') or {}).values()})
+    blobs = {}
+    if blob_hashes:
+        blobs = get_backend().load_blobs(blob_hashes, _short_hash(blob_hashes))
+    
+    if stored_bodies is None or blobs is None:
+        return None
+    
+    for meta in missing:
+        body = {field: '' for field in BODY_FIELDS[name]}
+        body.update(stored_bodies.get(meta['id'], {}))
+        for field, blob_hash in (meta.get('blob_refs') or {}).items():
+            body[field] = blobs.get(blob_hash, '')
+        bodies[meta['id']] = body
+        if cache:
+            _cache_body(name, meta['id'], body)
+    log_perf(f"storage lazy load {name}: {len(missing)} bodies, {len(blob_hashes)} blobs")
+    
+    return bodies
 
 
-def save_history_to_storage():
-    """LocalStorageに履歴を保存する"""
-    if 'history' in st.session_state and st.session_state.history:
-        history_json = json.dumps(st.session_state.history, ensure_ascii=False)
-        escaped_json = history_json.replace('\\', '\\\\').replace("'", "\\'")
-        streamlit_js_eval(
-            js_expressions=f"localStorage.setItem('{STORAGE_KEY}', '{escaped_json}')",
-            key=f"save_history_{len(st.session_state.history)}_{datetime.now().strftime('%H%M%S')}"
-        )
+def get_body(name, record_id):
+    """1レコードの本文を返す（読み込み待ちの場合は None）"""
+    bodies = get_bodies(name, [record_id])
+    if bodies is None:
+        return None
+    return bodies.get(record_id, {field: '' for field in BODY_FIELDS[name]})
 
 
-def clear_storage():
-    """LocalStorageの履歴をクリア"""
-    streamlit_js_eval(
-        js_expressions=f"localStorage.removeItem('{STORAGE_KEY}')",
-        key=f"clear_history_{datetime.now().strftime('%H%M%S')}"
-    )
+def add_record(name, record):
+    """レコードを先頭に追加して保存する（HOT_RECORD_LIMITを超えた古いものはアーカイブ層へ移す）"""
+    state_key = COLLECTIONS[name]
+    _ensure_ids([record])
+    meta, body, blobs = split_record(name, record)
+    _cache_body(name, meta['id'], {field: record.get(field, '') for field in BODY_FIELDS[name]})
+    
+    st.session_state[state_key].insert(0, meta)
+    overflow = st.session_state[state_key][HOT_RECORD_LIMIT:]
+    if overflow:
+        st.session_state[state_key] = st.session_state[state_key][:HOT_RECORD_LIMIT]
+    
+    _persist_collection(name, bodies={meta['id']: body}, blobs=blobs, archived=overflow)
+    return meta
+
+
+def update_body(name, record_id, **fields):
+    """本文の一部を更新して保存する（本文が未読み込み・アーカイブ済みの場合は False）"""
+    meta = _find_meta(name, record_id, archived=False)
+    body = get_body(name, record_id)
+    if meta is None or body is None:
+        return False
+    
+    full_body = {**body, **fields}
+    new_meta, stored_body, blobs = split_record(name, {**meta, **full_body})
+    if new_meta == meta:
+        return True
+    
+    # session_stateのリストが同じdictを参照しているため、その場で更新する
+    meta.clear()
+    meta.update(new_meta)
+    _cache_body(name, record_id, full_body)
+    _persist_collection(name, bodies={record_id: stored_body}, blobs=blobs)
+    return True
 
 
 # =============================================================================
-# Script Storage
+# Archive Tier
 # =============================================================================
 
-def load_saved_scripts():
-    """LocalStorageから台本を読み込む（初回のみ）"""
-    if st.session_state.get('scripts_loaded', False):
-        return
+def _empty_archive():
+    """アーカイブ層の索引
     
-    stored_data = streamlit_js_eval(
-        js_expressions=f"localStorage.getItem('{SCRIPT_STORAGE_KEY}')",
-        key="load_scripts_fixed"
-    )
+    head  … 封印前の先頭ページ（新しい順。起動時に読み込む）
+    pages … 封印済みページの一覧（新しい順）{'no', 'count', 'top', 'first', 'last'}
+    next  … 次に封印するページの番号
+    blobs … アーカイブのレコードが参照するブロブ（未読み込みのページがあってもGCで消さないため）
+    """
+    return {'head': [], 'pages': [], 'next': 0, 'blobs': []}
+
+
+def _archive_index():
+    """アーカイブ層の索引 {name: archive}"""
+    if 'archive_index' not in st.session_state:
+        st.session_state.archive_index = {}
+    return st.session_state.archive_index
+
+
+def _archive(name):
+    if name not in _archive_index():
+        _archive_index()[name] = _empty_archive()
+    return _archive_index()[name]
+
+
+def _archive_pages():
+    """読み込み済みの封印済みページ {(name, no): metas}"""
+    if 'archive_pages' not in st.session_state:
+        st.session_state.archive_pages = {}
+    return st.session_state.archive_pages
+
+
+def _loaded_archive_metas(name):
+    yield from _archive(name)['head']
+    for (page_name, _), page in _archive_pages().items():
+        if page_name == name:
+            yield from page
+
+
+def _archive_records(name, metas):
+    """ホット層からあふれたレコード（新しい順）をアーカイブ層の先頭へ移す
     
-    if stored_data is None:
-        return
+    先頭ページが ARCHIVE_PAGE_SIZE 件に達したら古い側を封印済みページとして切り出す。
+    戻り値: backend.write_records に渡す archive 引数
+    """
+    archive = _archive(name)
+    date_field = DATE_FIELDS[name]
+    archive['head'] = list(metas) + archive['head']
     
-    if stored_data == "null" or stored_data == "":
-        st.session_state.scripts_loaded = True
-        return
+    sealed = {}
+    while len(archive['head']) >= ARCHIVE_PAGE_SIZE:
+        page = archive['head'][-ARCHIVE_PAGE_SIZE:]
+        archive['head'] = archive['head'][:-ARCHIVE_PAGE_SIZE]
+        page_no = archive['next']
+        archive['next'] += 1
+        archive['pages'].insert(0, {
+            'no': page_no,
+            'count': len(page),
+            'top': page[0]['id'],
+            'first': page[-1].get(date_field, ''),
+            'last': page[0].get(date_field, ''),
+        })
+        sealed[page_no] = page
+        _archive_pages()[(name, page_no)] = page
     
-    try:
-        loaded_scripts = json.loads(stored_data)
-        if isinstance(loaded_scripts, list):
-            st.session_state.saved_scripts = loaded_scripts
-    except (json.JSONDecodeError, TypeError):
-        pass
+    refs = set(archive['blobs'])
+    for meta in metas:
+        refs.update((meta.get('blob_refs') or {}).values())
+    archive['blobs'] = sorted(refs)
     
-    st.session_state.scripts_loaded = True
+    log_perf(f"storage archive {name}: {len(metas)} moved, {len(sealed)} pages sealed")
+    return {'index': archive, 'pages': sealed, 'ids': [m['id'] for m in metas]}
 
 
-def save_scripts_to_storage():
-    """LocalStorageに台本を保存する"""
-    if 'saved_scripts' in st.session_state and st.session_state.saved_scripts:
-        scripts_json = json.dumps(st.session_state.saved_scripts, ensure_ascii=False)
-        escaped_json = scripts_json.replace('\\', '\\\\').replace("'", "\\'")
-        streamlit_js_eval(
-            js_expressions=f"localStorage.setItem('{SCRIPT_STORAGE_KEY}', '{escaped_json}')",
-            key=f"save_scripts_{len(st.session_state.saved_scripts)}_{datetime.now().strftime('%H%M%S')}"
-        )
+def archive_count(name):
+    """アーカイブ層のレコード数"""
+    archive = _archive(name)
+    return len(archive['head']) + sum(page['count'] for page in archive['pages'])
 
 
-def clear_scripts_storage():
-    """台本履歴をクリア"""
-    streamlit_js_eval(
-        js_expressions=f"localStorage.removeItem('{SCRIPT_STORAGE_KEY}')",
-        key=f"clear_scripts_{datetime.now().strftime('%H%M%S')}"
-    )
+def archive_page_count(name):
+    """アーカイブ層のページ数（先頭ページを含む）"""
+    archive = _archive(name)
+    return len(archive['pages']) + (1 if archive['head'] else 0)
+
+
+def get_archive_page(name, page_index):
+    """アーカイブの page_index 番目のページ（新しい順）のメタデータを返す
+    
+    戻り値: list  読み込み待ちの場合は None、範囲外の場合は []
+    """
+    archive = _archive(name)
+    if archive['head']:
+        if page_index == 0:
+            return archive['head']
+        page_index -= 1
+    if page_index >= len(archive['pages']):
+        return []
+    
+    page = archive['pages'][page_index]
+    loaded = _archive_pages().get((name, page['no']))
+    if loaded is None:
+        loaded = get_backend().load_archive_page(name, page['no'], _short_hash([str(page['no']), page['top']]))
+        if loaded is None:
+            return None
+        _archive_pages()[(name, page['no'])] = loaded
+        log_perf(f"storage archive page {name}#{page['no']}: {len(loaded)} records")
+    return loaded
+
+
+def iter_archive(name, max_pages=None, with_bodies=False, on_pending=None):
+    """アーカイブを新しい順にページ単位で返す（読み込み待ちのページに達したら終わる）
+    
+    with_bodies=True の場合は本文を結合したレコードを返す（LRUには入れない）
+    on_pending(): 読み込み待ちのページに達して終わる場合に呼ぶ
+    """
+    page_total = archive_page_count(name)
+    if max_pages is not None:
+        page_total = min(page_total, max_pages)
+    
+    for page_index in range(page_total):
+        page = get_archive_page(name, page_index)
+        if page is None:
+            if on_pending is not None:
+                on_pending()
+            return
+        if with_bodies:
+            bodies = get_bodies(name, [m['id'] for m in page], cache=False)
+            if bodies is None:
+                if on_pending is not None:
+                    on_pending()
+                return
+            page = [{**m, **bodies.get(m['id'], {})} for m in page]
+        yield page
 
 
 # =============================================================================
-# Transcription Storage
+# Blob Store
 # =============================================================================
 
-def load_transcriptions():
-    """LocalStorageから文字起こしを読み込む（初回のみ）"""
-    if st.session_state.get('transcriptions_loaded', False):
+def _referenced_blobs():
+    """ホット層のメタデータとアーカイブ層の索引から参照されているブロブ"""
+    refs = set()
+    for name, state_key in COLLECTIONS.items():
+        for meta in st.session_state.get(state_key, []):
+            refs.update((meta.get('blob_refs') or {}).values())
+        refs.update(_archive(name)['blobs'])
+    return refs
+
+
+def _new_blobs(blobs):
+    """保存済みでないブロブだけを返す（同じ文字起こしは1回だけ送る）"""
+    known = st.session_state.known_blobs
+    return {h: text for h, text in (blobs or {}).items() if h not in known}
+
+
+def _collect_garbage_blobs():
+    """どのレコードからも参照されなくなったブロブを削除する"""
+    known = st.session_state.known_blobs
+    garbage = known - _referenced_blobs()
+    if garbage:
+        get_backend().delete_blobs(sorted(garbage))
+        known -= garbage
+
+
+# =============================================================================
+# Record Persistence
+# =============================================================================
+
+def _persist_collection(name, bodies=None, blobs=None, migrate=False, archived=None, attempt=1):
+    """変更のあったメタデータ・本文・ブロブと並び順だけをバックエンドへ書き込む
+    
+    archived: ホット層から外してアーカイブ層へ移すメタデータ（本文は削除しない）
+    前の書き込みで保存を確認できなかった本文・ブロブ・アーカイブ（_mark_unsaved）も一緒に書き込む。
+    attempt: 送り直しの回数（_confirm_writes 参照）
+    """
+    records = st.session_state.get(COLLECTIONS[name], [])
+    unsaved = st.session_state.unsaved_writes.pop(name, None)
+    
+    persisted = st.session_state.persisted_hashes.get(name, {})
+    current = {r['id']: _content_hash(r) for r in records}
+    order = [r['id'] for r in records]
+    archived_ids = {m['id'] for m in archived or []}
+    
+    changed = [r for r in records if persisted.get(r['id']) != current[r['id']]]
+    deleted = [
+        record_id for record_id in persisted
+        if record_id not in current and record_id not in archived_ids
+    ]
+    order_changed = order != st.session_state.persisted_order.get(name)
+    
+    if not changed and not deleted and not order_changed and not migrate and not archived and not unsaved:
         return
     
-    stored_data = streamlit_js_eval(
-        js_expressions=f"localStorage.getItem('{TRANSCRIPTION_STORAGE_KEY}')",
-        key="load_transcriptions_fixed"
+    archive = _archive_records(name, archived) if archived else None
+    if unsaved:
+        bodies = {**_current_bodies(name, unsaved['bodies']), **(bodies or {})}
+        blobs = {**unsaved['blobs'], **(blobs or {})}
+        archive = _merge_archive(unsaved['archive'], archive)
+    new_blobs = _new_blobs(blobs)
+    bodies = {record_id: body for record_id, body in (bodies or {}).items() if record_id in current}
+    write_id = get_backend().write_records(
+        name, changed, bodies, deleted, records,
+        blobs=new_blobs, migrate=migrate, archive=archive
     )
+    _track_write(write_id, name, attempt, bodies=bodies, blobs=new_blobs, archive=archive, deleted=deleted)
+    st.session_state.known_blobs.update(new_blobs)
     
-    if stored_data is None:
-        return
+    for record_id in deleted:
+        _body_cache().pop((name, record_id), None)
+    if deleted:
+        _collect_garbage_blobs()
     
-    if stored_data == "null" or stored_data == "":
-        st.session_state.transcriptions_loaded = True
+    st.session_state.persisted_hashes[name] = current
+    st.session_state.persisted_order[name] = order
+    log_perf(
+        f"storage persist {name}: {len(changed)} meta / {len(bodies)} bodies / {len(new_blobs)} blobs written, "
+        f"{len(deleted)} removed"
+    )
+
+
+def _clear_collection(name):
+    """コレクションのレコードをすべて削除する"""
+    get_backend().clear(name)
+    pending = st.session_state.pending_writes
+    for write_id in [w for w, entry in pending.items() if entry['name'] == name]:
+        del pending[write_id]
+    st.session_state.unsaved_writes.pop(name, None)
+    for key in [k for k in _body_cache() if k[0] == name]:
+        del _body_cache()[key]
+    for key in [k for k in _archive_pages() if k[0] == name]:
+        del _archive_pages()[key]
+    _archive_index()[name] = _empty_archive()
+    st.session_state.persisted_hashes[name] = {}
+    st.session_state.persisted_order[name] = []
+    _collect_garbage_blobs()
+
+
+# =============================================================================
+# Write Confirmation
+# =============================================================================
+
+def _track_write(write_id, name, attempt, bodies=None, blobs=None, archive=None, deleted=()):
+    """完了を確認するまで、書き込んだ内容を保持する（name が None の場合は設定。write_id が None なら書き込み済み）"""
+    if write_id is None:
+        return
+    st.session_state.pending_writes[write_id] = {
+        'name': name,
+        'attempt': attempt,
+        'rounds': 0,
+        'bodies': bodies or {},
+        'blobs': blobs or {},
+        'archive': archive,
+        'deleted': list(deleted),
+    }
+
+
+def _current_bodies(name, bodies):
+    """送り直す本文のうち、その後に更新されていないものだけ（古い本文で新しい本文を上書きしない）"""
+    current = {}
+    for record_id, body in bodies.items():
+        meta = _find_meta(name, record_id)
+        if meta is not None and meta.get('body_hash') == _content_hash(body):
+            current[record_id] = body
+    return current
+
+
+def _merge_archive(older, newer):
+    """送り直すアーカイブの書き込みをまとめる（索引は session_state の最新のものを指している）"""
+    if older is None or newer is None:
+        return newer or older
+    return {**newer, 'pages': {**older['pages'], **newer['pages']}, 'ids': older['ids'] + newer['ids']}
+
+
+def _mark_unsaved(entry):
+    """保存を確認できなかった書き込みを未保存に戻す（次の _persist_collection で書き込み直す）"""
+    name = entry['name']
+    if name is None:
+        st.session_state.persisted_settings_hash = None
         return
     
-    try:
-        loaded_transcriptions = json.loads(stored_data)
-        if isinstance(loaded_transcriptions, list):
-            st.session_state.transcriptions = loaded_transcriptions
-    except (json.JSONDecodeError, TypeError):
-        pass
+    hashes = st.session_state.persisted_hashes.setdefault(name, {})
+    for record_id in entry['bodies']:
+        hashes.pop(record_id, None)
+    for record_id in entry['deleted']:
+        # 保存済みとして残し、現在のレコードに無いため次の保存で削除し直す
+        hashes[record_id] = None
+    # 索引（全メタデータ・並び順）も書き込み直す
+    st.session_state.persisted_order[name] = None
+    st.session_state.known_blobs -= set(entry['blobs'])
     
-    st.session_state.transcriptions_loaded = True
+    unsaved = st.session_state.unsaved_writes.setdefault(name, {'bodies': {}, 'blobs': {}, 'archive': None})
+    unsaved['bodies'].update(entry['bodies'])
+    unsaved['blobs'].update(entry['blobs'])
+    unsaved['archive'] = _merge_archive(unsaved['archive'], entry['archive'])
+
+
+def _confirm_writes():
+    """前の実行までの書き込みの完了を確認し、完了を確認できなかった内容を送り直す"""
+    pending = st.session_state.pending_writes
+    # 結果を処理したら、残り（送り直した書き込みを含む）の確認を次の回として要求しておく
+    # （新しい回の読み込みはブラウザの応答待ちになり、応答が届くと次の実行が始まる）
+    for _ in range(2):
+        if not pending:
+            return
+        write_ids = sorted(pending)
+        round_no = st.session_state.write_confirm_round
+        results = get_backend().confirm_writes(write_ids, _short_hash(write_ids + [str(round_no)]))
+        # None = ブラウザの応答待ち → 次の実行で確認する
+        if results is None:
+            return
+        st.session_state.write_confirm_round = round_no + 1
+        
+        resend = {}
+        for write_id in write_ids:
+            entry = pending[write_id]
+            confirmed = results.get(write_id)
+            if confirmed is None:
+                entry['rounds'] += 1
+                if entry['rounds'] < _CONFIRM_ROUNDS:
+                    continue
+            del pending[write_id]
+            if confirmed:
+                continue
+            
+            _mark_unsaved(entry)
+            target = entry['name'] or 'settings'
+            if entry['attempt'] >= _WRITE_ATTEMPTS:
+                log_perf(f"storage write {write_id} ({target}) not confirmed, giving up until the next save")
+                st.toast(f"⚠️ ブラウザへの保存に失敗しました（{target}）。次に保存する時にもう一度書き込みます。")
+            else:
+                log_perf(f"storage write {write_id} ({target}) not confirmed, writing again")
+                resend[entry['name']] = max(resend.get(entry['name'], 0), entry['attempt'] + 1)
+        
+        for name, attempt in resend.items():
+            if name is None:
+                _save_settings(attempt)
+            else:
+                _persist_collection(name, attempt=attempt)
+
+
+# =============================================================================
+# History Storage
+# =============================================================================
+
+def save_history_to_storage():
+    """履歴を保存する（変更分のみ）"""
+    _persist_collection('history')
 
 
+def clear_storage():
+    """保存済みの履歴をクリア"""
+    _clear_collection('history')
+
+
+# =============================================================================
+# Script Storage
+# =============================================================================
+
+def save_scripts_to_storage():
+    """台本を保存する（変更分のみ）"""
+    _persist_collection('scripts')
+
+
+def clear_scripts_storage():
+    """台本履歴をクリア"""
+    _clear_collection('scripts')
+
+
+# =============================================================================
+# Transcription Storage
+# =============================================================================
+
 def save_transcriptions_to_storage():
-    """LocalStorageに文字起こしデータを保存する"""
-    if 'transcriptions' in st.session_state and st.session_state.transcriptions:
-        transcriptions_json = json.dumps(st.session_state.transcriptions, ensure_ascii=False)
-        escaped_json = transcriptions_json.replace('\\', '\\\\').replace("'", "\\'")
-        streamlit_js_eval(
-            js_expressions=f"localStorage.setItem('{TRANSCRIPTION_STORAGE_KEY}', '{escaped_json}')",
-            key=f"save_transcriptions_{len(st.session_state.transcriptions)}_{datetime.now().strftime('%H%M%S')}"
-        )
+    """文字起こしデータを保存する（変更分のみ）"""
+    _persist_collection('transcriptions')
 
 
 def clear_transcriptions_storage():
     """文字起こしデータをクリア"""
-    streamlit_js_eval(
-        js_expressions=f"localStorage.removeItem('{TRANSCRIPTION_STORAGE_KEY}')",
-        key=f"clear_transcriptions_{datetime.now().strftime('%H%M%S')}"
-    )
+    _clear_collection('transcriptions')
 
 
 # =============================================================================
 # Settings Storage
 # =============================================================================
 
-def load_settings_from_storage():
-    """LocalStorageから設定を読み込む（初回のみ）"""
-    if st.session_state.get('settings_loaded', False):
-        return
-    
-    stored_data = streamlit_js_eval(
-        js_expressions=f"localStorage.getItem('{SETTINGS_STORAGE_KEY}')",
-        key="load_settings_fixed"
-    )
-    
-    if stored_data is None:
+def save_settings_to_storage():
+    """設定を保存する（変更があった場合のみ）"""
+    _save_settings()
+
+
+def _save_settings(attempt=1):
+    if 'user_settings' not in st.session_state:
         return
     
-    if stored_data == "null" or stored_data == "":
-        st.session_state.user_settings = get_default_settings()
-        st.session_state.settings_loaded = True
+    settings_hash = _content_hash(st.session_state.user_settings)
+    if settings_hash == st.session_state.get('persisted_settings_hash'):
         return
     
-    try:
-        loaded_settings = json.loads(stored_data)
-        if isinstance(loaded_settings, dict):
-            st.session_state.user_settings = loaded_settings
-    except (json.JSONDecodeError, TypeError):
-        st.session_state.user_settings = get_default_settings()
-    
-    st.session_state.settings_loaded = True
-
-
-def save_settings_to_storage():
-    """LocalStorageに設定を保存する"""
-    if 'user_settings' in st.session_state:
-        settings_json = json.dumps(st.session_state.user_settings, ensure_ascii=False)
-        escaped_json = settings_json.replace('\\', '\\\\').replace("'", "\\'")
-        streamlit_js_eval(
-            js_expressions=f"localStorage.setItem('{SETTINGS_STORAGE_KEY}', '{escaped_json}')",
-            key=f"save_settings_{datetime.now().strftime('%H%M%S%f')}"
-        )
+    write_id = get_backend().save_settings(st.session_state.user_settings)
+    _track_write(write_id, None, attempt)
+    st.session_state.persisted_settings_hash = settings_hash
 
 
 # =============================================================================
@@ -228,6 +716,7 @@ def add_to_history(titles, description, transcript, filename):
         first_title = filename[:20] + "..."
     
     history_item = {
+        'id': str(uuid.uuid4()),
         'datetime': datetime.now().strftime('%Y/%m/%d %H:%M'),
         'display_title': first_title[:30],
         'titles': titles,
@@ -236,12 +725,27 @@ def add_to_history(titles, description, transcript, filename):
         'filename': filename
     }
     
-    st.session_state.history.insert(0, history_item)
-    
-    if len(st.session_state.history) > 20:
-        st.session_state.history = st.session_state.history[:20]
+    add_record('history', history_item)
+
+
+def register_transcription(titles, transcript, filename):
+    """文字起こしデータに自動登録する（タイトル案の1番目をタイトルにする）"""
+    first_title = ""
+    for line in titles.split('\n'):
+        if line.strip().startswith('1.'):
+            first_title = line.strip()[2:].strip()
+            break
+    if not first_title:
+        first_title = filename[:30]
     
-    save_history_to_storage()
+    trans_item = {
+        'id': str(uuid.uuid4()),
+        'title': first_title,
+        'date': datetime.now().strftime('%Y/%m/%d'),
+        'content': transcript,
+        'tags': []
+    }
+    add_record('transcriptions', trans_item)
 
 
 def init_session_state():
@@ -255,13 +759,77 @@ def init_session_state():
     if 'transcriptions' not in st.session_state:
         st.session_state.transcriptions = []
     
-    if 'viewing_history_index' not in st.session_state:
-        st.session_state.viewing_history_index = None
+    if 'viewing_history_id' not in st.session_state:
+        st.session_state.viewing_history_id = None
+    
+    # 保存済みレコードの内容ハッシュと並び順（差分書き込み用）
+    if 'persisted_hashes' not in st.session_state:
+        st.session_state.persisted_hashes = {}
+    
+    if 'persisted_order' not in st.session_state:
+        st.session_state.persisted_order = {}
+    
+    # 保存済みのブロブ（内容ハッシュ）
+    if 'known_blobs' not in st.session_state:
+        st.session_state.known_blobs = set()
+    
+    # 完了を確認していない書き込み（書き込みID → 内容）と、送り直す内容（コレクション名 → 内容）
+    if 'pending_writes' not in st.session_state:
+        st.session_state.pending_writes = {}
+    
+    if 'unsaved_writes' not in st.session_state:
+        st.session_state.unsaved_writes = {}
+    
+    if 'write_confirm_round' not in st.session_state:
+        st.session_state.write_confirm_round = 0
 
 
 def load_all_data():
-    """全データをLocalStorageから読み込む"""
-    load_history_from_storage()
-    load_settings_from_storage()
-    load_saved_scripts()
-    load_transcriptions()
+    """全コレクションのメタデータと設定を一括で読み込む（LocalStorageの場合もJS往復は1回のみ）"""
+    if all(st.session_state.get(flag, False) for flag in _LOADED_FLAGS):
+        _confirm_writes()
+        return
+    
+    if 'storage_batch_requested' not in st.session_state:
+        st.session_state.storage_batch_requested = True
+        log_perf("storage batch load requested")
+    
+    data = get_backend().load_all()
+    
+    # None = まだ読み込めていない（ブラウザの応答待ち） → 次のリロードを待つ
+    if data is None:
+        return
+    
+    for name, state_key in COLLECTIONS.items():
+        archive = (data.get('archives') or {}).get(name)
+        if archive is not None:
+            _archive_index()[name] = {**_empty_archive(), **archive}
+        
+        records = data.get(name)
+        if records is None:
+            continue
+        _ensure_ids(records)
+        if name in data['legacy']:
+            # 旧形式（本文込みのレコード）をメタデータと本文に分けて保存し直す
+            metas, bodies, blobs = [], {}, {}
+            for record in records:
+                meta, body, record_blobs = split_record(name, record)
+                metas.append(meta)
+                bodies[meta['id']] = body
+                blobs.update(record_blobs)
+            st.session_state[state_key] = metas
+            _persist_collection(name, bodies=bodies, blobs=blobs, migrate=True)
+        else:
+            st.session_state[state_key] = records
+            _mark_persisted(name, records)
+    
+    st.session_state.known_blobs.update(_referenced_blobs())
+    
+    settings = data.get('settings')
+    st.session_state.user_settings = settings if settings is not None else get_default_settings()
+    if settings is not None:
+        st.session_state.persisted_settings_hash = _content_hash(settings)
+    
+    for flag in _LOADED_FLAGS:
+        st.session_state[flag] = True
+    log_perf(f"storage batch load received (time-to-first-data, backend={get_backend().name})")
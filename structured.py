@@ -0,0 +1,149 @@
+"""
+概要欄・タイトル案の構造化出力（JSONスキーマで応答の形を指定し、型つきの結果に変換する）
+
+generate_text(schema=...) で response_mime_type="application/json" と response_schema を渡し、
+区切りマーカーを含む自由なテキストではなく、スキーマどおりのJSONで受け取る。
+parse_result は足りない・壊れている項目を None にして返し、呼び出し側（pipeline.py）がその部分だけを作り直す。
+"""
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+TITLE_COUNT = 3
+# タイトル案を作り直しても得られなかった場合の表示
+TITLES_ERROR = "1. タイトル生成エラー\n2. もう一度お試しください\n3. -"
+
+_TITLES_PROPERTY = {
+    'type': 'array',
+    'items': {'type': 'string'},
+    'description': f"タイトル案{TITLE_COUNT}つ（各30文字以内）",
+}
+_BODY_PROPERTY = {
+    'type': 'string',
+    'description': "話し言葉を残しつつ読みやすく整形した文字起こしの全文（要約しない）",
+}
+
+# タイトル案だけ
+TITLES_SCHEMA = {
+    'type': 'object',
+    'properties': {'titles': _TITLES_PROPERTY},
+    'required': ['titles'],
+}
+
+# 文字起こしから概要欄の本文とタイトル案
+DESCRIPTION_SCHEMA = {
+    'type': 'object',
+    'properties': {'formatted_transcript': _BODY_PROPERTY, 'titles': _TITLES_PROPERTY},
+    'required': ['formatted_transcript', 'titles'],
+}
+
+# 音声から文字起こし・概要欄の本文・タイトル案（DESCRIPTION_MODE=single_call）
+SINGLE_CALL_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'transcript': {'type': 'string', 'description': "文字起こしの全文"},
+        'formatted_transcript': _BODY_PROPERTY,
+        'titles': _TITLES_PROPERTY,
+    },
+    'required': ['transcript', 'formatted_transcript', 'titles'],
+}
+
+# 文字起こしから短い要約・話題・タイトル案（DESCRIPTION_MODE=summary。文字起こしは出力させない）
+SUMMARY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'summary': {'type': 'string', 'description': "配信内容の要約（3〜5文）"},
+        'topics': {'type': 'array', 'items': {'type': 'string'}, 'description': "話題の見出し（3〜6個）"},
+        'titles': _TITLES_PROPERTY,
+    },
+    'required': ['summary', 'topics', 'titles'],
+}
+
+# タイトル案の先頭の番号（"1. " "1）" など）
+_TITLE_NUMBER = re.compile(r"^\s*(?:\d+\s*[.．)）:：]|[-・*])\s*")
+
+
+@dataclass
+class DescriptionResult:
+    """構造化出力を読み取った結果（応答に無い・形が違う項目は None）
+    
+    body: 概要欄の【AI要約】の本文（整形した文字起こし。summary の場合は要約と話題の箇条書き）
+    titles: タイトル案（TITLE_COUNT 個）
+    """
+    transcript: Optional[str] = None
+    body: Optional[str] = None
+    titles: Optional[List[str]] = None
+    
+    @property
+    def missing(self):
+        """作り直しが必要な項目（'body' / 'titles'）"""
+        return [name for name in ('body', 'titles') if getattr(self, name) is None]
+
+
+def _text(value):
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+
+def _titles(value):
+    """TITLE_COUNT 個以上の空でない文字列なら、番号を除いた先頭 TITLE_COUNT 個"""
+    if not isinstance(value, list):
+        return None
+    titles = [_TITLE_NUMBER.sub("", item).strip() for item in value if isinstance(item, str)]
+    titles = [title for title in titles if title]
+    if len(titles) < TITLE_COUNT:
+        return None
+    return titles[:TITLE_COUNT]
+
+
+def _summary_body(data):
+    """要約と話題の箇条書きを【AI要約】の本文にする（要約が無い場合は None）"""
+    summary = _text(data.get('summary'))
+    if summary is None:
+        return None
+    topics = data.get('topics')
+    topics = [_text(topic) for topic in topics] if isinstance(topics, list) else []
+    bullets = "\n".join(f"・{_TITLE_NUMBER.sub('', topic)}" for topic in topics if topic)
+    return f"{summary}\n\n{bullets}" if bullets else summary
+
+
+def parse_result(text):
+    """JSONの応答を DescriptionResult にする（JSONとして読めない場合はすべて None）"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return DescriptionResult()
+    if not isinstance(data, dict):
+        return DescriptionResult()
+    body = _text(data.get('formatted_transcript'))
+    if body is None and 'summary' in data:
+        body = _summary_body(data)
+    return DescriptionResult(
+        transcript=_text(data.get('transcript')),
+        body=body,
+        titles=_titles(data.get('titles')),
+    )
+
+
+def format_titles(titles):
+    """タイトル案を保存・表示用の番号つきテキストにする（履歴の titles と同じ形）"""
+    if titles is None:
+        return TITLES_ERROR
+    return "\n".join(f"{i}. {title}" for i, title in enumerate(titles, start=1))
+
+
+def preview_field(text, key):
+    """生成途中のJSONから key の文字列の値を途中まで取り出す（ストリーミング中の表示用）"""
+    match = re.search(rf'"{key}"\s*:\s*"((?:[^"\\]|\\.)*)', text)
+    if match is None:
+        return ""
+    value = match.group(1)
+    # 末尾がエスケープの途中で切れている場合は除く
+    value = re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", value)
+    try:
+        return json.loads(f'"{value}"')
+    except ValueError:
+        return value.replace("\\n", "\n")
@@ -0,0 +1,7 @@
+"""
+pytest の共通設定（リポジトリのルートのモジュールを import できるようにする）
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,271 @@
+"""
+保存まわりの純粋な処理のテスト
+    
+    codec          … 両方の形式（'U' / 'B'）の往復と、少しずつ変換する PayloadEncoder
+    split_record   … メタデータ・本文・ブロブへの分割
+    SQLiteBackend  … 名前空間ごとの行と、トランザクション内での並び順の振り直し（_assign_positions）
+    ブロブのGC     … 参照されているブロブを残す
+    書き込みの確認 … 完了を確認できない書き込みの送り直しと、_WRITE_ATTEMPTS 回で諦めるまで
+Streamlit の session_state とバックエンドはスタブに差し替える（ブラウザ・LocalStorage は使わない）。
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import storage
+from backends.sqlite import SQLiteBackend, DEFAULT_NAMESPACE
+from codec import CODEC_BASE64, CODEC_UTF16, MIN_COMPRESS_LENGTH, PayloadEncoder, decode_payload, encode_payload
+
+
+# 日本語中心の、圧縮が効く長さのJSON
+LONG_JSON = json.dumps(
+    [{'id': str(i), 'title': f"第{i}回の配信", 'content': "今日は副業の話をします。" * 20} for i in range(30)],
+    ensure_ascii=False
+)
+
+
+class _SessionState(dict):
+    """st.session_state の代わり（属性でもキーでも読み書きできる）"""
+    
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+    
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+class _StubBackend:
+    """書き込みを記録し、confirm_writes は confirm(write_id) の結果を返すバックエンド
+    
+    confirm(write_id): True = 完了 / False = 失敗 / None = 実行中（ブラウザの 'P'）
+    """
+    
+    name = "stub"
+    
+    def __init__(self, confirm):
+        self.confirm = confirm
+        self.writes = []
+        self.deleted_blobs = []
+    
+    def write_records(self, collection, changed, bodies, deleted_ids, metas, blobs=None, migrate=False,
+                      archive=None):
+        self.writes.append({'collection': collection, 'bodies': dict(bodies), 'blobs': dict(blobs or {})})
+        return f"w{len(self.writes)}"
+    
+    def save_settings(self, settings):
+        self.writes.append({'collection': None, 'settings': settings})
+        return f"w{len(self.writes)}"
+    
+    def confirm_writes(self, write_ids, version):
+        return {write_id: self.confirm(write_id) for write_id in write_ids}
+    
+    def delete_blobs(self, blob_hashes):
+        self.deleted_blobs.extend(blob_hashes)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """storage の st を session_state・toast だけのスタブにし、セッション状態を初期化する"""
+    toasts = []
+    fake_st = SimpleNamespace(session_state=_SessionState(), toast=toasts.append)
+    monkeypatch.setattr(storage, 'st', fake_st)
+    storage.init_session_state()
+    fake_st.toasts = toasts
+    return fake_st
+
+
+def _use_backend(monkeypatch, backend):
+    monkeypatch.setattr(storage, 'get_backend', lambda: backend)
+    return backend
+
+
+def _history_record(record_id, transcript="文字起こしの本文"):
+    return {
+        'id': record_id,
+        'display_title': f"配信{record_id}",
+        'datetime': "2024/01/01 10:00",
+        'titles': "1. タイトル",
+        'description': "概要欄",
+        'transcript': transcript,
+    }
+
+
+# =============================================================================
+# Codec
+# =============================================================================
+
+@pytest.mark.parametrize("codec", [CODEC_UTF16, CODEC_BASE64])
+def test_payload_round_trip(codec):
+    encoded = encode_payload(LONG_JSON, codec)
+    assert encoded[0] == codec
+    assert len(encoded) < len(LONG_JSON)
+    assert decode_payload(encoded) == LONG_JSON
+
+
+def test_small_payload_stays_raw_json():
+    text = json.dumps({'id': "1"})
+    assert len(text) < MIN_COMPRESS_LENGTH
+    assert encode_payload(text) == text
+    assert decode_payload(text) == text
+
+
+@pytest.mark.parametrize("codec", [CODEC_UTF16, CODEC_BASE64])
+def test_payload_encoder_matches_encode_payload(codec):
+    encoder = PayloadEncoder(codec)
+    # 15バイト・3バイトの区切りにそろわない長さで少しずつ渡す
+    parts = [encoder.feed(LONG_JSON[i:i + 97]) for i in range(0, len(LONG_JSON), 97)]
+    parts.append(encoder.finish())
+    stored = encoder.header + "".join(parts)
+    
+    assert stored == encode_payload(LONG_JSON, codec)
+    assert decode_payload(stored) == LONG_JSON
+
+
+# =============================================================================
+# split_record
+# =============================================================================
+
+def test_split_record_moves_transcript_to_blob():
+    record = _history_record("a", transcript="同じ文字起こし")
+    meta, body, blobs = storage.split_record('history', record)
+    
+    blob_hash = storage._blob_hash("同じ文字起こし")
+    assert meta['blob_refs'] == {'transcript': blob_hash}
+    assert blobs == {blob_hash: "同じ文字起こし"}
+    assert body == {'titles': "1. タイトル", 'description': "概要欄"}
+    assert not set(storage.BODY_FIELDS['history']) & set(meta)
+    assert meta['size'] == len("同じ文字起こし")
+    assert meta['body_hash'] == storage._content_hash(body)
+
+
+def test_split_record_shares_blob_between_collections():
+    _, _, history_blobs = storage.split_record('history', _history_record("a", transcript="共通"))
+    _, _, transcription_blobs = storage.split_record('transcriptions', {'id': "b", 'content': "共通"})
+    assert history_blobs == transcription_blobs
+
+
+# =============================================================================
+# SQLiteBackend
+# =============================================================================
+
+def _ids(backend, collection='history'):
+    return [m['id'] for m in backend.load_all()[collection]]
+
+
+def test_sqlite_positions_follow_session_order_then_other_sessions(tmp_path):
+    shared = SQLiteBackend(str(tmp_path / "test.db"))
+    first = shared.with_namespace("w1")
+    second = shared.with_namespace("w1")
+    
+    metas = [{'id': "x"}, {'id': "y"}]
+    first.write_records('history', metas, {"x": {'titles': "t"}}, [], metas)
+    # 別のセッションは自分のレコードしか知らない → 自分の並び順を先頭にし、知らない行は後ろに続ける
+    second.write_records('history', [{'id': "z"}], {}, [], [{'id': "z"}])
+    assert _ids(first) == ["z", "x", "y"]
+    
+    first.write_records('history', [], {}, ["y"], [{'id': "x"}, {'id': "z"}])
+    assert _ids(first) == ["x", "z"]
+
+
+def test_sqlite_namespaces_are_separate(tmp_path):
+    shared = SQLiteBackend(str(tmp_path / "test.db"))
+    mine = shared.with_namespace("w1")
+    mine.write_records('history', [{'id': "x"}], {"x": {'titles': "t"}}, [], [{'id': "x"}])
+    mine.save_settings({'broadcaster_name': "A"})
+    
+    other = shared.with_namespace("w2")
+    assert _ids(other) == []
+    assert other.load_bodies('history', ["x"], "v") == {}
+    assert other.load_all()['settings'] is None
+    assert _ids(shared.with_namespace(DEFAULT_NAMESPACE)) == []
+    assert mine.load_all()['settings'] == {'broadcaster_name': "A"}
+
+
+# =============================================================================
+# Blob GC
+# =============================================================================
+
+def test_garbage_collection_keeps_referenced_blobs(session, monkeypatch):
+    backend = _use_backend(monkeypatch, _StubBackend(lambda write_id: True))
+    kept, _, _ = storage.split_record('history', _history_record("a", transcript="残る"))
+    archived, _, _ = storage.split_record('history', _history_record("b", transcript="アーカイブ"))
+    session.session_state.history = [kept]
+    storage._archive('history')['blobs'] = list(archived['blob_refs'].values())
+    
+    referenced = set(kept['blob_refs'].values()) | set(archived['blob_refs'].values())
+    session.session_state.known_blobs = referenced | {"orphan"}
+    storage._collect_garbage_blobs()
+    
+    assert backend.deleted_blobs == ["orphan"]
+    assert session.session_state.known_blobs == referenced
+
+
+# =============================================================================
+# Write Confirmation
+# =============================================================================
+
+def test_confirmed_write_is_dropped(session, monkeypatch):
+    backend = _use_backend(monkeypatch, _StubBackend(lambda write_id: True))
+    storage.add_record('history', _history_record("a"))
+    assert list(session.session_state.pending_writes) == ["w1"]
+    
+    storage._confirm_writes()
+    assert session.session_state.pending_writes == {}
+    assert len(backend.writes) == 1
+    assert session.toasts == []
+
+
+def test_failed_write_is_resent_then_given_up(session, monkeypatch):
+    backend = _use_backend(monkeypatch, _StubBackend(lambda write_id: False))
+    storage.add_record('history', _history_record("a", transcript="本文"))
+    blob_hash = storage._blob_hash("本文")
+    
+    # 1回の確認で2回分（確認 → 送り直し → 確認）進む
+    storage._confirm_writes()
+    assert len(backend.writes) == storage._WRITE_ATTEMPTS
+    # 送り直しにも本文・ブロブを含める
+    assert all("a" in write['bodies'] and blob_hash in write['blobs'] for write in backend.writes)
+    
+    storage._confirm_writes()
+    assert len(backend.writes) == storage._WRITE_ATTEMPTS
+    assert session.session_state.pending_writes == {}
+    assert len(session.toasts) == 1
+    assert "a" in session.session_state.unsaved_writes['history']['bodies']
+    assert blob_hash not in session.session_state.known_blobs
+    
+    # 諦めた内容は次の保存で一緒に書き込む
+    storage.save_history_to_storage()
+    assert len(backend.writes) == storage._WRITE_ATTEMPTS + 1
+    assert "a" in backend.writes[-1]['bodies']
+    assert blob_hash in backend.writes[-1]['blobs']
+    assert 'history' not in session.session_state.unsaved_writes
+
+
+def test_write_still_running_is_resent_after_confirm_rounds(session, monkeypatch):
+    backend = _use_backend(monkeypatch, _StubBackend(lambda write_id: None if write_id == "w1" else True))
+    storage.add_record('history', _history_record("a"))
+    
+    rounds = 0
+    while len(backend.writes) == 1:
+        storage._confirm_writes()
+        rounds += 2
+        assert rounds <= storage._CONFIRM_ROUNDS + 1
+    assert "a" in backend.writes[1]['bodies']
+    
+    storage._confirm_writes()
+    assert session.session_state.pending_writes == {}
+    assert session.toasts == []
+
+
+def test_failed_settings_write_is_resent(session, monkeypatch):
+    backend = _use_backend(monkeypatch, _StubBackend(lambda write_id: write_id != "w1"))
+    session.session_state.user_settings = {'broadcaster_name': "A"}
+    storage.save_settings_to_storage()
+    
+    storage._confirm_writes()
+    assert [write.get('settings') for write in backend.writes] == [{'broadcaster_name': "A"}] * 2
+    assert session.session_state.pending_writes == {}
@@ -0,0 +1,221 @@
+"""
+音声の文字起こし
+
+短い音声は1回の generate_content で文字起こしする（ストリーミング表示）。
+LONG_AUDIO_THRESHOLD_SECONDS 以上の音声は重なりのある区間に分け、スレッドプールで並列に
+文字起こししてから、重なり部分の重複を除いてつなぎ合わせる（出力トークン上限による途切れを防ぐ）。
+AUDIO_PREPROCESS が有効な場合は、アップロード前にモノラル・16kHzへ変換する（preprocess.py 参照）。
+model / upload_file は引数で受け取るため、スタブのモデルでも動作する（benchmarks/ 参照）。
+"""
+import difflib
+import tempfile
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from audio import probe_duration, can_split, plan_segments, split_audio, is_wav
+from config import (
+    log_perf,
+    AUDIO_PREPROCESS,
+    LONG_AUDIO_THRESHOLD_SECONDS,
+    AUDIO_SEGMENT_SECONDS,
+    AUDIO_SEGMENT_OVERLAP_SECONDS,
+    TRANSCRIBE_CONCURRENCY
+)
+from gemini import generate_text, AUDIO_TOKENS_PER_SECOND
+from rate_limiter import PRIORITY_INTERACTIVE
+from prompts import get_transcription_prompt, get_segment_transcription_prompt
+
+
+# 重なり部分を探す範囲（前の区間の末尾・次の区間の先頭の文字数）
+_STITCH_WINDOW = 600
+# これより短い一致は偶然とみなし、重なりとして扱わない
+_STITCH_MIN_MATCH = 8
+
+
+# =============================================================================
+# Stitching
+# =============================================================================
+
+def _merge_pair(left, right):
+    """前の区間の末尾と次の区間の先頭で最も長く一致する部分を重なりとして、1つにつなぐ"""
+    tail = left[-_STITCH_WINDOW:]
+    head = right[:_STITCH_WINDOW]
+    matcher = difflib.SequenceMatcher(None, tail, head, autojunk=False)
+    match = matcher.find_longest_match(0, len(tail), 0, len(head))
+    if match.size < _STITCH_MIN_MATCH:
+        return left.rstrip() + "\n\n" + right.lstrip()
+    
+    cut = len(left) - len(tail) + match.a + match.size
+    return left[:cut] + right[match.b + match.size:]
+
+
+def stitch_transcripts(texts):
+    """区間ごとの文字起こしを、重なり部分の重複を除いてつなぐ"""
+    texts = [t for t in texts if t]
+    if not texts:
+        return ""
+    result = texts[0]
+    for text in texts[1:]:
+        result = _merge_pair(result, text)
+    return result
+
+
+# =============================================================================
+# Transcription
+# =============================================================================
+
+def _audio_tokens(seconds, outputs=1):
+    """音声の文字起こし1回分のトークン数の見積もり（入力の音声 + 同じくらいの長さの出力 × outputs）"""
+    return int(seconds * AUDIO_TOKENS_PER_SECOND * (1 + outputs))
+
+
+def _transcribe_segment(model, upload_file, path, mime_type, prompt, seconds, priority):
+    """1区間を文字起こしする（ワーカースレッドで実行。Streamlitの関数は呼ばない）"""
+    started = time.perf_counter()
+    remote_file = upload_file(path, mime_type=mime_type)
+    text = generate_text(
+        model,
+        [remote_file, prompt],
+        label="transcribe segment",
+        stream=False,
+        priority=priority,
+        tokens=_audio_tokens(seconds)
+    )
+    return text, time.perf_counter() - started
+
+
+def transcribe_segments(model, upload_file, path, mime_type, duration,
+                        segment_seconds=AUDIO_SEGMENT_SECONDS,
+                        overlap_seconds=AUDIO_SEGMENT_OVERLAP_SECONDS,
+                        max_workers=TRANSCRIBE_CONCURRENCY,
+                        on_progress=None,
+                        priority=PRIORITY_INTERACTIVE):
+    """音声を区間に分けて並列に文字起こしし、つないだ全文を返す
+    
+    on_progress(done, total, partial): 区間が終わるたびに呼び出し元のスレッドで呼ぶ
+                                       partial は先頭から途切れずに揃った区間をつないだテキスト
+    """
+    segments = plan_segments(duration, segment_seconds, overlap_seconds)
+    segment_mime = "audio/wav" if is_wav(path) else mime_type
+    texts = [None] * len(segments)
+    started = time.perf_counter()
+    
+    with tempfile.TemporaryDirectory() as out_dir:
+        paths = split_audio(path, segments, out_dir)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _transcribe_segment, model, upload_file, segment_path, segment_mime,
+                    get_segment_transcription_prompt(i, len(paths)),
+                    segments[i][1] - segments[i][0], priority
+                ): i
+                for i, segment_path in enumerate(paths)
+            }
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    i = futures[future]
+                    texts[i], elapsed = future.result()
+                    log_perf(f"transcribe segment {i + 1}/{len(paths)}: {elapsed * 1000:.0f}ms")
+                    if on_progress is not None:
+                        ready = []
+                        for text in texts:
+                            if text is None:
+                                break
+                            ready.append(text)
+                        on_progress(done, len(paths), stitch_transcripts(ready))
+            except Exception:
+                # 1区間でも失敗したら、まだ始まっていない区間は実行しない
+                for future in futures:
+                    future.cancel()
+                raise
+    
+    transcript = stitch_transcripts(texts)
+    log_perf(
+        f"transcribe long audio: {duration:.0f}s in {len(segments)} segments "
+        f"(concurrency {max_workers}), total {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+    return transcript
+
+
+def _transcribe(model, upload_file, path, mime_type, placeholder, priority, on_text):
+    duration = probe_duration(path) if can_split(path) else None
+    if duration is not None and duration >= LONG_AUDIO_THRESHOLD_SECONDS:
+        def show_progress(done, total, partial):
+            if placeholder is not None:
+                placeholder.markdown(f"*{done}/{total} 区間完了*\n\n{partial}")
+            if on_text is not None:
+                on_text(partial)
+        
+        return transcribe_segments(
+            model, upload_file, path, mime_type, duration,
+            on_progress=show_progress,
+            priority=priority
+        )
+    
+    remote_file = upload_file(path, mime_type=mime_type)
+    # 届いた部分から表示する（最終的な全文は戻り値にまとまる）
+    return generate_text(
+        model,
+        [remote_file, get_transcription_prompt()],
+        placeholder=placeholder,
+        label="transcription",
+        priority=priority,
+        tokens=_audio_tokens(duration) if duration is not None else None,
+        on_text=on_text
+    )
+
+
+@contextmanager
+def _prepared_upload(upload_file, path, mime_type, on_preprocessed):
+    """AUDIO_PREPROCESS が有効なら前処理した音声の (path, mime_type, upload_file) を渡し、抜ける時に削減量を報告する"""
+    if not AUDIO_PREPROCESS:
+        yield path, mime_type, upload_file
+        return
+    
+    # NumPy の読み込みは重いため、最初に文字起こしする時まで遅らせる
+    from preprocess import prepared_audio, UploadMeter, savings_report
+    
+    with prepared_audio(path, mime_type) as prepared:
+        meter = UploadMeter(upload_file)
+        yield prepared['path'], prepared['mime_type'], meter.upload
+    report = savings_report(prepared, meter)
+    if on_preprocessed is not None:
+        on_preprocessed(report)
+
+
+def transcribe_audio(model, upload_file, path, mime_type, placeholder=None, on_preprocessed=None,
+                     priority=PRIORITY_INTERACTIVE, on_text=None):
+    """音声を文字起こしして全文を返す（長時間音声は区間ごとに並列処理）
+    
+    placeholder: 途中経過を表示する st.empty()
+    on_preprocessed(report): 前処理（AUDIO_PREPROCESS）を行った場合に、削減したサイズと
+                             アップロード時間を渡して呼ぶ（preprocess.savings_report 参照）
+    priority: Gemini呼び出しの流量制御での優先度（rate_limiter 参照）
+    on_text(text): 文字起こしの途中経過（先頭から揃った部分）を渡して呼ぶ（pipeline.py 参照）
+    """
+    with _prepared_upload(upload_file, path, mime_type, on_preprocessed) as (prepared_path, prepared_mime, upload):
+        return _transcribe(model, upload, prepared_path, prepared_mime, placeholder, priority, on_text)
+
+
+def transcribe_with_prompt(model, upload_file, path, mime_type, prompt, placeholder=None, preview=None,
+                           on_preprocessed=None, priority=PRIORITY_INTERACTIVE, outputs=2, schema=None):
+    """音声を区間に分けず、1回の呼び出しで prompt の指示どおりに生成した応答を返す
+    
+    文字起こしと概要欄・タイトル案をまとめて生成する場合（pipeline.py の single_call）に使う。
+    outputs: 出力の長さの見積もり（文字起こし何回分か。流量制御のトークン数に使う）
+    schema: 応答のJSONスキーマ（generate_text 参照）
+    """
+    with _prepared_upload(upload_file, path, mime_type, on_preprocessed) as (prepared_path, prepared_mime, upload):
+        duration = probe_duration(prepared_path) if can_split(prepared_path) else None
+        remote_file = upload(prepared_path, mime_type=prepared_mime)
+        return generate_text(
+            model,
+            [remote_file, prompt],
+            placeholder=placeholder,
+            label="single call",
+            preview=preview,
+            priority=priority,
+            tokens=_audio_tokens(duration, outputs) if duration is not None else None,
+            schema=schema
+        )
@@ -0,0 +1,182 @@
+"""
+文字起こしのディスクキャッシュ（プロセス内の全セッションで共有）
+
+キーは「アップロードされた音声のSHA-256（チャンクごとに読み込んで計算）」+「文字起こしの作り方」+
+「そのプロンプトのバージョン」+「前処理・区間分割の設定のハッシュ」。
+文字起こしの作り方は、通常の文字起こし（transcribe）と、概要欄と同時に作る1回の呼び出し（single_call）で
+プロンプトが違うため分ける。前処理（無音の短縮など）の設定を変えた場合も、別の文字起こしとして扱う。
+同じ音声を再度アップロードした場合は、アップロードと文字起こしの呼び出しを省略できる。
+エントリは1件1ファイルで保存し、最終アクセス時刻（mtime）で古いものから削除する（LRU）。
+    TRANSCRIPT_CACHE_MAX_BYTES   … 合計サイズの上限
+    TRANSCRIPT_CACHE_MAX_AGE_DAYS … 最後に使われてからの保持期間
+同じ仕組みで、map-reduce の区間の要約（map_reduce.py）も別のディレクトリ（SECTION_CACHE_DIR）に保存する。
+"""
+import streamlit as st
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from config import (
+    log_perf,
+    AUDIO_PREPROCESS,
+    PREPROCESS_SAMPLE_RATE,
+    PREPROCESS_BITRATE,
+    SILENCE_TRIM,
+    SILENCE_THRESHOLD_DB,
+    SILENCE_MIN_SECONDS,
+    SILENCE_KEEP_SECONDS,
+    SILENCE_FRAME_SECONDS,
+    LONG_AUDIO_THRESHOLD_SECONDS,
+    AUDIO_SEGMENT_SECONDS,
+    AUDIO_SEGMENT_OVERLAP_SECONDS,
+    TRANSCRIPT_CACHE_DIR,
+    TRANSCRIPT_CACHE_MAX_BYTES,
+    TRANSCRIPT_CACHE_MAX_AGE_DAYS,
+    SECTION_CACHE_DIR,
+    SECTION_CACHE_MAX_BYTES
+)
+from prompts import get_transcription_prompt_version, get_single_call_prompt_version
+
+
+# 音声のハッシュを計算する時に1回で読み込むサイズ
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_SUFFIX = ".txt"
+
+
+def _settings_version():
+    """文字起こしに使う音声を変える設定（前処理・無音の短縮・区間分割）のハッシュ"""
+    settings = (
+        AUDIO_PREPROCESS, PREPROCESS_SAMPLE_RATE, PREPROCESS_BITRATE,
+        SILENCE_TRIM, SILENCE_THRESHOLD_DB, SILENCE_MIN_SECONDS, SILENCE_KEEP_SECONDS, SILENCE_FRAME_SECONDS,
+        LONG_AUDIO_THRESHOLD_SECONDS, AUDIO_SEGMENT_SECONDS, AUDIO_SEGMENT_OVERLAP_SECONDS,
+    )
+    return hashlib.sha1(repr(settings).encode('utf-8')).hexdigest()[:8]
+
+
+def audio_cache_key(digest, source="transcribe"):
+    """音声のハッシュ（audio_digest）と文字起こしの作り方からキャッシュキーを作る
+    
+    source: "transcribe"（通常の文字起こし）/ "single_call"（概要欄と同時に作る1回の呼び出し）
+    """
+    if source == "single_call":
+        prompt_version = get_single_call_prompt_version()
+    else:
+        prompt_version = get_transcription_prompt_version()
+    return f"{digest}-{source}-{prompt_version}-{_settings_version()}"
+
+
+def audio_digest(fileobj):
+    """音声ファイル（file-like）の内容の SHA-256
+    
+    ファイル全体をメモリに載せないよう、チャンクごとにハッシュを更新する。読み込み後は先頭に戻す。
+    """
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(_HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """文字起こしテキストをディレクトリに保存するLRUキャッシュ（name はログの表示名）"""
+    
+    def __init__(self, directory, max_bytes, max_age_seconds, name="transcript"):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+    
+    def get(self, key):
+        """キャッシュされた文字起こしを返す（無い・期限切れの場合は None）"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                    os.remove(path)
+                    self.evictions += 1
+                    raise FileNotFoundError(path)
+                with open(path, encoding="utf-8") as f:
+                    text = f.read()
+                # 最終アクセス時刻を更新する（LRUの順序）
+                os.utime(path)
+                self.hits += 1
+            except FileNotFoundError:
+                self.misses += 1
+                text = None
+        log_perf(f"{self.name} cache {'hit' if text is not None else 'miss'} ({self.hits} hits / {self.misses} misses)")
+        return text
+    
+    def put(self, key, text):
+        """文字起こしを保存し、上限を超えた分を古いものから削除する"""
+        with self._lock:
+            # 書きかけのファイルを読まれないよう、一時ファイルに書いてから置き換える
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+    
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes and now - mtime <= self.max_age_seconds:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+    
+    def stats(self):
+        """ヒット・ミス・削除の回数"""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+@st.cache_resource
+def get_transcript_cache():
+    """文字起こしキャッシュ（プロセス内で共有）"""
+    return TranscriptCache(
+        TRANSCRIPT_CACHE_DIR,
+        TRANSCRIPT_CACHE_MAX_BYTES,
+        TRANSCRIPT_CACHE_MAX_AGE_DAYS * 24 * 60 * 60
+    )
+
+
+@st.cache_resource
+def get_section_cache():
+    """map-reduce の区間の要約のキャッシュ（プロセス内で共有）"""
+    return TranscriptCache(
+        SECTION_CACHE_DIR,
+        SECTION_CACHE_MAX_BYTES,
+        TRANSCRIPT_CACHE_MAX_AGE_DAYS * 24 * 60 * 60,
+        name="section"
+    )
@@ -0,0 +1,60 @@
+"""
+文字起こしの整形（Gemini を呼ばずに Python で行う）
+
+DESCRIPTION_MODE=summary では、概要欄に載せる文字起こしをモデルに出力させず、ここで整形して差し込む。
+    - フィラー（「えー」「あのー」「うーん」など）を除く
+    - 読点・空白の重なりをまとめる
+    - 長い段落を文の切れ目で FORMAT_PARAGRAPH_CHARS 字ほどの段落に分ける
+"""
+import re
+
+from config import FORMAT_PARAGRAPH_CHARS
+
+
+# 文頭・句読点・空白の直後にあるフィラー（後ろの読点・空白も含めて除く）
+_FILLERS = re.compile(
+    r"(?:^|(?<=[。、！？!?\s「『]))"
+    r"(?:えー+と?|えっと|えと|あー+|あの+ー+|そのー+|うー+ん|んー+|まあ+ー+)"
+    r"[、,，\s]*",
+    re.MULTILINE
+)
+_REPEATED_COMMAS = re.compile(r"[、,，]{2,}")
+_SPACES = re.compile(r"[ \t　]+")
+_SENTENCE = re.compile(r"[^。！？!?\n]+(?:[。！？!?]+[」』）)]*|$)")
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def remove_fillers(text):
+    """フィラーを除き、読点・空白の重なりをまとめる"""
+    text = _FILLERS.sub("", text)
+    text = _REPEATED_COMMAS.sub("、", text)
+    text = _SPACES.sub(" ", text)
+    return "\n".join(line.strip() for line in text.split("\n"))
+
+
+def split_sentences(text):
+    """文の区切り（。！？）で分ける（区切りの文字は前の文に含める）"""
+    return [sentence.strip() for sentence in _SENTENCE.findall(text) if sentence.strip()]
+
+
+def _paragraphs(text, max_chars):
+    """1つの段落を、文の切れ目で max_chars 字ほどの段落に分ける"""
+    paragraphs = []
+    current = ""
+    for sentence in split_sentences(text.replace("\n", "")):
+        if current and len(current) + len(sentence) > max_chars:
+            paragraphs.append(current)
+            current = ""
+        current += sentence
+    if current:
+        paragraphs.append(current)
+    return paragraphs
+
+
+def format_transcript(text, max_chars=FORMAT_PARAGRAPH_CHARS):
+    """文字起こしを概要欄に載せる形に整形する（元の段落は保ち、長い段落だけを分ける）"""
+    paragraphs = []
+    for block in _PARAGRAPH_BREAK.split(remove_fillers(text)):
+        if block.strip():
+            paragraphs.extend(_paragraphs(block, max_chars))
+    return "\n\n".join(paragraphs)
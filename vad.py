@@ -0,0 +1,149 @@
+"""
+無音区間の検出・カット（エネルギーによる音声区間検出）
+
+短いフレーム（SILENCE_FRAME_SECONDS）ごとの音量（dBFS）を NumPy でまとめて計算し、
+SILENCE_THRESHOLD_DB 未満が SILENCE_MIN_SECONDS 以上続く区間を SILENCE_KEEP_SECONDS まで縮める。
+カット後の時刻から元の音声の時刻へ戻せるよう、残した区間の対応表（segment_map）を返す。
+16bit PCM の WAV（preprocess.py の出力）を前提とする。
+"""
+import bisect
+import wave
+
+import numpy as np
+
+from config import (
+    SILENCE_THRESHOLD_DB,
+    SILENCE_MIN_SECONDS,
+    SILENCE_KEEP_SECONDS,
+    SILENCE_FRAME_SECONDS
+)
+
+
+# 音量の計算で1回に読み込むフレーム数（SILENCE_FRAME_SECONDS 単位）
+_LEVEL_BLOCK_FRAMES = 4096
+# カットした音声を書き出す時に1回で読み書きするサンプル数
+_COPY_CHUNK_SAMPLES = 64 * 1024
+
+
+def frame_levels(path, frame_seconds=SILENCE_FRAME_SECONDS):
+    """フレームごとの音量（dBFS）の配列を返す
+    
+    戻り値: (levels, frame_length, sample_rate, total_samples)
+    """
+    with wave.open(path, 'rb') as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"16bit PCM only (sample width: {w.getsampwidth()})")
+        channels = w.getnchannels()
+        rate = w.getframerate()
+        total = w.getnframes()
+        frame_length = max(int(rate * frame_seconds), 1)
+        
+        levels = []
+        while True:
+            data = w.readframes(frame_length * _LEVEL_BLOCK_FRAMES)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype='<i2').astype(np.float32).reshape(-1, channels).mean(axis=1) / 32768
+            # 最後の半端なフレームは0で埋める（ブロック境界はフレーム境界と揃っている）
+            if len(samples) % frame_length:
+                samples = np.pad(samples, (0, frame_length - len(samples) % frame_length))
+            power = np.mean(samples.reshape(-1, frame_length) ** 2, axis=1)
+            levels.append(10 * np.log10(power + 1e-10))
+    
+    levels = np.concatenate(levels) if levels else np.zeros(0, dtype=np.float32)
+    return levels, frame_length, rate, total
+
+
+def plan_cuts(levels, threshold_db, min_silence_frames, keep_frames):
+    """カットするフレームの区間 [(start, end)] を返す
+    
+    min_silence_frames 以上続く無音は、前後に keep_frames を半分ずつ残して中をカットする。
+    """
+    silent = (levels < threshold_db).astype(np.int8)
+    edges = np.diff(np.concatenate([[0], silent, [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    long_enough = (ends - starts) >= min_silence_frames
+    cut_starts = starts[long_enough] + keep_frames // 2
+    cut_ends = ends[long_enough] - (keep_frames - keep_frames // 2)
+    valid = cut_ends > cut_starts
+    return list(zip(cut_starts[valid].tolist(), cut_ends[valid].tolist()))
+
+
+def _kept_spans(cuts, frame_length, total):
+    """カット区間（フレーム）の残りを、サンプル単位の区間 [(start, end)] にする"""
+    spans = []
+    position = 0
+    for start, end in cuts:
+        spans.append((position, start * frame_length))
+        position = end * frame_length
+    spans.append((position, total))
+    return [(start, min(end, total)) for start, end in spans if min(end, total) > start]
+
+
+def build_segment_map(spans, rate):
+    """残した区間の対応表 [{'start', 'source', 'duration'}]（秒。start はカット後の時刻）"""
+    segment_map = []
+    output = 0
+    for start, end in spans:
+        segment_map.append({
+            'start': output / rate,
+            'source': start / rate,
+            'duration': (end - start) / rate,
+        })
+        output += end - start
+    return segment_map
+
+
+def to_source_time(segment_map, seconds):
+    """カット後の音声の時刻（秒）を、元の音声の時刻に戻す"""
+    if not segment_map:
+        return seconds
+    starts = [segment['start'] for segment in segment_map]
+    segment = segment_map[max(bisect.bisect_right(starts, seconds) - 1, 0)]
+    return segment['source'] + min(max(seconds - segment['start'], 0), segment['duration'])
+
+
+def _write_spans(src_path, dst_path, spans):
+    with wave.open(src_path, 'rb') as src, wave.open(dst_path, 'wb') as dst:
+        dst.setparams(src.getparams())
+        for start, end in spans:
+            src.setpos(start)
+            remaining = end - start
+            while remaining > 0:
+                count = min(remaining, _COPY_CHUNK_SAMPLES)
+                dst.writeframesraw(src.readframes(count))
+                remaining -= count
+
+
+def trim_silence(src_path, dst_path,
+                 threshold_db=SILENCE_THRESHOLD_DB,
+                 min_silence_seconds=SILENCE_MIN_SECONDS,
+                 keep_silence_seconds=SILENCE_KEEP_SECONDS):
+    """長い無音を縮めた音声を dst_path に書き出し、統計と対応表を返す
+    
+    カットする区間が無い場合は書き出さない（戻り値の 'trimmed' が False）。
+    戻り値: {'trimmed', 'original_seconds', 'trimmed_seconds', 'removed_seconds', 'cuts', 'segment_map'}
+    """
+    levels, frame_length, rate, total = frame_levels(src_path)
+    frame_seconds = frame_length / rate
+    cuts = plan_cuts(
+        levels,
+        threshold_db,
+        max(int(round(min_silence_seconds / frame_seconds)), 1),
+        min(int(round(keep_silence_seconds / frame_seconds)), int(round(min_silence_seconds / frame_seconds)))
+    )
+    spans = _kept_spans(cuts, frame_length, total)
+    kept = sum(end - start for start, end in spans)
+    if cuts:
+        _write_spans(src_path, dst_path, spans)
+    
+    return {
+        'trimmed': bool(cuts),
+        'original_seconds': total / rate,
+        'trimmed_seconds': kept / rate,
+        'removed_seconds': (total - kept) / rate,
+        'cuts': len(cuts),
+        'segment_map': build_segment_map(spans, rate),
+    }